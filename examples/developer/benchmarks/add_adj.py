@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Bulk insertion of transitions by Transitions.add_adj.
+
+add_adj stores the transitions given by a sparse matrix with
+LabeledDiGraph.add_edges_from, which type checks each distinct
+label once and writes the adjacency dicts directly.
+This script times it against adding one transition at a time
+with Transitions.add, as add_adj did before, on:
+
+  - discretize: one unlabeled transition system of n states,
+    as built by abstract.discretize
+  - merge: the same states with transitions of m modes,
+    each labeled with its actions, as built by
+    abstract.discretization.merge_abstractions
+
+Each state has about d successors in each mode.
+
+usage: python add_adj.py
+"""
+from __future__ import print_function
+
+import logging
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from tulip import transys as trs
+
+
+def per_edge_add_adj(ts, adj, adj2states, attr_dict=None,
+                     check=True, **attr):
+    """Add transitions one at a time."""
+    adj = adj.tocoo()
+    for i, j in zip(adj.row.tolist(), adj.col.tolist()):
+        ts.transitions.add(adj2states[i], adj2states[j],
+                           attr_dict, check, **attr)
+
+
+def random_adj(n, d, rng):
+    """Return n x n matrix with d nonzeros per row on average."""
+    rows = rng.randint(0, n, n * d)
+    cols = rng.randint(0, n, n * d)
+    adj = sp.coo_matrix((np.ones(n * d), (rows, cols)), shape=(n, n))
+    return adj.tolil()
+
+
+def states(adjs, n):
+    """Return FTS with n states, and the actions of C{adjs}."""
+    ts = trs.FTS()
+    ts.states.add_from(xrange(n))
+    if len(adjs) > 1:
+        ts.env_actions.add_from([str(e) for e, s in adjs])
+        ts.sys_actions.add_from([str(s) for e, s in adjs])
+    return ts
+
+
+def build(add_adj, ts, adjs, n):
+    """Add to C{ts} the transitions from C{adjs}, keyed by mode."""
+    for (e, s), adj in sorted(adjs.iteritems()):
+        if len(adjs) > 1:
+            actions = dict(env_actions=str(e), sys_actions=str(s))
+        else:
+            actions = dict()
+        add_adj(ts, adj, range(n), **actions)
+
+
+def timed(f, *args):
+    start = time.time()
+    r = f(*args)
+    return r, time.time() - start
+
+
+def main():
+    logging.getLogger('tulip').setLevel(logging.ERROR)
+    rng = np.random.RandomState(0)
+    bulk = lambda ts, *args, **kw: ts.transitions.add_adj(*args, **kw)
+    print('{c:>10} {n:>7} {m:>3} {e:>9} {b:>10} {p:>14}'.format(
+        c='case', n='states', m='m', e='edges',
+        b='bulk [s]', p='per edge [s]'))
+    for case, n, m, d in [('discretize', 5000, 1, 20),
+                          ('discretize', 50000, 1, 20),
+                          ('merge', 5000, 4, 10),
+                          ('merge', 20000, 4, 10)]:
+        adjs = dict(
+            ((k, k % 2), random_adj(n, d, rng)) for k in xrange(m))
+        tb = states(adjs, n)
+        r, b = timed(build, bulk, tb, adjs, n)
+        tp = states(adjs, n)
+        r, p = timed(build, per_edge_add_adj, tp, adjs, n)
+        assert(len(tb.transitions) == len(tp.transitions))
+        print('{c:>10} {n:7d} {m:3d} {e:9d} {b:10.2f} {p:14.2f}'.format(
+            c=case, n=n, m=m, e=len(tb.transitions), b=b, p=p))
+
+
+if __name__ == '__main__':
+    main()
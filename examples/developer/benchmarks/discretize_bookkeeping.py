@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Per-split cost of the bookkeeping in abstract.discretize.
+
+Each split of a cell updates adjacency, transitions and the pairs
+that remain to be checked. This script splits cells of square grids
+of increasing size and compares the time per split of:
+
+  - sparse: the neighborhood-local update used by discretize
+  - dense: padding dense matrices and recomputing the k-hop
+    adjacency, as discretize used to do
+
+The polytope adjacency tests are the same for both,
+so for the dense version only the matrix updates are timed.
+
+usage: python discretize_bookkeeping.py [trans_length]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+import numpy as np
+import polytope as pc
+
+from tulip.abstract import discretization as ds
+
+
+def grid(m):
+    """Return m x m unit boxes and their adjacency as list of sets."""
+    sol = []
+    adj = []
+    for x in xrange(m):
+        for y in xrange(m):
+            sol.append(pc.Region([pc.box2poly([[x, x + 1], [y, y + 1]])]))
+            near = set([x * m + y])
+            for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                if 0 <= x + dx < m and 0 <= y + dy < m:
+                    near.add((x + dx) * m + y + dy)
+            adj.append(near)
+    return sol, adj
+
+
+def split(sol, i):
+    """Halve cell i along x, appending the right half."""
+    l, u = sol[i].bounding_box
+    x0, y0, x1, y1 = l[0, 0], l[1, 0], u[0, 0], u[1, 0]
+    xm = (x0 + x1) / 2.0
+    sol[i] = pc.Region([pc.box2poly([[x0, xm], [y0, y1]])])
+    sol.append(pc.Region([pc.box2poly([[xm, x1], [y0, y1]])]))
+    n = len(sol)
+    return xrange(n - 1, n - 2, -1)
+
+
+def sparse_splits(m, cells, trans_length):
+    sol, adj = grid(m)
+    n = len(sol)
+    transitions = [set() for k in xrange(n)]
+    IJ = ds._PairQueue()
+    for k in xrange(n):
+        for r in ds._reachable_within(k, adj, trans_length):
+            IJ.add((k, r))
+    t = 0.0
+    for i in cells:
+        new_idx = split(sol, i)
+        start = time.time()
+        ds._update_split(i, i, new_idx, sol, adj, transitions, IJ,
+                         trans_length, False)
+        t += time.time() - start
+    return t / len(cells)
+
+
+def dense_splits(m, cells, trans_length):
+    n = m * m
+    adj = np.eye(n, dtype=int)
+    transitions = np.zeros([n, n], dtype=int)
+    IJ = ds.reachable_within(trans_length, adj, adj)
+    t = 0.0
+    for i in cells:
+        start = time.time()
+        transitions = np.pad(transitions, (0, 1), 'constant')
+        adj = np.pad(adj, (0, 1), 'constant')
+        adj[-1, -1] = adj[i, -1] = adj[-1, i] = 1
+        IJ = np.pad(IJ, (0, 1), 'constant')
+        adj_k = ds.reachable_within(trans_length, adj, adj)
+        ds.sym_adj_change(IJ, adj_k, transitions, i)
+        ds.sym_adj_change(IJ, adj_k, transitions, adj.shape[0] - 1)
+        t += time.time() - start
+    return t / len(cells)
+
+
+def main():
+    if len(sys.argv) > 1:
+        trans_length = int(sys.argv[1])
+    else:
+        trans_length = 1
+    n_splits = 20
+    # dense matrix powers are cubic, so stop them earlier
+    dense_max = 2000 if trans_length <= 1 else 500
+    print('trans_length = ' + str(trans_length))
+    print('{c:>8} {s:>14} {d:>14}'.format(
+        c='cells', s='sparse [ms]', d='dense [ms]'))
+    for m in [10, 20, 40, 80]:
+        n = m * m
+        cells = np.linspace(0, n - 1, n_splits).astype(int)
+        ts = sparse_splits(m, cells, trans_length)
+        if n <= dense_max:
+            td = '{t:14.3f}'.format(t=1e3 * dense_splits(m, cells,
+                                                         trans_length))
+        else:
+            td = '{t:>14}'.format(t='-')
+        print('{n:8d} {s:14.3f} '.format(n=n, s=1e3 * ts) + td)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Code generated by dumpsmach.python_case versus dumpsmach.python_table.
+
+Both export a Mealy machine as a Python class with a method "move".
+This script compares, for machines with n states
+and k input valuations per state:
+
+  - size of the generated code
+  - time to compile it
+  - time per call of "move"
+
+python_case tests the state and then the guard of each transition
+in an if/elif chain, so "move" is linear in the number of
+states and transitions.
+python_table looks up a dict keyed by state and inputs.
+The if/elif chains nest one level per state and per transition,
+which overflows the stack of the CPython 2.7 compiler
+for a few hundred levels, so python_case is run only
+for the smaller machines.
+
+usage: python dumpsmach_table.py
+"""
+from __future__ import print_function
+
+import itertools
+import random
+import time
+
+import networkx as nx
+
+from tulip import dumpsmach
+
+
+def machine(n, m):
+    """Return machine with n states and m x m input valuations."""
+    g = nx.MultiDiGraph()
+    g.inputs = {'a': range(m), 'b': range(m)}
+    g.outputs = {'c': range(n)}
+    g.add_nodes_from(xrange(n))
+    for u in xrange(n):
+        for a, b in itertools.product(xrange(m), xrange(m)):
+            v = (u + a * m + b) % n
+            g.add_edge(u, v, a=a, b=b, c=v)
+    return g
+
+
+def measure(export, g, inputs):
+    """Return size, compile and move times of code for C{g}."""
+    code = export(g, start=0)
+    start = time.time()
+    c = compile(code, '<string>', 'exec')
+    t_compile = time.time() - start
+    env = dict()
+    exec(c, env)
+    M = env['TulipStrategy']()
+    start = time.time()
+    outputs = [M.move(a, b) for a, b in inputs]
+    t_move = (time.time() - start) / len(inputs)
+    return len(code), t_compile, t_move, outputs
+
+
+def main():
+    steps = 2000
+    # nesting depth of if/elif that CPython 2.7 compiles
+    max_case_depth = 360
+    random.seed(0)
+    print('{n:>6} {k:>6} {mode:>6} {s:>10} {c:>12} {m:>10}'.format(
+        n='n', k='k', mode='mode', s='size [kB]',
+        c='compile [s]', m='move [us]'))
+    for n, m in [(10, 4), (100, 4), (100, 16), (300, 4),
+                 (1000, 16), (10000, 8)]:
+        g = machine(n, m)
+        inputs = [(random.randrange(m), random.randrange(m))
+                  for i in xrange(steps)]
+        results = list()
+        modes = [('table', dumpsmach.python_table)]
+        if n + m * m <= max_case_depth:
+            modes.insert(0, ('case', dumpsmach.python_case))
+        for mode, export in modes:
+            size, tc, tm, outputs = measure(export, g, inputs)
+            results.append(outputs)
+            print('{n:6d} {k:6d} {mode:>6} {s:10.1f} {c:12.3f} '
+                  '{m:10.2f}'.format(n=n, k=m * m, mode=mode,
+                                     s=size / 1e3, c=tc, m=1e6 * tm))
+        assert(all(r == results[0] for r in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Emptiness check of TS * BA with products.find_accepting_lasso.
+
+find_accepting_lasso searches the product on the fly with
+nested depth-first search, and stops at the first accepting cycle.
+This script compares it with constructing the product
+as an OnTheFlyProductAutomaton with add_all_states, then searching
+its strongly connected components for an accepting cycle, for:
+
+  - nonempty: a random BA with m states, with
+    a transition for each letter from each state
+  - empty: the same BA, with a new unreachable state
+    as the only accepting state, so the whole product is searched
+
+The TS has n states, labeled with subsets of k atomic propositions,
+and d transitions per state.
+
+usage: python emptiness.py
+"""
+from __future__ import print_function
+
+import logging
+import time
+
+import networkx as nx
+import numpy as np
+
+from tulip import transys as trs
+from tulip.transys import products
+
+from product import fts, ba
+
+
+def has_accepting_cycle(prod):
+    """Return True if an SCC of C{prod} has an accepting cycle."""
+    accepting = set(prod.states.accepting)
+    for c in nx.strongly_connected_components(prod):
+        if not accepting.intersection(c):
+            continue
+        if len(c) > 1:
+            return True
+        u, = c
+        if prod.has_edge(u, u):
+            return True
+    return False
+
+
+def materialized(ts, b):
+    prod = trs.OnTheFlyProductAutomaton(b, ts)
+    prod.add_all_states()
+    return has_accepting_cycle(prod), len(prod)
+
+
+def timed(f, *args):
+    start = time.time()
+    r = f(*args)
+    return r, time.time() - start
+
+
+def main():
+    logging.getLogger('tulip').setLevel(logging.ERROR)
+    rng = np.random.RandomState(0)
+    k, d, m = 4, 3, 8
+    print('{n:>7} {c:>9} {p:>9} {v:>9} {t:>12} {s:>12}'.format(
+        n='TS', c='case', p='product', v='visited',
+        t='nested [s]', s='graph [s]'))
+    for n in [1000, 10000]:
+        ts = fts(n, d, k, rng)
+        b = ba(m, k, rng)
+        for case in ['nonempty', 'empty']:
+            if case == 'empty':
+                b.states.accepting.remove(m - 1)
+                b.states.add(m)
+                b.states.accepting.add(m)
+            (lasso, stats), tn = timed(
+                products.find_accepting_lasso, ts, b)
+            (nonempty, size), tg = timed(materialized, ts, b)
+            assert(nonempty == (lasso is not None))
+            assert(nonempty == (case == 'nonempty'))
+            print('{n:7d} {c:>9} {p:9d} {v:9d} {t:12.3f} {s:12.3f}'.format(
+                n=n, c=case, p=size, v=stats['states'], t=tn, s=tg))
+
+
+if __name__ == '__main__':
+    main()
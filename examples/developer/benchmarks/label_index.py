@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Searching states and transitions by label with LabeledDiGraph.index_labels.
+
+With the label index enabled, States.find and Transitions.find
+with a desired label check only the states or transitions
+that have that label value.
+This script times these searches on a transition system
+with n states, each labeled with one of k atomic propositions,
+and d transitions per state, each labeled with one of k actions:
+
+  - indexed: after calling index_labels
+  - scan: without the index, i.e., every label is compared
+    to the desired one
+
+The time of an indexed search grows with the number of matches,
+n / k states or n * d / k transitions.
+
+usage: python label_index.py
+"""
+from __future__ import print_function
+
+import logging
+import time
+
+import numpy as np
+
+from tulip import transys as trs
+
+
+def fts(n, k, d, rng):
+    """Return FTS with n states, k labels and n * d transitions."""
+    ts = trs.FTS()
+    props = ['p' + str(i) for i in xrange(k)]
+    actions = ['a' + str(i) for i in xrange(k)]
+    ts.atomic_propositions.add_from(props)
+    ts.sys_actions.add_from(actions)
+    for u in xrange(n):
+        ts.states.add(u, ap={props[u % k]})
+    rows = rng.randint(0, n, n * d)
+    cols = rng.randint(0, n, n * d)
+    acts = rng.randint(0, k, n * d)
+    edges = set(zip(rows.tolist(), cols.tolist(), acts.tolist()))
+    ts.transitions.add_from(
+        (u, v, dict(sys_actions=actions[a])) for u, v, a in edges)
+    return ts
+
+
+def search(ts, m):
+    """Find the states and transitions of the first m labels."""
+    r = list()
+    for j in xrange(m):
+        r.append(len(ts.states.find(ap={'p' + str(j)})))
+        r.append(len(ts.transitions.find(sys_actions='a' + str(j))))
+    return r
+
+
+def timed(f, *args):
+    start = time.time()
+    r = f(*args)
+    return r, time.time() - start
+
+
+def main():
+    logging.getLogger('tulip').setLevel(logging.ERROR)
+    rng = np.random.RandomState(0)
+    m = 10
+    print('{n:>7} {k:>5} {e:>8} {i:>14} {s:>14}'.format(
+        n='states', k='k', e='edges',
+        i='indexed [ms]', s='scan [ms]'))
+    for n, k, d in [(1000, 10, 5), (1000, 100, 5),
+                    (10000, 100, 5), (10000, 1000, 5)]:
+        ts = fts(n, k, d, rng)
+        rs, tsc = timed(search, ts, m)
+        ts.index_labels()
+        ri, ti = timed(search, ts, m)
+        assert(ri == rs)
+        searches = 2.0 * m
+        print('{n:7d} {k:5d} {e:8d} {i:14.3f} {s:14.3f}'.format(
+            n=n, k=k, e=len(ts.transitions),
+            i=1e3 * ti / searches, s=1e3 * tsc / searches))
+
+
+if __name__ == '__main__':
+    main()
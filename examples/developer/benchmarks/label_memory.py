@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Memory used by the labels of states and transitions.
+
+Labels are L{TypedDict}s without an instance __dict__,
+and equal strings and frozensets of strings in labels are shared.
+With compact_labels, set labels are stored as shared frozensets.
+This script measures the memory of the adjacency dicts and labels
+(not the label types) of:
+
+  - fts: a transition system with n states, each labeled with
+    a set of atomic propositions, and d transitions per state,
+    each labeled with an action
+  - ba: a Buchi automaton with n states and d transitions
+    per state, each labeled with a set of atomic propositions
+
+in the modes:
+
+  - before: labels with an instance __dict__, and no sharing
+  - default: as implemented
+  - compact: with compact_labels = True
+
+usage: python label_memory.py
+"""
+from __future__ import print_function
+
+import logging
+import sys
+import warnings
+
+import numpy as np
+
+from tulip import transys as trs
+from tulip.transys import labeled_graphs
+from tulip.transys.mathset import TypedDict
+
+
+class LegacyTypedDict(TypedDict):
+    """L{TypedDict} with an instance __dict__, as before."""
+
+
+class Before(object):
+    """Context with labels stored as before."""
+    def __enter__(self):
+        self.intern = labeled_graphs.LabeledDiGraph._intern_label
+        labeled_graphs.TypedDict = LegacyTypedDict
+        labeled_graphs.LabeledDiGraph._intern_label = (
+            lambda self, label: None)
+
+    def __exit__(self, *args):
+        labeled_graphs.TypedDict = TypedDict
+        labeled_graphs.LabeledDiGraph._intern_label = self.intern
+
+
+def graph_size(g):
+    """Return bytes used by adjacency dicts and labels of C{g}."""
+    seen = set()
+    size = [0]
+
+    def add(x):
+        if id(x) in seen:
+            return
+        seen.add(id(x))
+        size[0] += sys.getsizeof(x)
+        if hasattr(x, '__dict__'):
+            add(x.__dict__)
+
+    labels = list()
+    for adj in (g.node, g.succ, g.pred):
+        add(adj)
+        for u, d in adj.iteritems():
+            add(d)
+            if adj is g.node:
+                labels.append(d)
+                continue
+            for keydict in d.itervalues():
+                add(keydict)
+                labels.extend(keydict.itervalues())
+    for label in labels:
+        add(label)
+        for x in label.itervalues():
+            add(x)
+            if isinstance(x, (set, frozenset)):
+                for y in x:
+                    add(y)
+    return size[0]
+
+
+def fts(n, d, k, rng, compact):
+    ts = trs.FTS()
+    ts.compact_labels = compact
+    props = ['p' + str(i) for i in xrange(k)]
+    ts.atomic_propositions.add_from(props)
+    ts.sys_actions.add_from(['a' + str(i) for i in xrange(k)])
+    for u in xrange(n):
+        ts.states.add(u, ap={props[i] for i in rng.randint(0, k, 2)})
+    for u, v, a in zip(xrange(n * d), rng.randint(0, n, n * d),
+                       rng.randint(0, k, n * d)):
+        # each action name is a new string, as when parsed
+        ts.transitions.add(u % n, v, sys_actions='a' + str(a))
+    return ts
+
+
+def ba(n, d, k, rng, compact):
+    ba = trs.BA()
+    ba.compact_labels = compact
+    props = ['p' + str(i) for i in xrange(k)]
+    ba.atomic_propositions.add_from(props)
+    ba.states.add_from(xrange(n))
+    for u, v, a in zip(xrange(n * d), rng.randint(0, n, n * d),
+                       rng.randint(0, k, n * d)):
+        ba.transitions.add(u % n, v, letter={props[a]})
+    return ba
+
+
+def main():
+    logging.getLogger('tulip').setLevel(logging.ERROR)
+    # duplicate random transitions
+    warnings.simplefilter('ignore')
+    n, d, k = 20000, 10, 10
+    print('{n} states, {e} transitions, {k} propositions'.format(
+        n=n, e=n * d, k=k))
+    print('{g:>5} {m:>8} {s:>10} {b:>10}'.format(
+        g='graph', m='mode', s='size [MB]', b='per edge'))
+    for name, build in [('fts', fts), ('ba', ba)]:
+        for mode in ['before', 'default', 'compact']:
+            rng = np.random.RandomState(0)
+            if mode == 'before':
+                with Before():
+                    g = build(n, d, k, rng, False)
+            else:
+                g = build(n, d, k, rng, mode == 'compact')
+            size = graph_size(g)
+            print('{g:>5} {m:>8} {s:10.1f} {b:10.0f}'.format(
+                g=name, m=mode, s=size / 1e6,
+                b=size / float(len(g.transitions))))
+            del g
+
+
+if __name__ == '__main__':
+    main()
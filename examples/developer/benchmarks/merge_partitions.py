@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Serial versus tree merging of the partitions of switched modes.
+
+The modes are those of the fuel tank example in
+examples/developer/fuel_tank/continuous_switched_test.py,
+with the height h that separates the two subsystems
+varied to obtain more modes. Each mode is abstracted once,
+then the abstractions of the first m modes are merged with:
+
+  - serial: abstract.discretization.merge_partitions
+  - tree: abstract.discretization.multiproc_merge_partitions
+
+usage: python merge_partitions.py [n_jobs]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+import numpy as np
+from polytope import box2poly
+
+from tulip import abstract, hybrid
+from tulip.abstract import discretization as ds
+
+input_bound = 0.4
+uncertainty = 0.05
+
+
+def subsys(h, A, B):
+    E = np.array([[1, 0], [0, 1]])
+
+    U = box2poly([[-1., 1.], [-1., 1.]])
+    U.scale(input_bound)
+
+    W = box2poly([[-1., 1.], [-1., 1.]])
+    W.scale(uncertainty)
+
+    return hybrid.LtiSysDyn(A, B, E, None, U, W, h)
+
+
+def fuel_modes(heights):
+    """Return PWA dynamics keyed by mode, one mode per height."""
+    cont_state_space = box2poly([[0., 3.], [0., 2.]])
+    sys_dyn = dict()
+    for k, h in enumerate(heights):
+        s0 = subsys(
+            box2poly([[0., 3.], [h, 2.]]),
+            np.array([[1.1052, 0.], [0., 1.1052]]),
+            np.array([[1.1052, 0.], [0., 1.1052]])
+        )
+        s1 = subsys(
+            box2poly([[0., 3.], [0., h]]),
+            np.array([[0.9948, 0.], [0., 1.1052]]),
+            np.array([[-1.1052, 0.], [0., 1.1052]])
+        )
+        sys_dyn[('mode' + str(k), 'fly')] = hybrid.PwaSysDyn(
+            [s0, s1], cont_state_space)
+    return cont_state_space, sys_dyn
+
+
+def main():
+    if len(sys.argv) > 1:
+        n_jobs = int(sys.argv[1])
+    else:
+        n_jobs = None
+    n_modes = [2, 4, 8, 16]
+    heights = np.linspace(0.3, 1.7, max(n_modes))
+
+    cont_state_space, sys_dyn = fuel_modes(heights)
+    cont_props = {}
+    cont_props['home'] = box2poly([[0., 1.], [0., 1.]])
+    cont_props['lot'] = box2poly([[2., 3.], [1., 2.]])
+    ppp = abstract.prop2part(cont_state_space, cont_props)
+    ppp, new2old = abstract.part2convex(ppp)
+
+    modes = sorted(sys_dyn)
+    abstractions = dict()
+    for mode in modes:
+        abstractions[mode] = abstract.discretize(
+            ppp, sys_dyn[mode], N=2, min_cell_volume=0.2
+        )
+
+    print('{m:>6} {c:>8} {s:>12} {t:>12}'.format(
+        m='modes', c='cells', s='serial [s]', t='tree [s]'))
+    for m in n_modes:
+        abs_m = dict((mode, abstractions[mode]) for mode in modes[:m])
+
+        start = time.time()
+        serial, ap = ds.merge_partitions(abs_m)
+        ts = time.time() - start
+
+        start = time.time()
+        tree, ap = ds.multiproc_merge_partitions(abs_m, n_jobs)
+        tt = time.time() - start
+
+        assert(len(serial.ppp) == len(tree.ppp))
+        print('{m:6d} {c:8d} {s:12.3f} {t:12.3f}'.format(
+            m=m, c=len(tree.ppp), s=ts, t=tt))
+
+
+if __name__ == '__main__':
+    main()
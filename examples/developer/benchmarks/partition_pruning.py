@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Bounding box pruning in prop2part and pwa_partition.
+
+Both functions skip pairs of sets whose bounding boxes are disjoint,
+and test adjacency only for regions whose boxes touch.
+This script times them on synthetic grids with:
+
+  - pruned: as implemented
+  - all pairs: with pruning disabled, i.e., every pair is
+    intersected or tested for adjacency, as before pruning
+
+pwa_partition refines an m x m grid of unit boxes
+by m vertical strips, each the domain of a subsystem.
+prop2part partitions an m x m square by its unit boxes
+as propositions.
+
+usage: python partition_pruning.py
+"""
+from __future__ import print_function
+
+import time
+import warnings
+
+import numpy as np
+import polytope as pc
+
+from tulip import hybrid
+from tulip.abstract import prop2partition as p2p
+
+
+class AllPairs(object):
+    """Context in which pruning by bounding boxes is disabled."""
+    def __enter__(self):
+        self.overlapping = p2p.RegionIndex.overlapping
+        self.boxes_disjoint = p2p._boxes_disjoint
+        p2p.RegionIndex.overlapping = (
+            lambda self, lo, hi, tol=None: range(self.n_regions))
+        p2p._boxes_disjoint = lambda *args, **kw: False
+
+    def __exit__(self, *args):
+        p2p.RegionIndex.overlapping = self.overlapping
+        p2p._boxes_disjoint = self.boxes_disjoint
+
+
+def grid(m):
+    """Return m x m grid of unit boxes as partition."""
+    dom = pc.box2poly([[0., m], [0., m]])
+    regions = [
+        pc.Region([pc.box2poly([[x, x + 1.], [y, y + 1.]])], set())
+        for x in xrange(m) for y in xrange(m)
+    ]
+    adj = p2p.find_adjacent_regions(regions)
+    return p2p.PropPreservingPartition(
+        domain=dom, regions=regions, adj=adj,
+        prop_regions={}, check=False)
+
+
+def strips(m):
+    """Return PWA system with m vertical strips as subsystem domains."""
+    dom = pc.box2poly([[0., m], [0., m]])
+    U = pc.box2poly([[0., 1.], [0., 1.]])
+    subsystems = [
+        hybrid.LtiSysDyn(np.eye(2), np.eye(2), Uset=U,
+                         domain=pc.box2poly([[k, k + 1.], [0., m]]))
+        for k in xrange(m)
+    ]
+    return hybrid.PwaSysDyn(subsystems, dom)
+
+
+def tiles(m):
+    """Return the unit boxes of [0, m]^2 as propositions."""
+    props = dict()
+    for x in xrange(m):
+        for y in xrange(m):
+            props['p' + str(x) + '_' + str(y)] = pc.box2poly(
+                [[x, x + 1.], [y, y + 1.]])
+    return props
+
+
+def timed(f, *args):
+    start = time.time()
+    r = f(*args)
+    return r, time.time() - start
+
+
+def main():
+    warnings.simplefilter('ignore')
+
+    print('pwa_partition of m x m grid by m strips')
+    print('{m:>4} {c:>8} {p:>12} {a:>14}'.format(
+        m='m', c='cells', p='pruned [s]', a='all pairs [s]'))
+    for m in [10, 20, 40]:
+        ppp = grid(m)
+        pwa = strips(m)
+        (new, subsys, parents), tp = timed(p2p.pwa_partition, pwa, ppp)
+        with AllPairs():
+            r, ta = timed(p2p.pwa_partition, pwa, ppp)
+        assert((new.adj != r[0].adj).nnz == 0)
+        print('{m:4d} {c:8d} {p:12.3f} {a:14.3f}'.format(
+            m=m, c=len(new), p=tp, a=ta))
+
+    print('\nprop2part of [0, m]^2 by its m x m unit boxes')
+    print('{m:>4} {c:>8} {p:>12} {a:>14}'.format(
+        m='m', c='cells', p='pruned [s]', a='all pairs [s]'))
+    for m in [4, 8, 10]:
+        dom = pc.box2poly([[0., m], [0., m]])
+        props = tiles(m)
+        ppp, tp = timed(p2p.prop2part, dom, props)
+        with AllPairs():
+            r, ta = timed(p2p.prop2part, dom, props)
+        assert((ppp.adj != r.adj).nnz == 0)
+        print('{m:4d} {c:8d} {p:12.3f} {a:14.3f}'.format(
+            m=m, c=len(ppp), p=tp, a=ta))
+
+
+if __name__ == '__main__':
+    main()
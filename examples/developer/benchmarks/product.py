@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Exploring the synchronous product TS * BA with ImplicitProduct.
+
+ImplicitProduct.search finds the reachable product states
+with a worklist, looking up the successors of BA states
+in a table by letter.
+This script times the search over the product of a TS with
+n states, labeled with subsets of k atomic propositions,
+and d transitions per state, with a BA with m states, for:
+
+  - table: as implemented
+  - scan: successors found with products.find_ba_succ, i.e.,
+    by searching the transitions of the BA, as
+    OnTheFlyProductAutomaton.add_successors does
+
+The scan is run only for the smaller products.
+
+usage: python product.py
+"""
+from __future__ import print_function
+
+import itertools
+import logging
+import time
+
+import numpy as np
+
+from tulip import transys as trs
+from tulip.transys import products
+
+
+class Scan(trs.ImplicitProduct):
+    """Product with successors found by searching transitions."""
+    def successors(self, sq):
+        s, q = sq
+        return [(next_s, next_q)
+                for next_s in self.ts.states.post(s)
+                for _, next_q, _ in products.find_ba_succ(
+                    q, next_s, self.ts, self.ba)]
+
+
+def fts(n, d, k, rng):
+    """Return TS with n states and d transitions per state."""
+    ts = trs.FTS()
+    props = ['p' + str(i) for i in xrange(k)]
+    ts.atomic_propositions.add_from(props)
+    for u in xrange(n):
+        ts.states.add(u, ap={p for p in props if rng.rand() < 0.5})
+    ts.states.initial.add(0)
+    edges = {(u, (u + 1) % n) for u in xrange(n)}
+    edges.update(zip(rng.randint(0, n, n * (d - 1)).tolist(),
+                     rng.randint(0, n, n * (d - 1)).tolist()))
+    ts.add_edges_from(edges)
+    return ts
+
+
+def ba(m, k, rng):
+    """Return BA with m states and a transition for each letter."""
+    ba = trs.BA()
+    props = ['p' + str(i) for i in xrange(k)]
+    ba.atomic_propositions.add_from(props)
+    ba.states.add_from(xrange(m))
+    ba.states.initial.add(0)
+    ba.states.accepting.add(m - 1)
+    letters = [set(c) for r in xrange(k + 1)
+               for c in itertools.combinations(props, r)]
+    for q in xrange(m):
+        for letter in letters:
+            ba.transitions.add(q, rng.randint(0, m), letter=letter)
+    return ba
+
+
+def timed(f, *args):
+    start = time.time()
+    r = f(*args)
+    return r, time.time() - start
+
+
+def main():
+    logging.getLogger('tulip').setLevel(logging.ERROR)
+    rng = np.random.RandomState(0)
+    k, d, m = 4, 3, 8
+    max_scan = 50000
+    print('{n:>8} {p:>9} {t:>10} {s:>10}'.format(
+        n='TS', p='product', t='table [s]', s='scan [s]'))
+    for n in [1000, 10000, 100000]:
+        ts = fts(n, d, k, rng)
+        b = ba(m, k, rng)
+        (reached, complete), tt = timed(
+            trs.ImplicitProduct(ts, b).search)
+        tsc = float('nan')
+        if len(reached) <= max_scan:
+            (r, c), tsc = timed(Scan(ts, b).search)
+            assert(r == reached)
+        print('{n:8d} {p:9d} {t:10.2f} {s:10.2f}'.format(
+            n=n, p=len(reached), t=tt, s=tsc))
+
+
+if __name__ == '__main__':
+    main()
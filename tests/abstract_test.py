@@ -7,6 +7,8 @@ logger = logging.getLogger(__name__)
 #logging.getLogger('tulip').setLevel(logging.ERROR)
 logger.setLevel(logging.DEBUG)
 
+import os
+
 from nose.tools import assert_raises
 
 import matplotlib
@@ -48,6 +50,43 @@ def subsys1():
     
     return sys_dyn
 
+def fly_partition():
+    """Return partition and dynamics of fuel example, without refueling."""
+    cont_state_space = pc.box2poly([[0., 3.], [0., 2.]])
+    pwa = hybrid.PwaSysDyn([subsys0()], cont_state_space)
+    
+    cont_props = {}
+    cont_props['home'] = pc.box2poly([[0., 1.], [0., 1.]])
+    cont_props['lot'] = pc.box2poly([[2., 3.], [1., 2.]])
+    
+    ppp = abstract.prop2part(cont_state_space, cont_props)
+    ppp, new2old = abstract.part2convex(ppp)
+    return ppp, pwa
+
+def switched_fly():
+    """Return partition, switched dynamics and modes of fuel example."""
+    modes = []
+    modes.append(('normal', 'fly'))
+    modes.append(('refuel', 'fly'))
+    env_modes, sys_modes = zip(*modes)
+    
+    ppp, pwa = fly_partition()
+    cont_state_space = pwa.domain
+    pwa_sys = dict()
+    pwa_sys[('normal', 'fly')] = pwa
+    pwa_sys[('refuel', 'fly')] = hybrid.PwaSysDyn(
+        [subsys1()], cont_state_space
+    )
+    
+    switched_dynamics = hybrid.SwitchedSysDyn(
+        disc_domain_size=(len(env_modes), len(sys_modes)),
+        dynamics=pwa_sys,
+        env_labels=env_modes,
+        disc_sys_labels=sys_modes,
+        cts_ss=cont_state_space
+    )
+    return ppp, switched_dynamics, modes
+
 def transition_directions_test():
     """
     unit test for correctness of abstracted transition directions, with:
@@ -117,6 +156,333 @@ def transition_directions_test():
 
 transition_directions_test.slow = True
 
+def test_multiproc_discretize_switched():
+    """parallel switched abstraction must equal the serial one"""
+    ppp, switched_dynamics, modes = switched_fly()
+    
+    disc_params = {}
+    for mode in modes:
+        disc_params[mode] = {'N':8, 'trans_length':1}
+    
+    serial = abstract.discretize_switched(
+        ppp, switched_dynamics, disc_params
+    )
+    parallel = abstract.multiproc_discretize_switched(
+        ppp, switched_dynamics, disc_params, n_jobs=2
+    )
+    
+    assert(len(serial.ppp) == len(parallel.ppp))
+    assert(set(serial.ts.edges()) == set(parallel.ts.edges()))
+    for mode in modes:
+        ts1 = serial.modes[mode].ts
+        ts2 = parallel.modes[mode].ts
+        assert(set(ts1.edges()) == set(ts2.edges()))
+    
+    # failing mode is named
+    disc_params[modes[1]]['foo'] = 1
+    with assert_raises(Exception) as cm:
+        abstract.multiproc_discretize_switched(
+            ppp, switched_dynamics, disc_params, n_jobs=2
+        )
+    assert(str(modes[1]) in str(cm.exception))
+
+test_multiproc_discretize_switched.slow = True
+
+def test_multiproc_merge_partitions():
+    """tree merge must yield the serial merged partition"""
+    ppp, switched_dynamics, modes = switched_fly()
+    
+    abstractions = dict()
+    for mode in modes:
+        abstractions[mode] = abstract.discretize(
+            ppp, switched_dynamics.dynamics[mode], N=4
+        )
+    # odd number of modes
+    abstractions[('emergency', 'fly')] = abstractions[modes[0]]
+    
+    serial, ap1 = abstract.discretization.merge_partitions(abstractions)
+    tree, ap2 = abstract.discretization.multiproc_merge_partitions(
+        abstractions, n_jobs=2
+    )
+    
+    assert(len(serial.ppp) == len(tree.ppp))
+    for r1, r2 in zip(serial.ppp, tree.ppp):
+        assert(r1 == r2)
+        assert(r1.props == r2.props)
+    assert((serial.ppp.adj == tree.ppp.adj).all())
+    assert(serial.ppp2modes == tree.ppp2modes)
+    assert(ap1 == ap2)
+    
+    parallel, ap3 = abstract.discretization.merge_partitions(
+        abstractions, n_jobs=2
+    )
+    for r1, r2 in zip(serial.ppp, parallel.ppp):
+        assert(r1 == r2)
+    assert(serial.ppp2modes == parallel.ppp2modes)
+    assert(ap1 == ap3)
+    
+    # pruning by bounding boxes must keep all intersections
+    ab0 = abstractions[modes[0]]
+    ab1 = abstractions[modes[1]]
+    regions, parents, ap_labeling = \
+        abstract.discretization.merge_partition_pair(
+            list(ab0.ppp), ab1, modes[1], [modes[0]],
+            {modes[0]:range(len(ab0.ppp))},
+            {i:r.props for i, r in enumerate(ab0.ppp)}
+        )
+    pairs = [
+        (i, j)
+        for i in xrange(len(ab0.ppp))
+        for j in xrange(len(ab1.ppp))
+        if pc.cheby_ball(pc.intersect(ab0.ppp[i], ab1.ppp[j]))[0] >= 1e-5
+    ]
+    assert(len(regions) == len(pairs))
+    for k, (i, j) in enumerate(pairs):
+        assert(parents[modes[0]][k] == i)
+        assert(parents[modes[1]][k] == j)
+
+def test_discretize_parallel():
+    """parallel discretize must yield the serial abstraction"""
+    ppp, pwa = fly_partition()
+    
+    serial = abstract.discretize(ppp, pwa, N=8, trans_length=1)
+    parallel = abstract.discretize(ppp, pwa, N=8, trans_length=1,
+                                   n_jobs=2)
+    
+    assert(len(serial.ppp) == len(parallel.ppp))
+    for r1, r2 in zip(serial.ppp, parallel.ppp):
+        assert(r1 == r2)
+        assert(r1.props == r2.props)
+    assert((serial.ppp.adj != parallel.ppp.adj).nnz == 0)
+    assert(set(serial.ts.edges()) == set(parallel.ts.edges()))
+    assert(serial._ppp2sys == parallel._ppp2sys)
+    
+    with assert_raises(ValueError):
+        abstract.discretize(ppp, pwa, N=8, n_jobs=0)
+
+def test_get_transitions_parallel():
+    """parallel get_transitions must find the serial transitions"""
+    ppp, pwa = fly_partition()
+    
+    mode = ('normal', 'fly')
+    absys = abstract.discretize(ppp, pwa, N=8, trans_length=1)
+    merged, ap_labeling = abstract.discretization.merge_partitions(
+        {mode: absys}
+    )
+    
+    serial = abstract.discretization.get_transitions(
+        merged, mode, pwa, N=8
+    )
+    parallel = abstract.discretization.get_transitions(
+        merged, mode, pwa, N=8, n_jobs=2, chunksize=3
+    )
+    
+    assert(serial.shape == parallel.shape)
+    assert((serial != parallel).nnz == 0)
+    assert(serial.nnz == 15)
+
+def test_feasibility_cache():
+    """rerun of discretize must be answered by the cache"""
+    import shutil
+    import tempfile
+    
+    ppp, pwa = fly_partition()
+    
+    path = tempfile.mkdtemp()
+    try:
+        cache = abstract.FeasibilityCache(path)
+        cold = abstract.discretize(ppp, pwa, N=8, cache=cache)
+        assert(cache.hits == 0)
+        assert(cache.misses > 0)
+        
+        # new object, as in a new run
+        cache = abstract.FeasibilityCache(path)
+        warm = abstract.discretize(ppp, pwa, N=8, cache=cache)
+        assert(cache.misses == 0)
+        assert(cache.hits > 0)
+        
+        assert(set(cold.ts.edges()) == set(warm.ts.edges()))
+        for r1, r2 in zip(cold.ppp, warm.ppp):
+            assert(r1 == r2)
+        
+        # bounded size
+        cache = abstract.FeasibilityCache(path, max_size=1)
+        abstract.discretize(ppp, pwa, N=4, cache=cache)
+        assert(cache.evictions > 0)
+        assert(len(os.listdir(path)) <= 1)
+    finally:
+        shutil.rmtree(path)
+
+def test_discretize_resume():
+    """resuming from a checkpoint must yield the same abstraction"""
+    import pickle
+    import shutil
+    import tempfile
+    from tulip.abstract import discretization as ds
+    
+    ppp, pwa = fly_partition()
+    
+    path = tempfile.mkdtemp()
+    try:
+        full = os.path.join(path, 'full')
+        ab = abstract.discretize(ppp, pwa, N=8, checkpoint=full,
+                                 checkpoint_every=1)
+        
+        # simulate crash while writing a record
+        with open(full, 'rb') as f:
+            header = pickle.load(f)
+        records, offset = ds._Checkpoint.load(full, header['fingerprint'])
+        assert(len(records) > 2)
+        assert(records[-1]['done'])
+        crashed = os.path.join(path, 'crashed')
+        with open(crashed, 'wb') as f:
+            pickle.dump(header, f)
+            for record in records[:len(records) // 2]:
+                pickle.dump(record, f)
+            f.write(pickle.dumps(records[-1])[:20])
+        
+        resumed = abstract.discretize(ppp, pwa, N=8, resume_from=crashed)
+        assert(set(ab.ts.edges()) == set(resumed.ts.edges()))
+        assert(len(ab.ppp) == len(resumed.ppp))
+        for r1, r2 in zip(ab.ppp, resumed.ppp):
+            assert(r1 == r2)
+        assert((ab.ppp.adj != resumed.ppp.adj).nnz == 0)
+        assert(ab._ppp2sys == resumed._ppp2sys)
+        
+        # truncated record was replaced by new ones
+        records, offset = ds._Checkpoint.load(crashed,
+                                              header['fingerprint'])
+        assert(records[-1]['done'])
+        assert(offset == os.path.getsize(crashed))
+        
+        with assert_raises(ValueError):
+            abstract.discretize(ppp, pwa, N=7, resume_from=crashed)
+    finally:
+        shutil.rmtree(path)
+
+def test_transition_controller():
+    """precompiled controllers must give the inputs of get_input"""
+    ppp, pwa = fly_partition()
+    ssys = pwa.list_subsys[0]
+    ab = abstract.discretize(ppp, pwa, N=8)
+    
+    start, end = 1, 2
+    rc, xc = pc.cheby_ball(ab.ppp[start])
+    xc = np.asarray(xc).flatten()
+    np.random.seed(0)
+    x0 = xc + np.random.uniform(-0.5, 0.5, size=(5, 2)) * rc
+    
+    u = [abstract.get_input(x, ssys, ab, start, end) for x in x0]
+    
+    c = abstract.TransitionController(ssys, ab, start, end,
+                                      warm_start=True)
+    u_batch = c.get_inputs(x0)
+    assert(u_batch.shape == (5, 8, 2))
+    for i, x in enumerate(x0):
+        assert(np.allclose(c.get_input(x), u[i], atol=1e-4))
+        assert(np.allclose(u_batch[i], u[i], atol=1e-4))
+        
+        # reaches end state, without disturbance
+        xk = x.reshape(2, 1)
+        for k in xrange(8):
+            xk = ssys.A.dot(xk) + ssys.B.dot(u[i][k].reshape(2, 1))
+        assert(any((p.A.dot(xk.flatten()) - p.b.flatten() < 1e-6).all()
+                   for p in ab.ppp[end]))
+    
+    cache = abstract.ControllerCache(max_size=2)
+    for s, e in [(1, 2), (1, 4), (1, 2), (1, 5), (1, 1)]:
+        abstract.get_input(x0[0], ssys, ab, s, e, cache=cache)
+    assert(cache.hits == 1)
+    assert(cache.misses == 4)
+    assert(len(cache) == 2)
+
+def test_are_seqs_inside():
+    """batch check of input sequences must match stepwise simulation"""
+    W = pc.box2poly([[-1., 1.], [-1., 1.]])
+    W.scale(0.1)
+    ssys = hybrid.LtiSysDyn(
+        np.array([[1., 0.1], [0., 1.]]), np.eye(2),
+        E=np.eye(2), Wset=W,
+        domain=pc.box2poly([[0., 3.], [0., 2.]])
+    )
+    P0 = pc.box2poly([[0., 1.5], [0., 1.]])
+    P1 = pc.Region([pc.box2poly([[1., 2.], [0., 1.]])])
+    
+    np.random.seed(0)
+    n_traj = 200
+    N = 4
+    x0 = np.random.uniform(0., 1., size=(n_traj, 2))
+    u_seq = np.random.uniform(-0.1, 0.4, size=(n_traj, N, 2))
+    w_seq = abstract.sample_disturbance(ssys, n_traj, N, seed=1)
+    assert(w_seq.shape == (n_traj, N, 2))
+    assert((np.abs(w_seq) <= 0.1).all())
+    
+    # rejection sampling fails on a segment
+    segment = pc.Polytope(
+        np.array([[1., -1.], [-1., 1.], [1., 0.], [-1., 0.]]),
+        np.array([0., 0., 0.1, 0.1])
+    )
+    ssys_segment = hybrid.LtiSysDyn(
+        np.eye(2), np.eye(2), E=np.eye(2), Wset=segment,
+        domain=ssys.domain
+    )
+    with assert_raises(ValueError):
+        abstract.sample_disturbance(ssys_segment, 10, N, seed=1)
+    
+    def inside(P, x):
+        if isinstance(P, pc.Polytope):
+            P = [P]
+        return any((p.A.dot(x) - p.b.flatten() < 1e-7).all() for p in P)
+    
+    for w in [None, w_seq]:
+        ok, first = abstract.are_seqs_inside(x0, u_seq, ssys, P0, P1, w)
+        for i in xrange(n_traj):
+            x = x0[i]
+            expected = -1
+            for k in xrange(N):
+                x = ssys.A.dot(x) + ssys.B.dot(u_seq[i, k])
+                if w is not None:
+                    x = x + ssys.E.dot(w[i, k])
+                P = P0 if k < N - 1 else P1
+                if expected < 0 and not inside(P, x):
+                    expected = k + 1
+            assert(first[i] == expected)
+            assert(ok[i] == (expected < 0))
+        assert(ok.any() and not ok.all())
+
+def test_sparse_bookkeeping():
+    """sparse pairs to check must agree with dense matrices"""
+    from tulip.abstract import discretization as ds
+    
+    np.random.seed(0)
+    n = 12
+    adj = (np.random.rand(n, n) < 0.2).astype(int)
+    adj = ((adj + adj.T + np.eye(n, dtype=int)) > 0).astype(int)
+    transitions = (np.random.rand(n, n) < 0.3).astype(int)
+    
+    adj_sets = ds._matrix_to_sets(adj)
+    trans_sets = ds._matrix_to_sets(transitions)
+    assert((ds._sets_to_matrix(adj_sets).toarray() == adj).all())
+    
+    for trans_length in [1, 2, 3]:
+        adj_k = ds.reachable_within(trans_length, adj, adj)
+        IJ = adj_k.copy()
+        queue = ds._PairQueue()
+        for i in xrange(n):
+            for j in ds._reachable_within(i, adj_sets, trans_length):
+                queue.add((i, j))
+        
+        for i in [3, 7]:
+            ds.sym_adj_change(IJ, adj_k, transitions, i)
+            ds._reset_pairs(queue, i, adj_sets, trans_sets, trans_length)
+        
+        # popped in the order of np.nonzero
+        rows, cols = np.nonzero(IJ)
+        assert(len(queue) == len(rows))
+        for pair in zip(rows, cols):
+            assert(queue.pop() == pair)
+        assert(not queue)
+
 def test_transient_regions():
     """drift is too strong, so no self-loop must exist
     
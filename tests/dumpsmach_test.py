@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 """Tests for the export mechanisms of tulip.dumpsmach."""
+import os
+import tempfile
 import networkx as nx
 from nose.tools import assert_raises
-from tulip import spec, synth, dumpsmach
+from tulip import spec, synth, dumpsmach, transys
 
 
 class basic_test:
@@ -62,3 +64,66 @@ def test_nx():
     # dead-end
     with assert_raises(Exception):
         m.move(a=1, b=0)
+
+
+def test_nx_table():
+    g = nx.DiGraph()
+    g.inputs = {'a': '...', 'b': '...'}
+    g.outputs = {'c': '...', 'd': '...'}
+    start = 'Sinit'
+    g.add_edge(start, 0, a=0, b=0, c=0, d='on')
+    g.add_edge(0, 1, a=0, b=1, c=0, d='off')
+    g.add_edge(1, 2, a=1, b=0, c=1, d='off')
+    exec dumpsmach.python_table(g, classname='Machine', start='Sinit')
+    m = Machine()  # previous line creates the class `Machine`
+    # Sinit -> 0
+    out = m.move(a=0, b=0)
+    assert out == dict(c=0, d='on')
+    # 0 -> 1
+    out = m.move(a=0, b=1)
+    assert out == dict(c=0, d='off')
+    # invalid input for index 2 in time sequence
+    with assert_raises(ValueError):
+        m.move(a=1, b=1)
+    # 1 -> 2
+    out = m.move(a=1, b=0)
+    assert out == dict(c=1, d='off')
+    # dead-end
+    with assert_raises(Exception):
+        m.move(a=1, b=0)
+    # labels must assign all ports
+    g.add_edge(2, 0, a=0, c=0, d='on')
+    with assert_raises(ValueError):
+        dumpsmach.python_table(g, start='Sinit')
+
+
+def test_binary():
+    m = transys.MealyMachine()
+    m.add_inputs({'door': {'open', 'closed'}})
+    m.add_outputs({'led': ['on', 'off'], 'n': range(3)})
+    m.states.add_from(['Sinit', 0, 1])
+    m.states.initial.add('Sinit')
+    m.transitions.add('Sinit', 0, door='open', led='on', n=1)
+    m.transitions.add(0, 1, door='open', led='on', n=2)
+    m.transitions.add(0, 1, door='closed', led='off', n=2)
+    m.transitions.add(1, 0, door='open', led='off', n=0)
+    fd, fname = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        dumpsmach.write_binary(fname, m)
+        for mmap in [True, False]:
+            c = dumpsmach.load_binary(fname, mmap=mmap)
+            assert sorted(c.states) == sorted(m.states)
+            assert c.initial == ['Sinit']
+            assert c.inputs == m.inputs
+            assert c.outputs == m.outputs
+            assert (sorted(c.transitions(data=True)) ==
+                    sorted(m.transitions(data=True)))
+            assert c.reaction(0, {'door': 'closed'}) == (
+                1, {'led': 'off', 'n': 2})
+        with open(fname, 'wb') as f:
+            f.write('not a machine')
+        with assert_raises(ValueError):
+            dumpsmach.load_binary(fname)
+    finally:
+        os.remove(fname)
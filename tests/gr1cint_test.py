@@ -8,6 +8,7 @@ logging.getLogger('tulip.spec.lexyacc').setLevel(logging.WARNING)
 import networkx as nx
 from nose.tools import raises
 import os
+from StringIO import StringIO
 from tulip.spec import GRSpec, translate
 from tulip.interfaces import gr1c
 
@@ -147,6 +148,39 @@ class basic_test:
         assert len(g) == 6
 
 
+class GR1CPool_test:
+    def setUp(self):
+        self.f_un = GRSpec(
+            env_vars="x", sys_vars="y",
+            env_init="x", env_prog="x",
+            sys_init="y", sys_safety=["y -> X(!y)", "!y -> X(y)"],
+            sys_prog="y && x")
+        self.f = GRSpec(
+            env_vars="x", sys_vars="y",
+            env_init="x", env_prog="x",
+            sys_init="y", sys_prog="y && x")
+        self.pool = gr1c.GR1CPool(n_procs=2, timeout=60)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_check_realizable(self):
+        specs = [self.f_un, self.f, self.f_un, self.f]
+        assert self.pool.map_realizable(specs) == [False, True, False, True]
+        assert self.pool.check_realizable(self.f)
+        assert len(self.pool.stats) == 5
+        for stats in self.pool.stats:
+            assert not stats['timed_out']
+            assert stats['time'] >= 0
+
+    def test_synthesize(self):
+        g = self.pool.synthesize(self.f)
+        assert g is not None
+        assert len(g.env_vars) == 1 and 'x' in g.env_vars
+        assert len(g.sys_vars) == 1 and 'y' in g.sys_vars
+        assert self.pool.synthesize(self.f_un) is None
+
+
 class GR1CSession_test:
     def setUp(self):
         self.spec_filename = "trivial_partwin.spc"
@@ -239,6 +273,48 @@ def test_load_aut_json():
     assert h_edges == g_edges, (h_edges, g_edges)
 
 
+def test_load_aut_json_compact():
+    g = gr1c.load_aut_json(REFERENCE_AUTJSON_smallbool, compact=True)
+    assert len(g) == 3
+    assert g.variables == ['x', 'y']
+    i = g.ids.index('0x1E8F990')
+    assert g.state(i) == dict(x=0, y=1)
+    assert g.attr['initial'][i]
+    assert [g.ids[j] for j in g.successors(i)] == ['0x1E8FA00']
+    # read in small chunks, from a file
+    f = StringIO(REFERENCE_AUTJSON_smallbool)
+    stream = gr1c.JSONStream(f, chunk_size=7)
+    keys = list()
+    for key in stream.members():
+        keys.append(key)
+        stream.value()
+    assert keys == ['version', 'gr1c', 'date', 'extra',
+                    'ENV', 'SYS', 'nodes']
+    h = gr1c.load_aut_json(StringIO(REFERENCE_AUTJSON_smallbool))
+    assert set(h.edges()) == set(g.to_networkx().edges())
+
+
+@raises(ValueError)
+def test_load_aut_json_undefined_node():
+    gr1c.load_aut_json(REFERENCE_AUTJSON_smallbool.replace(
+        '"trans": ["0x1E8FA40"]', '"trans": ["0x0"]'))
+
+
+@raises(ValueError)
+def test_load_aut_json_duplicate_node():
+    gr1c.load_aut_json(REFERENCE_AUTJSON_smallbool.replace(
+        '"nodes": {',
+        '"nodes": {"0x1E8FA40": {"state": [0, 0], "trans": []},'))
+
+
+def test_aut_xml_compact():
+    g = gr1c.load_aut_xml(REFERENCE_AUTXML, compact=True)
+    assert g.ids == [0, 1, 2]
+    assert g.states.tolist() == [[1, 0], [0, 0], [1, 1]]
+    assert g.successors(2).tolist() == [1, 0]
+    assert g.attr['mode'].tolist() == [-1, -1, -1]
+
+
 @raises(ValueError)
 def synth_init_illegal_check(init_option):
     spc = GRSpec()
@@ -259,3 +335,13 @@ def realiz_init_illegal_check(init_option):
 def realiz_init_illegal_test():
     for init_option in ["Caltech", 1]:
         yield realiz_init_illegal_check, init_option
+
+
+@raises(ValueError)
+def pool_init_illegal_check(init_option):
+    gr1c.GR1CPool(init_option=init_option)
+
+
+def pool_init_illegal_test():
+    for init_option in ["Caltech", 1]:
+        yield pool_init_illegal_check, init_option
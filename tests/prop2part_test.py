@@ -3,7 +3,15 @@
 Tests for abstract.prop2partition
 """
 
-from tulip.abstract import prop2part
+import pickle
+
+from tulip.abstract import (
+    prop2part, part2convex, add_grid,
+    find_discrete_state, find_discrete_states
+)
+from tulip.abstract.prop2partition import (
+    find_adjacent_regions, compute_interval, product_interval
+)
 import polytope as pc
 import numpy as np
 
@@ -58,3 +66,132 @@ def prop2part_test():
     # invalidate it
     mypartition.regions += [pc.Region([pc.Polytope(A[0], b[0])], {})]
     assert(not mypartition.preserves_predicates())
+
+def region_index_test():
+    state_space = pc.box2poly([[0., 4.], [0., 3.]])
+    cont_props = {
+        'a': pc.box2poly([[0., 1.], [0., 1.]]),
+        'b': pc.box2poly([[1.5, 3.], [1., 2.5]]),
+        'c': pc.Polytope(np.array([[1., 1.], [-1., 0.], [0., -1.]]),
+                         np.array([[6.], [-2.], [0.]]))
+    }
+    ppp = prop2part(state_space, cont_props)
+    ppp, new2old = part2convex(ppp)
+    index = ppp.build_index(leaf_size=2)
+    assert(len(index) == len(ppp))
+    
+    np.random.seed(0)
+    x = np.random.uniform(-0.5, 4.5, size=(300, 2))
+    # boundary points and vertices
+    x = np.vstack([x, [[1., 1.], [0., 0.], [4., 3.], [1.5, 2.5]]])
+    
+    expected = []
+    for xi in x:
+        found = -1
+        for i, region in enumerate(ppp):
+            if any((p.A.dot(xi) - p.b.flatten() < index.abs_tol).all()
+                   for p in region):
+                found = i
+                break
+        expected.append(found)
+    expected = np.array(expected)
+    
+    assert((index.find_many(x) == expected).all())
+    assert((find_discrete_states(x, ppp) == expected).all())
+    for xi, i in zip(x, expected):
+        if i < 0:
+            i = None
+        assert(find_discrete_state(xi, ppp) == i)
+    
+    # saved with the partition
+    ppp2 = pickle.loads(pickle.dumps(ppp))
+    assert((ppp2.index.find_many(x) == expected).all())
+
+def find_adjacent_regions_test():
+    state_space = pc.box2poly([[0., 4.], [0., 3.]])
+    cont_props = {
+        'a': pc.box2poly([[0., 1.], [0., 1.]]),
+        'b': pc.box2poly([[1.5, 3.], [1., 2.5]]),
+        'c': pc.box2poly([[3., 4.], [0., 0.5]])
+    }
+    ppp = prop2part(state_space, cont_props)
+    ppp, new2old = part2convex(ppp)
+    
+    adj = find_adjacent_regions(ppp.regions)
+    assert((adj != pc.find_adjacent_regions(ppp)).nnz == 0)
+    
+    # pruned by adjacency of parents
+    adj = find_adjacent_regions(ppp.regions, range(len(ppp)), ppp.adj)
+    assert((adj != ppp.adj).nnz == 0)
+
+def add_grid_test():
+    state_space = pc.box2poly([[0., 3.], [0., 2.]])
+    cont_props = {
+        'home': pc.box2poly([[0., 1.], [0., 1.]]),
+        'lot': pc.box2poly([[2., 3.], [1., 2.]]),
+        'tri': pc.Polytope(np.array([[1., 1.], [-1., 0.], [0., -1.]]),
+                           np.array([2.3, -0.5, -0.2]))
+    }
+    ppp = prop2part(state_space, cont_props)
+    ppp.build_index()
+    grid = add_grid(ppp, grid_size=0.3)
+    
+    # each cell is the intersection of a grid box with a region
+    parents = []
+    for cell in grid:
+        rc, x = pc.cheby_ball(cell)
+        i = find_discrete_state(x, ppp)
+        assert(cell.props == ppp.regions[i].props)
+        assert(cell <= ppp.regions[i])
+        parents.append(i)
+    
+    adj = find_adjacent_regions(grid.regions, parents, ppp.adj)
+    assert((adj != grid.adj).nnz == 0)
+    
+    # same cells, props and adjacency as intersecting each box
+    # with each region, and testing all pairs of cells
+    cells, cell_parents, cell_adj = grid_per_cell(ppp, 0.3)
+    assert(len(grid) == len(cells))
+    assert(parents == cell_parents)
+    for cell, ref in zip(grid, cells):
+        assert(cell.props == ref.props)
+        assert(np.allclose(cell.bounding_box[0], ref.bounding_box[0]))
+        assert(np.allclose(cell.bounding_box[1], ref.bounding_box[1]))
+        assert(cell == ref)
+    assert((grid.adj.toarray() == cell_adj).all())
+
+def grid_per_cell(ppp, grid_size, abs_tol=1e-10):
+    """Return cells, their parents and adjacency of C{add_grid},
+    by intersecting each grid box with each region of 2d C{ppp}.
+    """
+    lo, hi = ppp.domain.bounding_box
+    intervals = [
+        compute_interval(float(lo[j]), float(hi[j]), grid_size, abs_tol)
+        for j in xrange(2)
+    ]
+    cells = []
+    parents = []
+    for box in product_interval(intervals[0], intervals[1]):
+        box = pc.box2poly([box[0:2], box[2:4]])
+        for j, region in enumerate(ppp.regions):
+            isect = box.intersect(region, abs_tol)
+            rc, xc = pc.cheby_ball(isect)
+            if rc <= abs_tol / 2:
+                continue
+            if len(isect) == 0:
+                isect = pc.Region([isect], [])
+            isect.props = region.props.copy()
+            cells.append(isect)
+            parents.append(j)
+    n = len(cells)
+    adj = np.eye(n, dtype=int)
+    for i in xrange(n):
+        for j in xrange(i + 1, n):
+            pi = parents[i]
+            pj = parents[j]
+            if pi != pj and ppp.adj[pi, pj] != 1:
+                continue
+            if pc.is_adjacent(cells[i], cells[j]):
+                adj[i, j] = 1
+                adj[j, i] = 1
+    return cells, parents, adj
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 """Tests for the interface with slugs."""
+import json
 import logging
 logger = logging.getLogger(__name__)
 from tulip.interfaces import slugs
@@ -36,6 +37,30 @@ def bitfields_to_ints_test():
         assert m == {'a': n}
 
 
+def load_strategy_test():
+    env_vars = {'x': 'boolean'}
+    sys_vars = {'a': (0, 5)}
+    bitvars = ['x', 'a@0.0.5', 'a@1', 'a@2']
+    nodes = {0: ([1, 1, 0, 1], [1]),
+             1: ([0, 0, 1, 0], [0, 1]),
+             2: ([1, 0, 0, 0], [])}
+    out = json.dumps({
+        'version': 0,
+        'variables': bitvars,
+        'nodes': {str(u): {'rank': 0, 'state': state, 'trans': trans}
+                  for u, (state, trans) in nodes.iteritems()}})
+    A = slugs._load_strategy(out, env_vars, sys_vars)
+    assert len(A) == 3
+    vrs = dict(env_vars)
+    vrs.update(sys_vars)
+    for u, (state, trans) in nodes.iteritems():
+        i = A.ids.index(u)
+        int_state = slugs._bitfields_to_ints(dict(zip(bitvars, state)), vrs)
+        assert A.state(i) == int_state
+        assert [A.ids[j] for j in A.successors(i)] == trans
+    assert A.state(A.ids.index(0)) == {'x': 1, 'a': 5}
+
+
 class basic_test(jtlvint_test.basic_test):
     def setUp(self):
         super(basic_test, self).setUp()
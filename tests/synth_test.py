@@ -4,10 +4,12 @@ Tests for the tulip.synth module.
 import logging
 logging.getLogger('tulip').setLevel(logging.ERROR)
 logging.getLogger('tulip.interfaces.gr1c').setLevel(logging.DEBUG)
+import networkx as nx
 from nose.tools import assert_raises
 import numpy as np
 from scipy import sparse as sp
 from tulip import spec, synth, transys
+from tulip.interfaces import gr1c
 
 
 def sys_fts_2_states():
@@ -628,3 +630,86 @@ class synthesize_test:
 
     def test_unrealizable(self):
         assert synth.synthesize("gr1c", self.trivial_unreachable) is None
+
+    def test_gr1c_batch(self):
+        jobs = [(self.f_triv, None, None, dict()),
+                (self.trivial_unreachable, None, None, dict()),
+                (self.f_triv, None, None, {'rm_deadends': False})]
+        r = dict((i, (ctrl, error)) for i, ctrl, error in
+                 synth.synthesize_batch("gr1c", jobs, n_jobs=2))
+        assert set(r) == {0, 1, 2}
+        for i, (ctrl, error) in r.iteritems():
+            assert error is None, error
+        assert isinstance(r[0][0], transys.MealyMachine)
+        assert r[1] == (None, None)
+        assert isinstance(r[2][0], transys.MealyMachine)
+
+
+def test_batch_errors():
+    jobs = [(spec.GRSpec(sys_vars="y", sys_prog="z"), None, None, dict()),
+            (spec.GRSpec(sys_vars="y"), None, None, dict())]
+    r = list(synth.is_realizable_batch("no such solver", jobs, n_jobs=1))
+    assert [i for i, ctrl, error in r] == [0, 1]
+    for i, ctrl, error in r:
+        assert ctrl is None
+        assert 'Traceback' in error
+
+
+def test_share_asts():
+    sys = sys_fts_2_states()
+    asts = dict()
+    for prog in ['home', '!home', 'home']:
+        f = spec.GRSpec(sys_vars={'c': (0, 3)}, sys_prog=prog)
+        specs = synth._spec_plus_sys(f, None, sys, False, False,
+                                     False, False)
+        shared = synth._spec_plus_sys(f, None, sys, False, False,
+                                      False, False)
+        synth._share_asts(shared, asts)
+        assert (spec.translate(shared, 'gr1c') ==
+                spec.translate(specs, 'gr1c'))
+
+
+
+def test_strategy2mealy_compact():
+    f = spec.GRSpec(env_vars={'x': 'boolean'},
+                    sys_vars={'loc': ['a', 'b', 'c']},
+                    env_init=['x'], sys_init=['loc != "c"'])
+    A = nx.DiGraph()
+    A.add_node(0, state={'x': 1, 'loc': 0})
+    A.add_node(1, state={'x': 1, 'loc': 0})
+    A.add_node(2, state={'x': 0, 'loc': 2})
+    A.add_node(3, state={'x': 1, 'loc': 2})
+    A.add_edges_from([(0, 2), (1, 3), (2, 0)])
+    mealy = synth.strategy2mealy(A, f)
+    compact = synth.strategy2mealy(A, f, compact=True)
+    assert isinstance(compact, transys.CompactMealy)
+    # a single initial reaction per valuation
+    assert compact.successors('Sinit') == [0, 2]
+    assert (compact.reaction('Sinit', {'x': 1}) ==
+            mealy.reaction('Sinit', {'x': 1}))
+    assert compact.reaction(2, {'x': 1}) == (0, {'loc': 'a'})
+    with assert_raises(Exception):
+        compact.reaction(2, {'x': 1, 'y': 0})
+    edges = sorted(mealy.transitions(data=True))
+    assert sorted(compact.transitions(data=True)) == edges
+    strategy = gr1c.CompactStrategy.from_networkx(A)
+    assert sorted(
+        synth.strategy2mealy(strategy, f).transitions(data=True)) == edges
+    mealy.remove_deadends()
+    compact.remove_deadends()
+    assert sorted(compact.states) == sorted(mealy.states)
+    assert sorted(compact.transitions(data=True)) == sorted(
+        mealy.transitions(data=True))
+
+
+def test_compact_remove_deadends_initial():
+    # the dead end is at the index that Sinit has after removal
+    compact = transys.CompactMealy(
+        states=['x', 'd', 'Sinit'], initial=['Sinit'], ports=['a'],
+        values=np.array([[0], [1], [0]]),
+        indptr=np.array([0, 1, 1, 3]), indices=np.array([0, 0, 1]),
+        inputs={'a': {0, 1}}, outputs=dict())
+    compact.remove_deadends()
+    assert compact.states == ['x', 'Sinit']
+    assert compact.initial == ['Sinit']
+    assert compact.successors('Sinit') == ['x']
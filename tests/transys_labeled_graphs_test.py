@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 """Tests for transys.labeled_graphs (part of transys subpackage)"""
+import pickle
+
 from nose.tools import raises, assert_raises
+import scipy.sparse as sp
 from tulip.transys import labeled_graphs
 from tulip.transys.mathset import PowerSet, MathSet
 from tulip.transys.transys import FTS
@@ -135,6 +138,16 @@ class Transitions_test:
                                                                        (1, 4),
                                                                        (2, 4)])
 
+    def test_add_adj(self):
+        adj = sp.lil_matrix((3, 3))
+        adj[0, 1] = 1
+        adj[1, 2] = 1
+        adj[2, 2] = 1
+        self.T.add_adj(adj, [1, 3, 5])
+        assert set([t for t in self.T()]) == set([(1, 3), (3, 5), (5, 5)])
+        # the unlabeled transition 1 -> 3 exists
+        assert_raises(Exception, self.T.add_adj, adj, [1, 3, 5])
+
     def test_remove(self):
         # This also tests remove_from
         self.T.add_from([(1, 2), (1, 3), (4, 3), (3, 2)], check=False)
@@ -327,3 +340,112 @@ def test_remove_deadends():
 
     g.remove_deadends()
     assert(len(g) == 0)
+
+
+def test_add_edges_from_labels():
+    ts = FTS()
+    ts.states.add_from([0, 1, 2])
+    ts.sys_actions.add_from(['a', 'b'])
+    adj = sp.lil_matrix((3, 3))
+    adj[0, 1] = 1
+    adj[0, 2] = 1
+    ts.transitions.add_adj(adj, [0, 1, 2], sys_actions='a')
+    ts.transitions.add_adj(adj, [0, 1, 2], sys_actions='b')
+    # already added, so skipped
+    ts.transitions.add_adj(adj, [0, 1, 2], sys_actions='a')
+    assert len(ts.transitions) == 4
+    assert_raises(ValueError, ts.transitions.add_adj,
+                  adj, [0, 1, 2], sys_actions='c')
+    # each transition has its own label
+    d1, d2 = [d for _, _, d in ts.edges_iter([0], data=True)
+              if d['sys_actions'] == 'a']
+    assert d1 is not d2
+    d1['sys_actions'] = 'b'
+    assert d2['sys_actions'] == 'a'
+    assert_raises(ValueError, d2.__setitem__, 'sys_actions', 'c')
+    # equal label values of different types are kept apart
+    g = labeled_graphs.LabeledDiGraph()
+    g.add_nodes_from([0, 1])
+    g.add_edges_from([(0, 1, {'x': 0, 'y': True}),
+                      (1, 0, {'x': 0, 'y': 1})], check=False)
+    assert g[0][1][0]['y'] is True
+    assert g[1][0][0]['y'] is 1
+
+
+def test_index_labels():
+    ts = FTS()
+    ts.atomic_propositions.add_from(['p', 'q'])
+    ts.sys_actions.add_from(['a', 'b'])
+    ts.states.add_from([0, 1, 2])
+    ts.index_labels()
+    ts.states.add(0, ap={'p'})
+    ts.states.add(1, ap={'p', 'q'})
+    ts.transitions.add_comb([0, 1], [1, 2], sys_actions='a')
+    ts.transitions.add(2, 0, sys_actions='b')
+    ts.transitions.add(2, 1)
+
+    def found(*args, **kw):
+        return {s for s, d in ts.states.find(*args, **kw)}
+
+    def found_edges(*args, **kw):
+        return {(u, v) for u, v, d in ts.transitions.find(*args, **kw)}
+
+    assert found(ap={'p'}) == {0}
+    assert found([1, 2], ap={'p', 'q'}) == {1}
+    # unlabeled transitions match any label
+    assert found_edges(sys_actions='b') == {(2, 0), (2, 1)}
+    assert found_edges([0], sys_actions='a') == {(0, 1), (0, 2)}
+    # relabel and remove
+    ts.states.add(0, ap={'q'})
+    assert found(ap={'p'}) == set()
+    ts.remove_edge(0, 1)
+    ts.states.remove(2)
+    assert found_edges(sys_actions='a') == {(1, 1)}
+    # same results as scanning
+    ts.index_labels(enable=False)
+    assert found_edges(sys_actions='a') == {(1, 1)}
+    assert found(ap={'q'}) == {0}
+
+
+def test_pickle_old_format():
+    """Load graphs pickled without the label index."""
+    ts = FTS()
+    ts.atomic_propositions.add('p')
+    ts.states.add_from([0, 1])
+    ts.states.add(0, ap={'p'})
+    ts.transitions.add(0, 1)
+    # as pickled before index_labels
+    del ts.__dict__['_node_label_index']
+    del ts.__dict__['_edge_label_index']
+    del ts.__dict__['_label_values']
+    del ts.__dict__['compact_labels']
+    ts = pickle.loads(pickle.dumps(ts))
+    assert {s for s, d in ts.states.find(ap={'p'})} == {0}
+    assert {(u, v) for u, v, d in ts.transitions.find([0])} == {(0, 1)}
+    ts.remove_node(1)
+    assert set(ts) == {0}
+    ts.states.add(1, ap={'p'})
+    ts.transitions.add(1, 0)
+    assert ts.node[0]['ap'] == ts.node[1]['ap'] == {'p'}
+
+
+def test_compact_labels():
+    ts = FTS()
+    ts.atomic_propositions.add_from(['p', 'q'])
+    ts.sys_actions.add_from(['a0', 'b'])
+    ts.states.add_from([0, 1, 2])
+    # equal strings are shared
+    ts.transitions.add(0, 1, sys_actions='a' + str(0))
+    ts.transitions.add(1, 2, sys_actions='a' + str(0))
+    assert ts[0][1][0]['sys_actions'] is ts[1][2][0]['sys_actions']
+    assert isinstance(ts.node[0]['ap'], set)
+    ts.compact_labels = True
+    ts.states.add(0, ap={'p'})
+    ts.states.add(1, ap={'p'})
+    ts.states.add(2)
+    assert ts.node[0]['ap'] is ts.node[1]['ap']
+    assert ts.node[0]['ap'] == {'p'}
+    assert ts.node[2]['ap'] == frozenset()
+    assert {s for s, d in ts.states.find(ap={'p'})} == {0, 1}
+    ts.clear()
+    assert not ts._label_values
@@ -3,9 +3,11 @@
 Tests for transys.machines (part of transys subpackage)
 """
 import logging
+import pickle
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 
+from nose.tools import assert_raises
 from tulip.transys import machines
 
 def test_strip_ports():
@@ -42,3 +44,49 @@ def test_strip_ports():
         assert(u == x)
         assert(v == y)
         assert(d == b)
+
+def test_reaction_index():
+    mealy = machines.MealyMachine()
+    mealy.add_inputs({'door':{'open', 'closed'}})
+    mealy.add_outputs({'led':{'on', 'off'}})
+    mealy.add_nodes_from(xrange(3))
+    mealy.states.initial.add(0)
+    
+    mealy.add_edge(0, 1, door='open', led='on')
+    mealy.add_edge(0, 2, door='closed', led='off')
+    mealy.add_edge(1, 0, door='open', led='off')
+    assert(mealy.reaction(0, {'door':'open'}) == (1, {'led':'on'}))
+    assert(mealy.reaction(0, {'door':'closed'}) == (2, {'led':'off'}))
+    
+    # the index follows changes of the machine
+    mealy.remove_edge(0, 1)
+    mealy.add_edge(0, 2, door='open', led='off')
+    assert(mealy.reaction(0, {'door':'open'}) == (2, {'led':'off'}))
+    mealy.add_edge(0, 1, door='open', led='on')
+    with assert_raises(Exception):
+        mealy.reaction(0, {'door':'open'})
+    mealy.states.remove(2)
+    assert(mealy.reaction(0, {'door':'open'}) == (1, {'led':'on'}))
+    with assert_raises(Exception):
+        mealy.reaction(0, {'door':'closed'})
+    with assert_raises(Exception):
+        mealy.reaction(0, {'door':'open', 'window':'open'})
+    
+    states, outputs = machines.guided_run(
+        mealy, 0, {'door':['open', 'open', 'open']})
+    assert(states == [1, 0, 1])
+    assert(outputs == {'led':['on', 'off', 'on']})
+
+def test_pickle_old_format():
+    mealy = machines.MealyMachine()
+    mealy.add_inputs({'door':{'open', 'closed'}})
+    mealy.add_outputs({'led':{'on', 'off'}})
+    mealy.add_nodes_from(xrange(2))
+    mealy.add_edge(0, 1, door='open', led='on')
+    # as pickled before the reaction index
+    del mealy.__dict__['_reaction_index']
+    del mealy.__dict__['_reaction_ports']
+    mealy = pickle.loads(pickle.dumps(mealy))
+    assert(mealy.reaction(0, {'door':'open'}) == (1, {'led':'on'}))
+    mealy.add_edge(1, 0, door='closed', led='off')
+    assert(mealy.reaction(1, {'door':'closed'}) == (0, {'led':'off'}))
@@ -4,6 +4,8 @@ Tests for transys.mathset (part of transys subpackage)
 """
 from nose.tools import raises
 from collections import Iterable
+import copy
+import pickle
 
 from tulip.transys.mathset import MathSet, SubSet, PowerSet, TypedDict
 from tulip.transys.mathset import compare_lists, unique, contains_multiple
@@ -244,3 +246,12 @@ class TypedDict_test():
         
         d['human'] = 'Bob'
         assert(d['human'] == 'Bob')
+
+    def test_pickle(self):
+        d = self.d
+        d['animal'] = 'cat'
+        assert not hasattr(d, '__dict__')
+        for e in [copy.deepcopy(d), pickle.loads(pickle.dumps(d)),
+                  pickle.loads(pickle.dumps(d, 2))]:
+            assert e == d
+            assert e.allowed_values == d.allowed_values
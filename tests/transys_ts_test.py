@@ -127,3 +127,69 @@ def on_the_fly_test():
     check_prodba(prodba)
     prodba.save('prodba_full.pdf')
 
+
+
+def _ba():
+    """Return the BA of L{ba_test}."""
+    ba = trs.BA()
+    ba.atomic_propositions |= {'p'}
+    ba.states.add_from({'q0', 'q1'})
+    ba.states.initial.add('q0')
+    ba.states.accepting.add('q1')
+    ba.transitions.add('q0', 'q1', letter={'p'})
+    ba.transitions.add('q1', 'q1', letter={'p'})
+    ba.transitions.add('q1', 'q0', letter=set())
+    ba.transitions.add('q0', 'q0', letter=set())
+    return ba
+
+
+def implicit_product_test():
+    ts = ts_test()
+    ba = _ba()
+    prod = trs.ImplicitProduct(ts, ba)
+    assert(set(prod.initial()) == {('s0', 'q1'), ('s1', 'q0')})
+    assert(prod.successors(('s3', 'q0')) == [('s0', 'q1')])
+    assert(prod.is_accepting(('s0', 'q1')))
+    states = {('s0', 'q1'), ('s1', 'q0'),
+              ('s2', 'q0'), ('s3', 'q0')}
+    for order in ('dfs', 'bfs'):
+        assert(prod.search(order) == (states, True))
+    reached, complete = prod.search(max_states=3)
+    assert(len(reached) == 3 and not complete)
+    # stop at the first accepting state expanded
+    visited = list()
+
+    def visit(sq, next_sqs):
+        visited.append(sq)
+        return prod.is_accepting(sq)
+
+    reached, complete = prod.search(visit=visit, start=[('s1', 'q0')])
+    assert(visited == [('s1', 'q0'), ('s2', 'q0'),
+                       ('s3', 'q0'), ('s0', 'q1')])
+    assert(not complete)
+    # materialized
+    prodba = trs.OnTheFlyProductAutomaton(ba, ts)
+    assert(prodba.add_all_states())
+    check_prodba(prodba)
+
+
+def find_accepting_lasso_test():
+    ts = ts_test()
+    ba = _ba()
+    lasso, stats = trs.products.find_accepting_lasso(ts, ba)
+    prefix, cycle = lasso
+    assert(sorted(cycle) == ['s0', 's1', 's2', 's3'])
+    run = prefix + cycle
+    assert(run[0] in ts.states.initial)
+    for u, v in zip(run, run[1:]) + [(cycle[-1], cycle[0])]:
+        assert(ts.has_edge(u, v))
+    assert(stats['complete'] and stats['states'] <= 4)
+    # s0 not visited infinitely often
+    ts.remove_edge('s3', 's0')
+    ts.transitions.add('s3', 's1')
+    lasso, stats = trs.products.find_accepting_lasso(ts, ba)
+    assert(lasso is None)
+    assert(stats['complete'] and stats['states'] == 4)
+    lasso, stats = trs.products.find_accepting_lasso(ts, ba, max_states=2)
+    assert(lasso is None)
+    assert(not stats['complete'] and stats['states'] == 2)
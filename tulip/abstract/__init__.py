@@ -39,13 +39,17 @@ from .discretization import (
     discretize, discretize_switched,
     multiproc_discretize_switched
 )
-from .feasible import is_feasible, solve_feasible
+from .feasible import is_feasible, solve_feasible, FeasibilityCache
 
 from .prop2partition import (
     prop2part, part2convex,
     pwa_partition, add_grid,
-    PropPreservingPartition, PPP
+    PropPreservingPartition, PPP, RegionIndex
 )
 
-from .find_controller import get_input, find_discrete_state
+from .find_controller import (
+    get_input, find_discrete_state, find_discrete_states,
+    TransitionController, ControllerCache,
+    are_seqs_inside, sample_disturbance
+)
     
\ No newline at end of file
@@ -43,6 +43,12 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
+import heapq
+import hashlib
+import pickle
+import shutil
+import tempfile
+import traceback
 import warnings
 import pprint
 from copy import deepcopy
@@ -57,8 +63,8 @@ from tulip import transys as trs
 from tulip.hybrid import LtiSysDyn, PwaSysDyn
 
 from .prop2partition import (PropPreservingPartition,
-                             pwa_partition, part2convex)
-from .feasible import is_feasible, solve_feasible
+                             pwa_partition, part2convex, RegionIndex)
+from .feasible import is_feasible, solve_feasible, _fingerprint
 from .plot import plot_ts_on_partition
 
 # inline imports:
@@ -457,7 +463,8 @@ def discretize(
     trans_length=1, remove_trans=False, 
     abs_tol=1e-7,
     plotit=False, save_img=False, cont_props=None,
-    plot_every=1
+    plot_every=1, n_jobs=1, cache=None,
+    checkpoint=None, checkpoint_every=10, resume_from=None
 ):
     """Refine the partition and establish transitions
     based on reachability analysis.
@@ -508,14 +515,55 @@ def discretize(
     @param cont_props: continuous propositions to plot
     @type cont_props: list of C{Polytope}
     
+    @param n_jobs: number of worker processes that compute
+        reachable sets. If > 1, then all pending pairs of cells
+        are solved speculatively in parallel, and the results are
+        committed in the order of the serial algorithm, so the
+        abstraction is identical to the serial one. Pairs with a
+        cell that was split in the meantime are solved again.
+        If C{None}, then one worker per CPU is used.
+    @type n_jobs: int >= 1 or C{None},
+        default = 1
+    
+    @param cache: store of reachable sets from previous runs.
+        Results found there are not recomputed.
+    @type cache: L{FeasibilityCache}
+    
+    @param checkpoint: file where the refinement state is saved
+        every C{checkpoint_every} iterations, and at the end.
+        Only the cells changed since the previous save are
+        appended to the file.
+    @type checkpoint: str
+    
+    @param resume_from: checkpoint file of a previous call with
+        the same arguments, from which to continue the refinement.
+        Unless C{checkpoint} is given, the refinement continues
+        to be saved to this file.
+    @type resume_from: str
+    
     @rtype: L{AbstractPwa}
     """
     if use_all_horizon:
         raise ValueError('discretize() with use_all_horizon=True is still '
                          'under development\nand currently unavailable.')
+    if n_jobs is None:
+        n_jobs = mp.cpu_count()
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be >= 1, got: ' + str(n_jobs))
 
     start_time = os.times()[0]
     
+    if checkpoint is None:
+        checkpoint = resume_from
+    if checkpoint is not None:
+        fingerprint = _discretize_fingerprint(
+            part, ssys, N=N, min_cell_volume=min_cell_volume,
+            closed_loop=closed_loop, conservative=conservative,
+            max_num_poly=max_num_poly, use_all_horizon=use_all_horizon,
+            trans_length=trans_length, remove_trans=remove_trans,
+            abs_tol=abs_tol
+        )
+    
     orig_ppp = part
     min_cell_volume = (min_cell_volume /np.finfo(np.double).eps
         *np.finfo(np.double).eps)
@@ -550,7 +598,7 @@ def discretize(
             else:
                 raise Exception("discretize: "
                     "problem in convexification")
-        orig = range(len(orig_list))
+        orig = list(range(len(orig_list)))
     
     # Cheby radius of disturbance set
     # (defined within the loop for pwa systems)
@@ -560,26 +608,24 @@ def discretize(
         else:
             rd = 0.
     
-    # Initialize matrix for pairs to check
-    IJ = part.adj.copy()
-    IJ = IJ.todense()
-    IJ = np.array(IJ)
-    logger.debug("\n Starting IJ: \n" + str(IJ) )
-    
-    # next line omitted in discretize_overlap
-    IJ = reachable_within(trans_length, IJ,
-                          np.array(part.adj.todense()) )
-    
-    # Initialize output
+    # Adjacency and transitions are stored as lists of sets:
+    #
+    #   - j in adj[i] iff cells i, j are adjacent
+    #   - i in transitions[j] iff cell j is reachable from cell i
+    #
+    # so transitions[j] is row j of the transition matrix.
     num_regions = len(part)
-    transitions = np.zeros(
-        [num_regions, num_regions],
-        dtype = int
-    )
+    adj = _matrix_to_sets(part.adj)
+    transitions = [set() for k in xrange(num_regions)]
     sol = deepcopy(part.regions)
-    adj = part.adj.copy()
-    adj = adj.todense()
-    adj = np.array(adj)
+    
+    # Initialize queue of pairs (j, i) to check
+    # next line omitted in discretize_overlap
+    IJ = _PairQueue()
+    for k in xrange(num_regions):
+        for r in _reachable_within(k, adj, trans_length):
+            IJ.add((k, r))
+    logger.debug("\n Starting IJ: \n" + str(IJ) )
     
     # next 2 lines omitted in discretize_overlap
     if ispwa:
@@ -614,315 +660,303 @@ def discretize(
     
     progress = list()
     
-    # Do the abstraction
-    while np.sum(IJ) > 0:
-        ind = np.nonzero(IJ)
-        # i,j swapped in discretize_overlap
-        i = ind[1][0]
-        j = ind[0][0]
-        IJ[j, i] = 0
-        si = sol[i]
-        sj = sol[j]
-        
-        si_tmp = deepcopy(si)
-        sj_tmp = deepcopy(sj)
-        
-        #num_new_reg[i] += 1
-        #print(num_new_reg)
-        
+    def feasibility_args(i, j):
         if ispwa:
             ss = ssys.list_subsys[subsys_list[i]]
-            if len(ss.E) > 0:
-                rd, xd = pc.cheby_ball(ss.Wset)
-            else:
-                rd = 0.
-        
+        else:
+            ss = ssys
         if conservative:
-            # Don't use trans_set
             trans_set = None
         else:
-            # Use original cell as trans_set
             trans_set = orig_list[orig[i]]
-        
-        S0 = solve_feasible(
-            si, sj, ss, N, closed_loop,
-            use_all_horizon, trans_set, max_num_poly
+        return (sol[i], sol[j], ss, N, closed_loop,
+                use_all_horizon, trans_set, max_num_poly, cache)
+    
+    if resume_from is not None:
+        records, offset = _Checkpoint.load(resume_from, fingerprint)
+        iter_count = _replay_checkpoint(
+            records, sol, adj, transitions, IJ,
+            orig, subsys_list, progress
         )
-        
-        msg = '\n Working with partition cells: ' + str(i) + ', ' + str(j)
-        logger.info(msg)
-        
-        msg = '\t' + str(i) +' (#polytopes = ' +str(len(si) ) +'), and:\n'
-        msg += '\t' + str(j) +' (#polytopes = ' +str(len(sj) ) +')\n'
-        
-        if ispwa:
-            msg += '\t with active subsystem: '
-            msg += str(subsys_list[i]) + '\n'
+        logger.info('resumed from: ' + str(resume_from) +
+                    ', at iteration: ' + str(iter_count))
+        if checkpoint != resume_from:
+            shutil.copyfile(resume_from, checkpoint)
+    else:
+        offset = None
+    
+    if checkpoint is not None:
+        saver = _Checkpoint(checkpoint, fingerprint, checkpoint_every)
+        saver.open(orig, subsys_list, offset)
+    else:
+        saver = None
+    
+    if n_jobs > 1:
+        speculative = _SpeculativeFeasibility(n_jobs)
+    else:
+        speculative = None
+    
+    # Do the abstraction
+    try:
+        while IJ:
+            # i,j swapped in discretize_overlap
+            j, i = IJ.pop()
+            si = sol[i]
+            sj = sol[j]
             
-        msg += '\t Computed reachable set S0 with volume: '
-        msg += str(S0.volume) + '\n'
-        
-        logger.debug(msg)
-        
-        #logger.debug('si \cap s0')
-        isect = si.intersect(S0)
-        vol1 = isect.volume
-        risect, xi = pc.cheby_ball(isect)
-        
-        #logger.debug('si \ s0')
-        diff = si.diff(S0)
-        vol2 = diff.volume
-        rdiff, xd = pc.cheby_ball(diff)
-        
-        # if pc.is_fulldim(pc.Region([isect]).intersect(diff)):
-        #     logging.getLogger('tulip.polytope').setLevel(logging.DEBUG)
-        #     diff = pc.mldivide(si, S0, save=True)
-        #
-        #     ax = S0.plot()
-        #     ax.axis([0.0, 1.0, 0.0, 2.0])
-        #     ax.figure.savefig('./img/s0.pdf')
-        #
-        #     ax = si.plot()
-        #     ax.axis([0.0, 1.0, 0.0, 2.0])
-        #     ax.figure.savefig('./img/si.pdf')
-        #
-        #     ax = isect.plot()
-        #     ax.axis([0.0, 1.0, 0.0, 2.0])
-        #     ax.figure.savefig('./img/isect.pdf')
-        #
-        #     ax = diff.plot()
-        #     ax.axis([0.0, 1.0, 0.0, 2.0])
-        #     ax.figure.savefig('./img/diff.pdf')
-        #
-        #     ax = isect.intersect(diff).plot()
-        #     ax.axis([0.0, 1.0, 0.0, 2.0])
-        #     ax.figure.savefig('./img/diff_cap_isect.pdf')
-        #
-        #     logger.error('Intersection \cap Difference != \emptyset')
-        #
-        #     assert(False)
-
-        if vol1 <= min_cell_volume:
-            logger.warning('\t too small: si \cap Pre(sj), ' +
-                           'so discard intersection')
-        if vol1 <= min_cell_volume and isect:
-            logger.warning('\t discarded non-empty intersection: ' +
-                           'consider reducing min_cell_volume')
-        if vol2 <= min_cell_volume:
-            logger.warning('\t too small: si \ Pre(sj), so not reached it')
-        
-        # We don't want our partitions to be smaller than the disturbance set
-        # Could be a problem since cheby radius is calculated for smallest
-        # convex polytope, so if we have a region we might throw away a good
-        # cell.
-        if (vol1 > min_cell_volume) and (risect > rd) and \
-           (vol2 > min_cell_volume) and (rdiff > rd):
-        
-            # Make sure new areas are Regions and add proposition lists
-            if len(isect) == 0:
-                isect = pc.Region([isect], si.props)
-            else:
-                isect.props = si.props.copy()
-        
-            if len(diff) == 0:
-                diff = pc.Region([diff], si.props)
+            si_tmp = deepcopy(si)
+            sj_tmp = deepcopy(sj)
+            
+            #num_new_reg[i] += 1
+            #print(num_new_reg)
+            
+            if ispwa:
+                ss = ssys.list_subsys[subsys_list[i]]
+                if len(ss.E) > 0:
+                    rd, xd = pc.cheby_ball(ss.Wset)
+                else:
+                    rd = 0.
+            
+            if conservative:
+                # Don't use trans_set
+                trans_set = None
             else:
-                diff.props = si.props.copy()
-        
-            # replace si by intersection (single state)
-            isect_list = pc.separate(isect)
-            sol[i] = isect_list[0]
+                # Use original cell as trans_set
+                trans_set = orig_list[orig[i]]
             
-            # cut difference into connected pieces
-            difflist = pc.separate(diff)
+            if speculative is None:
+                S0 = solve_feasible(
+                    si, sj, ss, N, closed_loop,
+                    use_all_horizon, trans_set, max_num_poly, cache
+                )
+            else:
+                S0 = speculative.solve(i, j, IJ, sol, feasibility_args)
             
-            difflist += isect_list[1:]
-            n_isect = len(isect_list) -1
+            msg = '\n Working with partition cells: ' + str(i) + ', ' + str(j)
+            logger.info(msg)
             
-            num_new = len(difflist)
+            msg = '\t' + str(i) +' (#polytopes = ' +str(len(si) ) +'), and:\n'
+            msg += '\t' + str(j) +' (#polytopes = ' +str(len(sj) ) +')\n'
             
-            # add each piece, as a new state
-            for region in difflist:
-                sol.append(region)
+            if ispwa:
+                msg += '\t with active subsystem: '
+                msg += str(subsys_list[i]) + '\n'
                 
-                # keep track of PWA subsystems map to new states
-                if ispwa:
-                    subsys_list.append(subsys_list[i])
-            n_cells = len(sol)
-            new_idx = xrange(n_cells-1, n_cells-num_new-1, -1)
+            msg += '\t Computed reachable set S0 with volume: '
+            msg += str(S0.volume) + '\n'
             
-            """Update transition matrix"""
-            transitions = np.pad(transitions, (0,num_new), 'constant')
+            logger.debug(msg)
             
-            transitions[i, :] = np.zeros(n_cells)
-            for r in new_idx:
-                #transitions[:, r] = transitions[:, i]
-                # All sets reachable from start are reachable from both part's
-                # except possibly the new part
-                transitions[i, r] = 0
-                transitions[j, r] = 0            
+            #logger.debug('si \cap s0')
+            isect = si.intersect(S0)
+            vol1 = isect.volume
+            risect, xi = pc.cheby_ball(isect)
             
-            # sol[j] is reachable from intersection of sol[i] and S0
-            if i != j:
-                transitions[j, i] = 1
-                
-                # sol[j] is reachable from each piece os S0 \cap sol[i]
-                #for k in xrange(n_cells-n_isect-2, n_cells):
-                #    transitions[j, k] = 1
+            #logger.debug('si \ s0')
+            diff = si.diff(S0)
+            vol2 = diff.volume
+            rdiff, xd = pc.cheby_ball(diff)
+            
+            # if pc.is_fulldim(pc.Region([isect]).intersect(diff)):
+            #     logging.getLogger('tulip.polytope').setLevel(logging.DEBUG)
+            #     diff = pc.mldivide(si, S0, save=True)
+            #
+            #     ax = S0.plot()
+            #     ax.axis([0.0, 1.0, 0.0, 2.0])
+            #     ax.figure.savefig('./img/s0.pdf')
+            #
+            #     ax = si.plot()
+            #     ax.axis([0.0, 1.0, 0.0, 2.0])
+            #     ax.figure.savefig('./img/si.pdf')
+            #
+            #     ax = isect.plot()
+            #     ax.axis([0.0, 1.0, 0.0, 2.0])
+            #     ax.figure.savefig('./img/isect.pdf')
+            #
+            #     ax = diff.plot()
+            #     ax.axis([0.0, 1.0, 0.0, 2.0])
+            #     ax.figure.savefig('./img/diff.pdf')
+            #
+            #     ax = isect.intersect(diff).plot()
+            #     ax.axis([0.0, 1.0, 0.0, 2.0])
+            #     ax.figure.savefig('./img/diff_cap_isect.pdf')
+            #
+            #     logger.error('Intersection \cap Difference != \emptyset')
+            #
+            #     assert(False)
+
+            if vol1 <= min_cell_volume:
+                logger.warning('\t too small: si \cap Pre(sj), ' +
+                               'so discard intersection')
+            if vol1 <= min_cell_volume and isect:
+                logger.warning('\t discarded non-empty intersection: ' +
+                               'consider reducing min_cell_volume')
+            if vol2 <= min_cell_volume:
+                logger.warning('\t too small: si \ Pre(sj), so not reached it')
             
-            """Update adjacency matrix"""
-            old_adj = np.nonzero(adj[i, :])[0]
+            # We don't want our partitions to be smaller than the disturbance set
+            # Could be a problem since cheby radius is calculated for smallest
+            # convex polytope, so if we have a region we might throw away a good
+            # cell.
+            if (vol1 > min_cell_volume) and (risect > rd) and \
+               (vol2 > min_cell_volume) and (rdiff > rd):
             
-            # reset new adjacencies
-            adj[i, :] = np.zeros([n_cells -num_new])
-            adj[:, i] = np.zeros([n_cells -num_new])
-            adj[i, i] = 1
+                # Make sure new areas are Regions and add proposition lists
+                if len(isect) == 0:
+                    isect = pc.Region([isect], si.props)
+                else:
+                    isect.props = si.props.copy()
             
-            adj = np.pad(adj, (0, num_new), 'constant')
+                if len(diff) == 0:
+                    diff = pc.Region([diff], si.props)
+                else:
+                    diff.props = si.props.copy()
             
-            for r in new_idx:
-                adj[i, r] = 1
-                adj[r, i] = 1
-                adj[r, r] = 1
+                # replace si by intersection (single state)
+                isect_list = pc.separate(isect)
+                sol[i] = isect_list[0]
+                
+                # cut difference into connected pieces
+                difflist = pc.separate(diff)
+                
+                difflist += isect_list[1:]
+                n_isect = len(isect_list) -1
+                
+                num_new = len(difflist)
+                
+                # add each piece, as a new state
+                for region in difflist:
+                    sol.append(region)
+                    
+                    # keep track of PWA subsystems map to new states
+                    if ispwa:
+                        subsys_list.append(subsys_list[i])
+                n_cells = len(sol)
+                new_idx = xrange(n_cells-1, n_cells-num_new-1, -1)
                 
+                touched = _update_split(
+                    i, j, new_idx, sol, adj, transitions, IJ,
+                    trans_length, remove_trans
+                )
                 if not conservative:
-                    orig = np.hstack([orig, orig[i]])
+                    orig.extend(orig[i] for r in new_idx)
+                
+                if saver is not None:
+                    saver.mark(touched, [i] + list(new_idx))
+                
+                if logger.getEffectiveLevel() <= logging.DEBUG:
+                    msg = '\n\n Updated adj: \n' + str(adj)
+                    msg += '\n\n Updated trans: \n' + str(transitions)
+                    msg += '\n\n Updated IJ: \n' + str(IJ)
+                    logger.debug(msg)
+                
+                logger.info('Divided region: ' + str(i) + '\n')
+            elif vol2 < abs_tol:
+                logger.info('Found: ' + str(i) + ' ---> ' + str(j) + '\n')
+                transitions[j].add(i)
+            else:
+                if logger.level <= logging.DEBUG:
+                    msg = '\t Unreachable: ' + str(i) + ' --X--> ' + str(j) + '\n'
+                    msg += '\t\t diff vol: ' + str(vol2) + '\n'
+                    msg += '\t\t intersect vol: ' + str(vol1) + '\n'
+                    logger.debug(msg)
+                else:
+                    logger.info('\t unreachable\n')
+                transitions[j].discard(i)
             
-            # adjacencies between pieces of isect and diff
-            for r in new_idx:
-                for k in new_idx:
-                    if r is k:
-                        continue
-                    
-                    if pc.is_adjacent(sol[r], sol[k]):
-                        adj[r, k] = 1
-                        adj[k, r] = 1
+            # check to avoid overlapping Regions
+            if debug:
+                tmp_part = PropPreservingPartition(
+                    domain=part.domain,
+                    regions=sol, adj=_sets_to_matrix(adj),
+                    prop_regions=part.prop_regions
+                )
+                assert(tmp_part.is_partition() )
             
-            msg = ''
-            if logger.getEffectiveLevel() <= logging.DEBUG:
-                msg += '\t\n Adding states ' + str(i) + ' and '
-                for r in new_idx:
-                    msg += str(r) + ' and '
-                msg += '\n'
-                logger.debug(msg)
-                        
-            for k in np.setdiff1d(old_adj, [i,n_cells-1]):
-                # Every "old" neighbor must be the neighbor
-                # of at least one of the new
-                if pc.is_adjacent(sol[i], sol[k]):
-                    adj[i, k] = 1
-                    adj[k, i] = 1
-                elif remove_trans and (trans_length == 1):
-                    # Actively remove transitions between non-neighbors
-                    transitions[i, k] = 0
-                    transitions[k, i] = 0
-                
-                for r in new_idx:
-                    if pc.is_adjacent(sol[r], sol[k]):
-                        adj[r, k] = 1
-                        adj[k, r] = 1
-                    elif remove_trans and (trans_length == 1):
-                        # Actively remove transitions between non-neighbors
-                        transitions[r, k] = 0
-                        transitions[k, r] = 0
+            n_cells = len(sol)
+            progress_ratio = 1 - float(len(IJ) ) /n_cells**2
+            progress += [progress_ratio]
             
-            """Update IJ matrix"""
-            IJ = np.pad(IJ, (0,num_new), 'constant')
-            adj_k = reachable_within(trans_length, adj, adj)
-            sym_adj_change(IJ, adj_k, transitions, i)
+            msg = '\t total # polytopes: ' + str(n_cells) + '\n'
+            msg += '\t progress ratio: ' + str(progress_ratio) + '\n'
+            logger.info(msg)
             
-            for r in new_idx:
-                sym_adj_change(IJ, adj_k, transitions, r)
+            iter_count += 1
             
-            if logger.getEffectiveLevel() <= logging.DEBUG:
-                msg = '\n\n Updated adj: \n' + str(adj)
-                msg += '\n\n Updated trans: \n' + str(transitions)
-                msg += '\n\n Updated IJ: \n' + str(IJ)
-                logger.debug(msg)
+            if saver is not None:
+                saver.mark([i, j])
+                saver.tick(
+                    iter_count, progress_ratio,
+                    sol, adj, transitions, IJ, orig, subsys_list
+                )
+            
+            # no plotting ?
+            if not plotit:
+                continue
+            if plt is None or plot_partition is None:
+                continue
+            if iter_count % plot_every != 0:
+                continue
             
-            logger.info('Divided region: ' + str(i) + '\n')
-        elif vol2 < abs_tol:
-            logger.info('Found: ' + str(i) + ' ---> ' + str(j) + '\n')
-            transitions[j,i] = 1
-        else:
-            if logger.level <= logging.DEBUG:
-                msg = '\t Unreachable: ' + str(i) + ' --X--> ' + str(j) + '\n'
-                msg += '\t\t diff vol: ' + str(vol2) + '\n'
-                msg += '\t\t intersect vol: ' + str(vol1) + '\n'
-                logger.debug(msg)
-            else:
-                logger.info('\t unreachable\n')
-            transitions[j,i] = 0
-        
-        # check to avoid overlapping Regions
-        if debug:
             tmp_part = PropPreservingPartition(
                 domain=part.domain,
-                regions=sol, adj=sp.lil_matrix(adj),
+                regions=sol, adj=_sets_to_matrix(adj),
                 prop_regions=part.prop_regions
             )
-            assert(tmp_part.is_partition() )
-        
-        n_cells = len(sol)
-        progress_ratio = 1 - float(np.sum(IJ) ) /n_cells**2
-        progress += [progress_ratio]
-        
-        msg = '\t total # polytopes: ' + str(n_cells) + '\n'
-        msg += '\t progress ratio: ' + str(progress_ratio) + '\n'
-        logger.info(msg)
-        
-        iter_count += 1
-        
-        # no plotting ?
-        if not plotit:
-            continue
-        if plt is None or plot_partition is None:
-            continue
-        if iter_count % plot_every != 0:
-            continue
-        
-        tmp_part = PropPreservingPartition(
-            domain=part.domain,
-            regions=sol, adj=sp.lil_matrix(adj),
-            prop_regions=part.prop_regions
-        )
-        
-        # plot pair under reachability check
-        ax2.clear()
-        si_tmp.plot(ax=ax2, color='green')
-        sj_tmp.plot(ax2, color='red', hatch='o', alpha=0.5)
-        plot_transition_arrow(si_tmp, sj_tmp, ax2)
-        
-        S0.plot(ax2, color='none', hatch='/', alpha=0.3)
-        fig.canvas.draw()
-        
-        # plot partition
-        ax1.clear()
-        plot_partition(tmp_part, transitions.T, ax=ax1, color_seed=23)
-        
-        # plot dynamics
-        ssys.plot(ax1, show_domain=False)
-        
-        # plot hatched continuous propositions
-        part.plot_props(ax1)
-        
-        fig.canvas.draw()
-        
-        # scale view based on domain,
-        # not only the current polytopes si, sj
-        l,u = part.domain.bounding_box
-        ax2.set_xlim(l[0,0], u[0,0])
-        ax2.set_ylim(l[1,0], u[1,0])
-        
-        if save_img:
-            fname = 'movie' +str(iter_count).zfill(3)
-            fname += '.' + file_extension
-            fig.savefig(fname, dpi=250)
-        plt.pause(1)
-
+            
+            # plot pair under reachability check
+            ax2.clear()
+            si_tmp.plot(ax=ax2, color='green')
+            sj_tmp.plot(ax2, color='red', hatch='o', alpha=0.5)
+            plot_transition_arrow(si_tmp, sj_tmp, ax2)
+            
+            S0.plot(ax2, color='none', hatch='/', alpha=0.3)
+            fig.canvas.draw()
+            
+            # plot partition
+            ax1.clear()
+            plot_partition(tmp_part, _sets_to_matrix(transitions).T.toarray(),
+                           ax=ax1, color_seed=23)
+            
+            # plot dynamics
+            ssys.plot(ax1, show_domain=False)
+            
+            # plot hatched continuous propositions
+            part.plot_props(ax1)
+            
+            fig.canvas.draw()
+            
+            # scale view based on domain,
+            # not only the current polytopes si, sj
+            l,u = part.domain.bounding_box
+            ax2.set_xlim(l[0,0], u[0,0])
+            ax2.set_ylim(l[1,0], u[1,0])
+            
+            if save_img:
+                fname = 'movie' +str(iter_count).zfill(3)
+                fname += '.' + file_extension
+                fig.savefig(fname, dpi=250)
+            plt.pause(1)
+        
+        if saver is not None:
+            saver.write(
+                iter_count, sol, adj, transitions, IJ,
+                orig, subsys_list, done=True
+            )
+    except:
+        if speculative is not None:
+            speculative.terminate()
+            speculative = None
+        raise
+    finally:
+        if speculative is not None:
+            speculative.close()
+        if saver is not None:
+            saver.close()
+    
     new_part = PropPreservingPartition(
         domain=part.domain,
-        regions=sol, adj=sp.lil_matrix(adj),
+        regions=sol, adj=_sets_to_matrix(adj),
         prop_regions=part.prop_regions
     )
     
@@ -934,7 +968,7 @@ def discretize(
     # Generate transition system and add transitions       
     ofts = trs.FTS()
     
-    adj = sp.lil_matrix(transitions.T)
+    adj = _sets_to_matrix(transitions).T.tolil()
     n = adj.shape[0]
     ofts_states = range(n)
     
@@ -967,6 +1001,9 @@ def discretize(
     print(msg)
     logger.info(msg)
     
+    if cache is not None:
+        logger.info(str(cache))
+    
     if save_img and plt is not None:
         fig, ax = plt.subplots(1, 1)
         plt.plot(progress)
@@ -1008,6 +1045,450 @@ def sym_adj_change(IJ, adj_k, transitions, i):
     IJ[i, :] = horizontal.astype(int)
     IJ[:, i] = vertical.astype(int)
 
+def _update_split(
+    i, j, new_idx, sol, adj, transitions, IJ,
+    trans_length, remove_trans
+):
+    """Update adjacency, transitions and pending pairs after a split.
+    
+    Cell C{sol[i]} has been replaced by part of itself, and the
+    cells C{new_idx} appended to C{sol}. Only the neighbors of these
+    cells are visited, so the cost does not grow with C{len(sol)}.
+    
+    For the arguments see L{discretize}.
+    
+    @return: cells whose adjacency, transitions
+        or pending pairs may have changed
+    @rtype: set
+    """
+    # update transitions
+    transitions.extend(set() for r in new_idx)
+    
+    # All sets reachable from start are reachable from both
+    # parts, but sol[i] changed, so reset transitions into it
+    transitions[i] = set()
+    
+    # sol[j] is reachable from intersection of sol[i] and S0
+    if i != j:
+        transitions[j].add(i)
+        
+        # sol[j] is reachable from each piece os S0 \cap sol[i]
+        #for k in xrange(n_cells-n_isect-2, n_cells):
+        #    transitions[j].add(k)
+    
+    # update adjacency
+    old_adj = adj[i]
+    for k in old_adj:
+        if k != i:
+            adj[k].discard(i)
+    
+    # reset new adjacencies
+    adj[i] = set([i])
+    adj.extend(set() for r in new_idx)
+    
+    for r in new_idx:
+        adj[i].add(r)
+        adj[r].add(i)
+        adj[r].add(r)
+    
+    # adjacencies between pieces of isect and diff
+    for r in new_idx:
+        for k in new_idx:
+            if r == k:
+                continue
+            
+            if pc.is_adjacent(sol[r], sol[k]):
+                adj[r].add(k)
+                adj[k].add(r)
+    
+    msg = ''
+    if logger.getEffectiveLevel() <= logging.DEBUG:
+        msg += '\t\n Adding states ' + str(i) + ' and '
+        for r in new_idx:
+            msg += str(r) + ' and '
+        msg += '\n'
+        logger.debug(msg)
+    
+    for k in sorted(old_adj):
+        if k == i:
+            continue
+        
+        # Every "old" neighbor must be the neighbor
+        # of at least one of the new
+        if pc.is_adjacent(sol[i], sol[k]):
+            adj[i].add(k)
+            adj[k].add(i)
+        elif remove_trans and (trans_length == 1):
+            # Actively remove transitions between non-neighbors
+            transitions[i].discard(k)
+            transitions[k].discard(i)
+        
+        for r in new_idx:
+            if pc.is_adjacent(sol[r], sol[k]):
+                adj[r].add(k)
+                adj[k].add(r)
+            elif remove_trans and (trans_length == 1):
+                # Actively remove transitions between non-neighbors
+                transitions[r].discard(k)
+                transitions[k].discard(r)
+    
+    # update IJ, only around the split cells
+    _reset_pairs(IJ, i, adj, transitions, trans_length)
+    
+    for r in new_idx:
+        _reset_pairs(IJ, r, adj, transitions, trans_length)
+    
+    touched = set(old_adj)
+    touched.update(new_idx)
+    touched.update([i, j])
+    return touched
+
+def _reachable_within(i, adj, trans_length):
+    """Return cells reachable from cell C{i} within C{trans_length} hops.
+    
+    Same as row C{i} of L{reachable_within}, but computed
+    by walking the neighbors of C{i} only.
+    
+    @param adj: C{j in adj[i]} iff cells C{i}, C{j} are adjacent
+    @type adj: list of sets
+    
+    @rtype: set
+    """
+    reached = adj[i]
+    for k in xrange(1, trans_length):
+        reached = set().union(*[adj[r] for r in reached])
+    return reached
+
+def _reset_pairs(IJ, i, adj, transitions, trans_length):
+    """Same as L{sym_adj_change}, for the sparse structures of L{discretize}.
+    
+    Replace the pending pairs that involve cell C{i} with those
+    within C{trans_length} hops of C{i}, except for found transitions.
+    """
+    IJ.discard_cell(i)
+    for r in _reachable_within(i, adj, trans_length):
+        if r not in transitions[i]:
+            IJ.add((i, r))
+        if i not in transitions[r]:
+            IJ.add((r, i))
+
+def _matrix_to_sets(m):
+    """Return list of sets, with C{j in sets[i]} iff C{m[i, j] != 0}."""
+    m = sp.csr_matrix(m)
+    return [set(int(j) for j in m.indices[m.indptr[i]:m.indptr[i+1]])
+            for i in xrange(m.shape[0])]
+
+def _sets_to_matrix(sets):
+    """Return C{lil_matrix} with C{[i, j] = 1} iff C{j in sets[i]}."""
+    pairs = [(i, j) for i, s in enumerate(sets) for j in s]
+    return _pairs_to_matrix(pairs, len(sets))
+
+class _PairQueue(object):
+    """Pending pairs of cells, popped in lexicographic order.
+    
+    Replaces a dense 0-1 matrix C{IJ}, so that C{pop} returns the
+    first pair of C{np.nonzero(IJ)}. Pairs that involve a given cell
+    are indexed, so that C{discard_cell} is proportional to their
+    number, not the number of cells.
+    """
+    def __init__(self):
+        self._pairs = set()
+        self._by_cell = dict()
+        self._heap = []
+    
+    def __len__(self):
+        return len(self._pairs)
+    
+    def __iter__(self):
+        return iter(self._pairs)
+    
+    def __str__(self):
+        return str(sorted(self._pairs))
+    
+    def add(self, pair):
+        if pair in self._pairs:
+            return
+        self._pairs.add(pair)
+        for k in pair:
+            self._by_cell.setdefault(k, set()).add(pair)
+        heapq.heappush(self._heap, pair)
+    
+    def discard(self, pair):
+        if pair not in self._pairs:
+            return
+        self._pairs.remove(pair)
+        for k in pair:
+            self._by_cell[k].discard(pair)
+    
+    def pairs_of(self, i):
+        """Return pending pairs that involve cell C{i}."""
+        return set(self._by_cell.get(i, ()))
+    
+    def discard_cell(self, i):
+        for pair in list(self._by_cell.get(i, ())):
+            self.discard(pair)
+        # removed pairs stay in the heap until popped
+        if len(self._heap) > 2 * len(self._pairs) + 64:
+            self._heap = list(self._pairs)
+            heapq.heapify(self._heap)
+    
+    def pop(self):
+        while self._heap:
+            pair = heapq.heappop(self._heap)
+            if pair in self._pairs:
+                self.discard(pair)
+                return pair
+        raise KeyError('pop from empty queue of pairs')
+
+def _discretize_fingerprint(part, ssys, **params):
+    """Return hash that identifies the arguments of L{discretize}."""
+    h = hashlib.sha1()
+    for region in part:
+        _fingerprint(h, region)
+        h.update(repr(sorted(region.props)))
+    if isinstance(ssys, PwaSysDyn):
+        subsystems = ssys.list_subsys
+    else:
+        subsystems = [ssys]
+    for subsys in subsystems:
+        _fingerprint(h, subsys)
+        _fingerprint(h, subsys.domain)
+    h.update(repr(sorted(params.items())))
+    return h.hexdigest()
+
+class _Checkpoint(object):
+    """Append-only log of the refinement state of L{discretize}.
+    
+    The file starts with a header that identifies the arguments of
+    L{discretize}. Each following record contains the state of the
+    cells that changed since the previous record, so saving costs
+    time proportional to the changes, not to the number of cells.
+    The state is recovered by replaying the records
+    with L{_replay_checkpoint}.
+    """
+    version = 1
+    
+    def __init__(self, path, fingerprint, every=10):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.every = every
+        self._f = None
+        self._dirty = set()
+        self._regions = set()
+        self._progress = []
+        self._n_orig = 0
+        self._n_subsys = 0
+    
+    def open(self, orig, subsys_list, offset=None):
+        """Start new file, or append to existing one after C{offset}."""
+        if offset is None:
+            self._f = open(self.path, 'wb')
+            self._dump({
+                'version': self.version,
+                'fingerprint': self.fingerprint
+            })
+        else:
+            # drop truncated record, if any
+            self._f = open(self.path, 'r+b')
+            self._f.truncate(offset)
+            self._f.seek(0, os.SEEK_END)
+        self._n_orig = len(orig)
+        if subsys_list is not None:
+            self._n_subsys = len(subsys_list)
+    
+    def mark(self, cells, regions=()):
+        """Mark C{cells} as changed, and C{regions} as replaced."""
+        self._dirty.update(cells)
+        self._regions.update(regions)
+    
+    def tick(self, iter_count, progress_ratio, *state):
+        """Count an iteration, saving every C{self.every} iterations."""
+        self._progress.append(progress_ratio)
+        if iter_count % self.every == 0:
+            self.write(iter_count, *state)
+    
+    def write(
+        self, iter_count, sol, adj, transitions, IJ,
+        orig, subsys_list, done=False
+    ):
+        """Append record of the cells changed since last record."""
+        if subsys_list is None:
+            subsys = []
+        else:
+            subsys = subsys_list[self._n_subsys:]
+        record = {
+            'iter_count': iter_count,
+            'n_cells': len(sol),
+            'progress': self._progress,
+            'regions': {k:sol[k] for k in self._regions},
+            'adj': {k:adj[k] for k in self._dirty},
+            'transitions': {k:transitions[k] for k in self._dirty},
+            'pairs': {k:IJ.pairs_of(k) for k in self._dirty},
+            'orig': orig[self._n_orig:],
+            'subsys': subsys,
+            'done': done
+        }
+        self._dump(record)
+        
+        self._dirty = set()
+        self._regions = set()
+        self._progress = []
+        self._n_orig = len(orig)
+        self._n_subsys += len(subsys)
+    
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+    
+    def _dump(self, record):
+        pickle.dump(record, self._f, pickle.HIGHEST_PROTOCOL)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+    
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Return records and offset after the last complete one.
+        
+        A truncated last record, e.g., due to a crash
+        while writing it, is ignored.
+        """
+        records = []
+        with open(path, 'rb') as f:
+            header = pickle.load(f)
+            if header.get('version') != cls.version:
+                raise ValueError('unknown checkpoint version in: ' + path)
+            if header.get('fingerprint') != fingerprint:
+                raise ValueError(
+                    'checkpoint: ' + path + ' was saved by discretize '
+                    'with different partition, dynamics or parameters.')
+            offset = f.tell()
+            while True:
+                try:
+                    record = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError,
+                        ValueError, KeyError, IndexError):
+                    break
+                records.append(record)
+                offset = f.tell()
+        return records, offset
+
+def _replay_checkpoint(
+    records, sol, adj, transitions, IJ,
+    orig, subsys_list, progress
+):
+    """Apply checkpoint records to the initial state of L{discretize}.
+    
+    @return: iteration count when last record was saved
+    """
+    iter_count = 0
+    for record in records:
+        n_new = record['n_cells'] - len(sol)
+        sol.extend([None] * n_new)
+        adj.extend(set() for k in xrange(n_new))
+        transitions.extend(set() for k in xrange(n_new))
+        
+        for k, region in record['regions'].iteritems():
+            sol[k] = region
+        for k, near in record['adj'].iteritems():
+            adj[k] = near
+        for k, pre in record['transitions'].iteritems():
+            transitions[k] = pre
+        
+        for k in record['pairs']:
+            IJ.discard_cell(k)
+        for pairs in record['pairs'].itervalues():
+            for pair in pairs:
+                IJ.add(pair)
+        
+        orig.extend(record['orig'])
+        if subsys_list is not None:
+            subsys_list.extend(record['subsys'])
+        progress.extend(record['progress'])
+        iter_count = record['iter_count']
+    return iter_count
+
+def _solve_feasible_task(args):
+    """Call L{solve_feasible} with a tuple of arguments.
+    
+    Module-level, so that it can be pickled for worker processes.
+    """
+    return solve_feasible(*args)
+
+class _SpeculativeFeasibility(object):
+    """Solve pending pairs of cells ahead of L{discretize} in parallel.
+    
+    Whenever L{discretize} needs a pair that has not been solved,
+    all pairs currently pending in C{IJ} are dispatched to a pool of
+    worker processes. A stored result is used only if both cells are
+    still the same C{Region} objects as when the pair was dispatched,
+    i.e., neither cell has been split in the meantime. Otherwise the
+    pair is dispatched again. So the abstraction does not depend on
+    the number of workers.
+    """
+    def __init__(self, n_jobs):
+        self.n_jobs = n_jobs
+        self.pool = mp.Pool(n_jobs)
+        self.results = dict()
+        self.n_solved = 0
+        self.n_used = 0
+    
+    def solve(self, i, j, IJ, sol, feasibility_args):
+        """Return the set S0 in C{sol[i]} from which C{sol[j]} is reachable.
+        
+        @param IJ: pending pairs C{(j, i)}, as in L{discretize}
+        @param sol: current list of cells
+        @param feasibility_args: callable that maps C{(i, j)}
+            to the arguments of L{solve_feasible}
+        """
+        if not self._is_valid((i, j), sol):
+            self._dispatch((i, j), IJ, sol, feasibility_args)
+        si, sj, S0 = self.results.pop((i, j))
+        self.n_used += 1
+        return S0
+    
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        logger.info(
+            'speculatively solved: ' + str(self.n_solved) +
+            ' pairs, used: ' + str(self.n_used)
+        )
+    
+    def terminate(self):
+        """Stop the workers, without waiting for pending pairs."""
+        self.pool.terminate()
+        self.pool.join()
+    
+    def _is_valid(self, pair, sol):
+        r = self.results.get(pair)
+        if r is None:
+            return False
+        i, j = pair
+        return r[0] is sol[i] and r[1] is sol[j]
+    
+    def _dispatch(self, pair, IJ, sol, feasibility_args):
+        # drop results invalidated by splits
+        self.results = {
+            k:r for k, r in self.results.iteritems()
+            if self._is_valid(k, sol)
+        }
+        
+        pairs = [pair]
+        for j, i in sorted(IJ):
+            if (i, j) == pair or self._is_valid((i, j), sol):
+                continue
+            pairs.append((i, j))
+        
+        tasks = [feasibility_args(i, j) for i, j in pairs]
+        chunksize = max(1, len(tasks) // (4 * self.n_jobs))
+        S0s = self.pool.map(_solve_feasible_task, tasks, chunksize)
+        
+        for (i, j), S0 in zip(pairs, S0s):
+            self.results[(i, j)] = (sol[i], sol[j], S0)
+        self.n_solved += len(pairs)
+        logger.debug('dispatched ' + str(len(pairs)) + ' pairs of cells')
+
 # DEFUNCT until further notice
 def discretize_overlap(closed_loop=False, conservative=False):
     """default False.
@@ -1090,89 +1571,117 @@ def discretize_overlap(closed_loop=False, conservative=False):
 #                    original_regions=orig_list, orig=orig)                           
 #     return new_part
 
-def multiproc_discretize(q, mode, ppp, cont_dyn, disc_params):
-    global logger
-    logger = mp.log_to_stderr()
-    
-    name = mp.current_process().name
-    print('Abstracting mode: ' + str(mode) + ', on: ' + str(name))
-    
-    absys = discretize(ppp, cont_dyn, **disc_params)
-    
-    q.put((mode, absys))
-    print('Worker: ' + str(name) + 'finished.')
-
-def multiproc_get_transitions(
-    q, absys, mode, ssys, params
-):
-    global logger
-    logger = mp.log_to_stderr()
-    
-    name = mp.current_process().name
-    print('Merged transitions for mode: ' + str(mode) + ', on: ' + str(name))
-    
-    trans = get_transitions(absys, mode, ssys, **params)
-    
-    q.put((mode, trans))
-    print('Worker: ' + str(name) + 'finished.')
-
 def multiproc_discretize_switched(
     ppp, hybrid_sys, disc_params=None,
-    plot=False, show_ts=False, only_adjacent=True
+    plot=False, show_ts=False, only_adjacent=True,
+    checkpoint_dir=None, n_jobs=None
 ):
     """Parallel implementation of discretize_switched.
     
-    Uses the multiprocessing package.
-    """
-    logger.info('parallel discretize_switched started')
+    Uses a pool of C{n_jobs} worker processes from
+    the multiprocessing package for both phases:
     
-    modes = hybrid_sys.modes
-    mode_nums = hybrid_sys.disc_domain_size
+      1. each mode is abstracted by a worker,
+         which saves the result to a temporary file.
+         The partitions are then merged as by
+         L{multiproc_merge_partitions}.
     
-    q = mp.Queue()
+      2. the merged partition is saved to a temporary file once.
+         The candidate transitions of all modes are then
+         checked in batches by the same workers.
     
-    mode_args = dict()
-    for mode in modes:
-        cont_dyn = hybrid_sys.dynamics[mode]
-        mode_args[mode] = (q, mode, ppp, cont_dyn, disc_params[mode])
+    Progress of each mode is logged.
+    If the abstraction of a mode fails,
+    then an C{Exception} naming that mode is raised.
     
-    jobs = [mp.Process(target=multiproc_discretize, args=args)
-            for args in mode_args.itervalues()]
-    for job in jobs:
-        job.start()
+    Arguments are as for L{discretize_switched}.
+    Workers cannot start their own pools,
+    so any C{'n_jobs'} in C{disc_params} is ignored.
     
-    # flush before join:
-    #   http://stackoverflow.com/questions/19071529/
-    abstractions = dict()
-    for job in jobs:
-        mode, absys = q.get()
-        abstractions[mode] = absys
+    @param n_jobs: number of worker processes,
+        if C{None}, then one per CPU, but no more than modes.
+    @type n_jobs: int >= 1
     
-    for job in jobs:
-        job.join()
-    
-    # merge their domains
-    (merged_abstr, ap_labeling) = merge_partitions(abstractions)
-    n = len(merged_abstr.ppp)
-    logger.info('Merged partition has: ' + str(n) + ', states')
-    
-    # find feasible transitions over merged partition
-    for mode in modes:
-        cont_dyn = hybrid_sys.dynamics[mode]
-        params = disc_params[mode]
-        
-        mode_args[mode] = (q, merged_abstr, mode, cont_dyn, params)
+    @rtype: L{AbstractSwitched}
+    """
+    logger.info('parallel discretize_switched started')
     
-    jobs = [mp.Process(target=multiproc_get_transitions, args=args)
-            for args in mode_args.itervalues()]
+    modes = hybrid_sys.modes
+    mode_nums = hybrid_sys.disc_domain_size
     
-    for job in jobs:
-        job.start()
+    if disc_params is None:
+        disc_params = dict(
+            (mode, {'N':1, 'trans_length':1}) for mode in modes
+        )
     
-    trans = dict()
-    for job in jobs:
-        mode, t = q.get()
-        trans[mode] = t
+    if n_jobs is None:
+        n_jobs = min(mp.cpu_count(), len(modes))
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be >= 1, got: ' + str(n_jobs))
+    
+    if checkpoint_dir is not None and not os.path.isdir(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+    
+    spill_dir = tempfile.mkdtemp(prefix='tulip_')
+    pool = mp.Pool(n_jobs)
+    try:
+        # discretize each abstraction separately
+        tasks = list()
+        for mode in modes:
+            params = _mode_params(mode, disc_params, checkpoint_dir)
+            params.pop('n_jobs', None)
+            cont_dyn = hybrid_sys.dynamics[mode]
+            tasks.append((mode, ppp, cont_dyn, params, spill_dir))
+        
+        abstractions = dict()
+        results = pool.imap_unordered(_discretize_mode_task, tasks)
+        for k, (mode, path) in enumerate(results):
+            with open(path, 'rb') as f:
+                abstractions[mode] = pickle.load(f)
+            os.remove(path)
+            logger.info('Abstracted mode: ' + str(mode) +
+                        ' (' + str(k + 1) + '/' + str(len(tasks)) + ')')
+        
+        # merge their domains, by the same workers
+        (merged_abstr, ap_labeling) = _merge_tree(abstractions, pool)
+        n = len(merged_abstr.ppp)
+        logger.info('Merged partition has: ' + str(n) + ', states')
+        
+        # find feasible transitions over merged partition
+        path = _spill(merged_abstr, spill_dir)
+        tasks = list()
+        for mode in modes:
+            params = disc_params[mode]
+            pairs = _transition_pairs(merged_abstr.ppp,
+                                      params['trans_length'])
+            # about 4 batches per worker over all modes
+            chunksize = max(1, len(pairs) * len(modes) // (4 * n_jobs))
+            for k in xrange(0, len(pairs), chunksize):
+                tasks.append((
+                    mode,
+                    (path, mode, pairs[k:k + chunksize],
+                     params['N'], True, params.get('cache'))
+                ))
+        
+        found = dict((mode, list()) for mode in modes)
+        results = pool.imap_unordered(_mode_transitions_task, tasks)
+        for k, (mode, batch) in enumerate(results):
+            found[mode].extend(batch)
+            logger.debug('Checked batch ' + str(k + 1) + '/' +
+                         str(len(tasks)) + ' of transitions')
+        trans = dict(
+            (mode, _pairs_to_matrix(found[mode], n)) for mode in modes
+        )
+        logger.info('Found transitions of all modes')
+    except:
+        # raise now, instead of after the queued modes
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+        shutil.rmtree(spill_dir, ignore_errors=True)
     
     # merge the abstractions, creating a common TS
     merge_abstractions(merged_abstr, trans,
@@ -1183,9 +1692,48 @@ def multiproc_discretize_switched(
     
     return merged_abstr
 
+def _discretize_mode_task(args):
+    """Abstract a mode in a worker process.
+    
+    @return: mode and file where the abstraction was saved
+    """
+    mode, ppp, cont_dyn, params, spill_dir = args
+    logger.info('Abstracting mode: ' + str(mode))
+    try:
+        absys = discretize(ppp, cont_dyn, **params)
+        return (mode, _spill(absys, spill_dir))
+    except Exception:
+        raise Exception('abstracting mode: ' + str(mode) +
+                        ' failed:\n' + traceback.format_exc())
+
+def _mode_transitions_task(args):
+    """Call L{_feasible_transitions_task}, tagging result by mode."""
+    mode, task = args
+    try:
+        return (mode, _feasible_transitions_task(task))
+    except Exception:
+        raise Exception('transitions of mode: ' + str(mode) +
+                        ' failed:\n' + traceback.format_exc())
+
+def _mode_params(mode, disc_params, checkpoint_dir):
+    """Return copy of the parameters of C{mode} for L{discretize}.
+    
+    If C{checkpoint_dir} is given, then add the checkpoint
+    file of C{mode}, resuming from it if it exists.
+    """
+    params = dict(disc_params[mode])
+    if checkpoint_dir is not None:
+        fname = os.path.join(checkpoint_dir,
+                             _mode_fname(mode) + '.checkpoint')
+        params['checkpoint'] = fname
+        if os.path.exists(fname):
+            params['resume_from'] = fname
+    return params
+
 def discretize_switched(
     ppp, hybrid_sys, disc_params=None,
-    plot=False, show_ts=False, only_adjacent=True
+    plot=False, show_ts=False, only_adjacent=True,
+    checkpoint_dir=None
 ):
     """Abstract switched dynamics over given partition.
     
@@ -1196,6 +1744,8 @@ def discretize_switched(
     
     @param disc_params: discretization parameters passed to L{discretize} for
 		each mode. See L{discretize} for details.
+        A C{'cache'} and C{'n_jobs'} are also used to find
+        transitions over the merged partition.
     @type disc_params: dict (keyed by mode) of dicts.
     
     @param plot: save partition images
@@ -1203,6 +1753,12 @@ def discretize_switched(
     
     @param show_ts, only_adjacent: options for L{AbstractPwa.plot}.
     
+    @param checkpoint_dir: directory where the refinement of each
+        mode is saved, see C{checkpoint} of L{discretize}.
+        Modes with a checkpoint there are resumed from it,
+        so rerunning after a crash continues where it stopped.
+    @type checkpoint_dir: str
+    
     @return: abstracted dynamics,
         some attributes are dict keyed by mode
     @rtype: L{AbstractSwitched}
@@ -1210,6 +1766,9 @@ def discretize_switched(
     if disc_params is None:
         disc_params = {'N':1, 'trans_length':1}
     
+    if checkpoint_dir is not None and not os.path.isdir(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+    
     logger.info('discretizing hybrid system')
     
     modes = hybrid_sys.modes
@@ -1223,9 +1782,10 @@ def discretize_switched(
         
         cont_dyn = hybrid_sys.dynamics[mode]
         
+        params = _mode_params(mode, disc_params, checkpoint_dir)
         absys = discretize(
             ppp, cont_dyn,
-            **disc_params[mode]
+            **params
         )
         logger.debug('Mode Abstraction:\n' + str(absys) +'\n')
         
@@ -1245,7 +1805,9 @@ def discretize_switched(
         
         trans[mode] = get_transitions(
             merged_abstr, mode, cont_dyn,
-            N=params['N'], trans_length=params['trans_length']
+            N=params['N'], trans_length=params['trans_length'],
+            cache=params.get('cache'),
+            n_jobs=params.get('n_jobs', 1)
         )
 
     # merge the abstractions, creating a common TS
@@ -1257,6 +1819,10 @@ def discretize_switched(
     
     return merged_abstr
 
+def _mode_fname(mode):
+    """Return file name for C{mode}, a tuple of labels."""
+    return '_'.join(str(x) for x in mode)
+
 def plot_mode_partitions(swab, show_ts, only_adjacent):
     """Save each mode's partition and final merged partition.
     """
@@ -1361,41 +1927,87 @@ def merge_abstractions(merged_abstr, trans, abstr, modes, mode_nums):
 def get_transitions(
     abstract_sys, mode, ssys, N=10,
     closed_loop=True,
-    trans_length=1
+    trans_length=1,
+    cache=None,
+    n_jobs=1,
+    chunksize=None
 ):
     """Find which transitions are feasible in given mode.
     
     Used for the candidate transitions of the merged partition.
+    The partition is fixed, so the candidate pairs are independent.
+    If C{n_jobs > 1}, then they are checked in batches of
+    C{chunksize} pairs by a pool of worker processes. The
+    abstraction is saved to a temporary file that each
+    worker reads once.
+    
+    @param cache: store of reachable sets from previous runs
+    @type cache: L{FeasibilityCache}
+    
+    @param n_jobs: number of worker processes,
+        if C{None}, then one per CPU
+    @type n_jobs: int >= 1
+    
+    @param chunksize: number of pairs sent to a worker at once.
+        Default is to give each worker about 4 batches.
+    @type chunksize: int
     
     @rtype: scipy.sparse.lil_matrix
     """
     logger.info('checking which transitions remain feasible after merging')
     part = abstract_sys.ppp
+    n = len(part)
     
-    # Initialize matrix for pairs to check
-    IJ = part.adj.copy()
-    if trans_length > 1:
-        k = 1
-        while k < trans_length:
-            IJ = np.dot(IJ, part.adj)
-            k += 1
-        IJ = (IJ > 0).astype(int)
+    if n_jobs is None:
+        n_jobs = mp.cpu_count()
     
-    # Initialize output
-    n = len(part)
-    transitions = sp.lil_matrix((n, n), dtype=int)
+    pairs = _transition_pairs(part, trans_length)
     
-    # Do the abstraction
-    n_checked = 0
-    n_found = 0
-    while np.sum(IJ) > 0:
-        n_checked += 1
-        
-        ind = np.nonzero(IJ)
-        i = ind[1][0]
-        j = ind[0][0]
-        IJ[j,i] = 0
-        
+    if n_jobs > 1:
+        pool = mp.Pool(n_jobs)
+        path = _spill(abstract_sys)
+        try:
+            found = _map_transitions(
+                pool, path, mode, pairs, N, closed_loop,
+                cache, n_jobs, chunksize
+            )
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+            os.remove(path)
+    else:
+        found = _feasible_transitions(
+            abstract_sys, mode, pairs, N, closed_loop, cache
+        )
+    
+    n_checked = len(pairs)
+    n_found = len(found)
+    logger.info('Checked: ' + str(n_checked))
+    logger.info('Found: ' + str(n_found))
+    if n_checked > 0:
+        logger.info('Survived merging: ' +
+                    str(float(n_found) / n_checked) + ' % ')
+    
+    return _pairs_to_matrix(found, n)
+
+def _transition_pairs(part, trans_length):
+    """Return pairs C{(i, j)} within C{trans_length} hops in C{part}."""
+    adj = _matrix_to_sets(part.adj)
+    return [
+        (i, j)
+        for i in xrange(len(adj))
+        for j in sorted(_reachable_within(i, adj, trans_length))
+    ]
+
+def _feasible_transitions(abstract_sys, mode, pairs, N, closed_loop, cache):
+    """Return those C{pairs} whose transition is feasible in C{mode}."""
+    part = abstract_sys.ppp
+    found = []
+    for i, j in pairs:
         logger.debug('checking transition: ' + str(i) + ' -> ' + str(j))
         
         si = part[i]
@@ -1408,39 +2020,238 @@ def get_transitions(
         trans_feasible = is_feasible(
             si, sj, active_subsystem, N,
             closed_loop = closed_loop,
-            trans_set = trans_set
+            trans_set = trans_set,
+            cache = cache
         )
-                    
+        
         if trans_feasible:
-            transitions[i, j] = 1 
+            found.append((i, j))
             msg = '\t Feasible transition.'
-            n_found += 1
         else:
-            transitions[i, j] = 0
             msg = '\t Not feasible transition.'
         logger.debug(msg)
-    logger.info('Checked: ' + str(n_checked))
-    logger.info('Found: ' + str(n_found))
-    logger.info('Survived merging: ' + str(float(n_found) / n_checked) + ' % ')
-            
-    return transitions
+    return found
+
+def _map_transitions(
+    pool, path, mode, pairs, N, closed_loop,
+    cache, n_jobs, chunksize=None
+):
+    """Check C{pairs} in batches on C{pool}.
+    
+    @param path: file saved by L{_spill} with the abstraction
+    """
+    if chunksize is None:
+        chunksize = max(1, len(pairs) // (4 * n_jobs))
+    tasks = [
+        (path, mode, pairs[k:k + chunksize], N, closed_loop, cache)
+        for k in xrange(0, len(pairs), chunksize)
+    ]
+    found = []
+    for batch in pool.map(_feasible_transitions_task, tasks):
+        found.extend(batch)
+    return found
 
-def multiproc_merge_partitions(abstractions):
+def _feasible_transitions_task(args):
+    """Call L{_feasible_transitions} in a worker process."""
+    path, mode, pairs, N, closed_loop, cache = args
+    abstract_sys = _load_spilled(path)
+    return _feasible_transitions(
+        abstract_sys, mode, pairs, N, closed_loop, cache
+    )
+
+def _pairs_to_matrix(pairs, n):
+    """Return C{lil_matrix} with C{[i, j] = 1} for each pair."""
+    if pairs:
+        rows, cols = zip(*pairs)
+    else:
+        rows, cols = (), ()
+    data = np.ones(len(pairs), dtype=int)
+    m = sp.coo_matrix((data, (rows, cols)), shape=(n, n))
+    return m.tolil()
+
+def _spill(obj, dir=None):
+    """Pickle C{obj} to a temporary file, and return its path.
+    
+    Workers read it with L{_load_spilled},
+    instead of receiving it with each task.
+    
+    @param dir: where to create the file,
+        if C{None}, then the default temporary directory
+    """
+    fd, path = tempfile.mkstemp(suffix='.pickle', prefix='tulip_',
+                                dir=dir)
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+# last object loaded in this (worker) process by _load_spilled
+_spilled = dict()
+
+def _load_spilled(path):
+    """Return object saved by L{_spill}, loading it once per process."""
+    if path not in _spilled:
+        _spilled.clear()
+        with open(path, 'rb') as f:
+            _spilled[path] = pickle.load(f)
+    return _spilled[path]
+
+def multiproc_merge_partitions(abstractions, n_jobs=None):
     """LOGTIME in #processors parallel merging.
     
-    Assuming sufficient number of processors.
+    Same as L{merge_partitions}, but the abstractions are
+    merged in pairs, as leaves of a binary tree.
+    Each level of the tree is merged by a pool of C{n_jobs}
+    worker processes, so m modes take about log2(m) rounds.
+    
+    The tree keeps the order of modes used by L{merge_partitions},
+    so the merged regions, their order,
+    and the map to the regions of each mode are the same.
+    
+    @param abstractions: keyed by mode
+    @type abstractions: dict of L{AbstractPwa}
+    
+    @param n_jobs: number of worker processes,
+        if C{None}, then one per CPU, but no more than mode pairs.
+    @type n_jobs: int >= 1
+    
+    @return: (merged_abstraction, ap_labeling),
+        see L{merge_partitions}
+    """
+    if len(abstractions) == 0:
+        warnings.warn('Abstractions empty, nothing to merge.')
+        return
+    
+    if n_jobs is None:
+        n_jobs = max(1, min(mp.cpu_count(), len(abstractions) // 2))
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be >= 1, got: ' + str(n_jobs))
+    
+    pool = mp.Pool(n_jobs)
+    try:
+        r = _merge_tree(abstractions, pool)
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return r
 
-    UNDER DEVELOPMENT; function signature may change without notice.
-    Calling will result in NotImplementedError.
+def _merge_tree(abstractions, pool):
+    """Merge C{abstractions} as in L{multiproc_merge_partitions}.
+    
+    @param pool: merges each level of the tree
+    @type pool: C{multiprocessing.Pool}
     """
-    raise NotImplementedError
+    _check_mergeable(abstractions)
+    
+    modes = _merge_order(abstractions)
+    groups = [_leaf_group(mode, abstractions[mode]) for mode in modes]
+    while len(groups) > 1:
+        logger.info('merging ' + str(len(groups)) + ' partitions')
+        pairs = zip(groups[0::2], groups[1::2])
+        merged = pool.map(_merge_groups_task, pairs)
+        if len(groups) % 2 == 1:
+            merged.append(groups[-1])
+        groups = merged
+    
+    group_modes, regions, parents, ap_labeling = groups[0]
+    abstraction = _merged_abstraction(abstractions, regions, parents,
+                                      abstractions[modes[0]])
+    return (abstraction, ap_labeling)
+
+def _merge_order(abstractions):
+    """Return modes in the order that L{merge_partitions} merges them."""
+    init_mode = abstractions.keys()[0]
+    remaining_modes = set(abstractions).difference(set([init_mode]))
+    return [init_mode] + list(remaining_modes)
+
+def _leaf_group(mode, ab):
+    """Return the partition of C{ab} as a group for L{_merge_groups}."""
+    regions = list(ab.ppp)
+    parents = {mode:range(len(regions))}
+    ap_labeling = {i:reg.props for i, reg in enumerate(regions)}
+    return ([mode], regions, parents, ap_labeling)
 
-def merge_partitions(abstractions):
+def _merge_groups_task(args):
+    """Call L{_merge_groups} in a worker process."""
+    return _merge_groups(*args)
+
+def _merge_groups(group1, group2, n_jobs=1):
+    """Intersect two partitions that are already merged.
+    
+    Both operands can be the result of merging several modes,
+    see L{merge_partition_pair}.
+    
+    @param group1, group2: tuples of
+        (modes, regions, parents, ap_labeling), where
+        C{parents} and C{ap_labeling} are as in
+        L{merge_partition_pair}.
+    
+    @param n_jobs: see L{_pair_intersections}
+    
+    @return: merged group, with the modes of C{group1}
+        followed by those of C{group2}
+    """
+    modes1, regions1, parents1, ap_labeling1 = group1
+    modes2, regions2, parents2, ap_labeling2 = group2
+    logger.info('merging partitions of modes: ' + str(modes1) +
+                ', with: ' + str(modes2))
+    
+    modes = modes1 + modes2
+    
+    new_list = []
+    parents = {mode:dict() for mode in modes}
+    ap_labeling = dict()
+    
+    isects = _pair_intersections(regions1, regions2, n_jobs)
+    for i, j, isect in isects:
+        logger.info('merging region: A' + str(i) +
+                    ', with: B' + str(j))
+        
+        # label the Region with propositions
+        isect.props = regions1[i].props.copy()
+        
+        idx = len(new_list)
+        new_list.append(isect)
+        
+        # keep track of parents
+        for mode in modes1:
+            parents[mode][idx] = parents1[mode][i]
+        for mode in modes2:
+            parents[mode][idx] = parents2[mode][j]
+        
+        # union of AP labels from parent states
+        ap_label_1 = ap_labeling1[i]
+        ap_label_2 = ap_labeling2[j]
+        
+        logger.debug('AP label 1: ' + str(ap_label_1))
+        logger.debug('AP label 2: ' + str(ap_label_2))
+        
+        # original partitions may be different if pwa_partition used
+        # but must originate from same initial partition,
+        # i.e., have same continuous propositions, checked above
+        #
+        # so no two intersecting regions can have different AP labels,
+        # checked here
+        if ap_label_1 != ap_label_2:
+            msg = 'Inconsistent AP labels between intersecting regions\n'
+            msg += 'of partitions of switched system.'
+            raise Exception(msg)
+        
+        ap_labeling[idx] = ap_label_1
+    
+    return modes, new_list, parents, ap_labeling
+
+def merge_partitions(abstractions, n_jobs=1):
     """Merge multiple abstractions.
     
     @param abstractions: keyed by mode
     @type abstractions: dict of L{AbstractPwa}
     
+    @param n_jobs: see L{merge_partition_pair}
+    
     @return: (merged_abstraction, ap_labeling)
         where:
             - merged_abstraction: L{AbstractSwitched}
@@ -1450,24 +2261,7 @@ def merge_partitions(abstractions):
         warnings.warn('Abstractions empty, nothing to merge.')
         return
     
-    # consistency check
-    for ab1 in abstractions.itervalues():
-        for ab2 in abstractions.itervalues():
-            p1 = ab1.ppp
-            p2 = ab2.ppp
-            
-            if p1.prop_regions != p2.prop_regions:
-                msg = 'merge: partitions have different sets '
-                msg += 'of continuous propositions'
-                raise Exception(msg)
-            
-            if not (p1.domain.A == p2.domain.A).all() or \
-            not (p1.domain.b == p2.domain.b).all():
-                raise Exception('merge: partitions have different domains')
-            
-            # check equality of original PPP partitions
-            if ab1.orig_ppp == ab2.orig_ppp:
-                logger.info('original partitions happen to be equal')
+    _check_mergeable(abstractions)
     
     init_mode = abstractions.keys()[0]
     all_modes = set(abstractions)
@@ -1489,12 +2283,42 @@ def merge_partitions(abstractions):
         ab2 = abstractions[cur_mode]
         r = merge_partition_pair(
             regions, ab2, cur_mode, prev_modes,
-            parents, ap_labeling
+            parents, ap_labeling, n_jobs
         )
         regions, parents, ap_labeling = r
         prev_modes += [cur_mode]
-    new_list = regions
     
+    abstraction = _merged_abstraction(abstractions, regions, parents, ab0)
+    
+    return (abstraction, ap_labeling)
+
+def _check_mergeable(abstractions):
+    """Raise C{Exception} if the partitions of C{abstractions}
+    have different domains or continuous propositions.
+    """
+    for ab1 in abstractions.itervalues():
+        for ab2 in abstractions.itervalues():
+            p1 = ab1.ppp
+            p2 = ab2.ppp
+            
+            if p1.prop_regions != p2.prop_regions:
+                msg = 'merge: partitions have different sets '
+                msg += 'of continuous propositions'
+                raise Exception(msg)
+            
+            if not (p1.domain.A == p2.domain.A).all() or \
+            not (p1.domain.b == p2.domain.b).all():
+                raise Exception('merge: partitions have different domains')
+            
+            # check equality of original PPP partitions
+            if ab1.orig_ppp == ab2.orig_ppp:
+                logger.info('original partitions happen to be equal')
+
+def _merged_abstraction(abstractions, new_list, parents, ab0):
+    """Return L{AbstractSwitched} over the merged regions C{new_list}.
+    
+    @param parents: as returned by L{merge_partition_pair}
+    """
     # build adjacency based on spatial adjacencies of
     # component abstractions.
     # which justifies the assumed symmetry of part1.adj, part2.adj
@@ -1538,12 +2362,71 @@ def merge_partitions(abstractions):
         ppp2modes=parents,
     )
     
-    return (abstraction, ap_labeling)
+    return abstraction
+
+def _pair_intersections(regions1, regions2, n_jobs=1):
+    """Return the intersections of regions, with their indices.
+    
+    Only pairs whose bounding boxes overlap are intersected,
+    found with a L{RegionIndex} of C{regions2}.
+    Intersections whose Chebyshev radius is below
+    C{1e-5} are discarded.
+    
+    @param n_jobs: number of worker processes
+        that intersect the pairs
+    @type n_jobs: int >= 1
+    
+    @return: C{(i, j, isect)} for intersecting
+        C{regions1[i]} and C{regions2[j]}, in order of C{(i, j)}
+    @rtype: list of (int, int, C{Region})
+    """
+    index = RegionIndex(regions2)
+    tasks = []
+    for i, reg_i in enumerate(regions1):
+        l, u = reg_i.bounding_box
+        candidates = [(j, regions2[j]) for j in index.overlapping(l, u)]
+        if candidates:
+            tasks.append((i, reg_i, candidates))
+    
+    if n_jobs > 1:
+        pool = mp.Pool(n_jobs)
+        try:
+            chunksize = max(1, len(tasks) // (4 * n_jobs))
+            results = pool.map(_intersect_task, tasks, chunksize)
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+    else:
+        results = map(_intersect_task, tasks)
+    return [x for r in results for x in r]
+
+def _intersect_task(args):
+    """Intersect a region with its candidates, for L{_pair_intersections}."""
+    i, reg_i, candidates = args
+    found = []
+    for j, reg_j in candidates:
+        isect = pc.intersect(reg_i, reg_j)
+        rc, xc = pc.cheby_ball(isect)
+        
+        # no intersection ?
+        if rc < 1e-5:
+            continue
+        
+        # if Polytope, make it Region
+        if len(isect) == 0:
+            isect = pc.Region([isect])
+        found.append((i, j, isect))
+    return found
 
 def merge_partition_pair(
     old_regions, ab2,
     cur_mode, prev_modes,
-    old_parents, old_ap_labeling
+    old_parents, old_ap_labeling,
+    n_jobs=1
 ):
     """Merge an Abstraction with the current partition iterate.
     
@@ -1571,6 +2454,10 @@ def merge_partition_pair(
         propositions for each state
     @type old_ap_labeling: dict of tuples to sets
     
+    @param n_jobs: number of worker processes that intersect regions,
+        see L{_pair_intersections}
+    @type n_jobs: int >= 1
+    
     @return: the following:
         - C{new_list}, list of new regions
         - C{parents}, same as input param C{old_parents}, except that it
@@ -1579,61 +2466,14 @@ def merge_partition_pair(
         - C{ap_labeling}, same as input param C{old_ap_labeling}, except that it
           includes the mode that was just merged.
     """
-    logger.info('merging partitions')
-
-    part2 = ab2.ppp
-    
-    modes = prev_modes + [cur_mode]
-    
-    new_list = []
-    parents = {mode:dict() for mode in modes}
-    ap_labeling = dict()
-    
-    for i in xrange(len(old_regions)):
-        for j in xrange(len(part2)):
-            isect = pc.intersect(old_regions[i],
-                                 part2[j])
-            rc, xc = pc.cheby_ball(isect)
-            
-            # no intersection ?
-            if rc < 1e-5:
-                continue
-            logger.info('merging region: A' + str(i) +
-                        ', with: B' + str(j))
-            
-            # if Polytope, make it Region
-            if len(isect) == 0:
-                isect = pc.Region([isect])
-            
-            # label the Region with propositions
-            isect.props = old_regions[i].props.copy()
-            
-            new_list.append(isect)
-            idx = new_list.index(isect)
-            
-            # keep track of parents
-            for mode in prev_modes:
-                parents[mode][idx] = old_parents[mode][i]
-            parents[cur_mode][idx] = j
-            
-            # union of AP labels from parent states
-            ap_label_1 = old_ap_labeling[i]
-            ap_label_2 = ab2.ts.states[j]['ap']
-            
-            logger.debug('AP label 1: ' + str(ap_label_1))
-            logger.debug('AP label 2: ' + str(ap_label_2))
-            
-            # original partitions may be different if pwa_partition used
-            # but must originate from same initial partition,
-            # i.e., have same continuous propositions, checked above
-            #
-            # so no two intersecting regions can have different AP labels,
-            # checked here
-            if ap_label_1 != ap_label_2:
-                msg = 'Inconsistent AP labels between intersecting regions\n'
-                msg += 'of partitions of switched system.'
-                raise Exception(msg)
-            
-            ap_labeling[idx] = ap_label_1
+    regions2 = ab2.ppp.regions
+    group1 = (prev_modes, old_regions, old_parents, old_ap_labeling)
+    group2 = (
+        [cur_mode], regions2,
+        {cur_mode:range(len(regions2))},
+        {j:ab2.ts.states[j]['ap'] for j in xrange(len(regions2))}
+    )
+    modes, new_list, parents, ap_labeling = _merge_groups(
+        group1, group2, n_jobs)
     
     return new_list, parents, ap_labeling
@@ -38,6 +38,9 @@ Primary functions:
     - L{createLM}
     - L{get_max_extreme}
 
+Results of L{solve_feasible} can be stored across runs
+in a L{FeasibilityCache}.
+
 See Also
 ========
 L{find_controller}
@@ -45,6 +48,11 @@ L{find_controller}
 import logging
 logger = logging.getLogger(__name__)
 
+import os
+import errno
+import hashlib
+import pickle
+import tempfile
 from collections import Iterable
 
 import numpy as np
@@ -54,7 +62,8 @@ def is_feasible(
     from_region, to_region, sys, N,
     closed_loop=True,
     use_all_horizon=False,
-    trans_set=None
+    trans_set=None,
+    cache=None
 ):
     """Return True if to_region is reachable from_region.
     
@@ -63,13 +72,14 @@ def is_feasible(
     S0 = solve_feasible(
         from_region, to_region, sys, N,
         closed_loop, use_all_horizon,
-        trans_set
+        trans_set, cache=cache
     )
     return from_region <= S0
 
 def solve_feasible(
     P1, P2, ssys, N=1, closed_loop=True,
-    use_all_horizon=False, trans_set=None, max_num_poly=5
+    use_all_horizon=False, trans_set=None, max_num_poly=5,
+    cache=None
 ):
     """Compute S0 \subseteq P1 from which P2 is N-reachable.
     
@@ -96,25 +106,199 @@ def solve_feasible(
         then force transitions to be in this set.
         Otherwise, P1 is used.
     
+    @param cache: if given, then the result is looked up there first,
+        and stored there if computed.
+    @type cache: L{FeasibilityCache}
+    
     @return: the subset S0 of P1 from which P2 is reachable
     @rtype: C{Polytope} or C{Region}
     """
     if use_all_horizon:
         raise ValueError('solve_feasible() with use_all_horizon=True is still '
                          'under development\nand currently unavailable.')
-
+    
+    if cache is not None:
+        key = cache.key(P1, P2, ssys, N, closed_loop,
+                        use_all_horizon, trans_set, max_num_poly)
+        S0 = cache.get(key)
+        if S0 is not None:
+            return S0
+    
     if closed_loop:
-        return solve_closed_loop(
+        S0 = solve_closed_loop(
             P1, P2, ssys, N,
             use_all_horizon=use_all_horizon,
             trans_set=trans_set
         )
     else:
-        return solve_open_loop(
+        S0 = solve_open_loop(
             P1, P2, ssys, N,
             trans_set=trans_set,
             max_num_poly=max_num_poly
         )
+    
+    if cache is not None:
+        cache.put(key, S0)
+    return S0
+
+class FeasibilityCache(object):
+    """Persistent cache of L{solve_feasible} results.
+    
+    Each result is stored in a file under directory C{path},
+    named by a hash of the arguments of L{solve_feasible}:
+    the H-representations of the polytopes, the matrices
+    C{A, B, E, K} and sets C{Uset, Wset} of the dynamics,
+    the horizon and the flags. So unchanged abstractions
+    can be recomputed from the cache in later runs,
+    and by several processes at once.
+    
+    When the files exceed C{max_size} bytes,
+    the least recently used ones are deleted.
+    
+    Counters C{hits}, C{misses} and C{evictions} are
+    kept per process, i.e., they do not include
+    lookups done in worker processes.
+    
+    Example::
+    
+        cache = FeasibilityCache('abstraction_cache')
+        ab = discretize(ppp, sys, cache=cache)
+        print(cache)
+    """
+    version = '1'
+    
+    def __init__(self, path, max_size=2**30):
+        """Use directory C{path}, creating it if needed.
+        
+        @param max_size: bound on total size of stored results
+        @type max_size: int (bytes)
+        """
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+    
+    def __str__(self):
+        s = 'Feasibility cache in: ' + str(self.path) + '\n'
+        s += '\t hits: ' + str(self.hits)
+        s += ', misses: ' + str(self.misses)
+        s += ', evictions: ' + str(self.evictions) + '\n'
+        return s
+    
+    def key(self, *args):
+        """Return hash of arguments of L{solve_feasible}.
+        
+        @rtype: str
+        """
+        h = hashlib.sha1(self.version)
+        for x in args:
+            _fingerprint(h, x)
+        return h.hexdigest()
+    
+    def get(self, key):
+        """Return stored result, or C{None} if missing."""
+        fname = self._fname(key)
+        try:
+            with open(fname, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        # mark as recently used
+        try:
+            os.utime(fname, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+    
+    def put(self, key, value):
+        """Store C{value} under C{key}, evicting old results if needed."""
+        # write to temporary file and rename,
+        # so other processes never read partial files
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp)
+        os.rename(tmp, self._fname(key))
+        
+        if self._size is None:
+            self._size = sum(size for t, size, fname in self._entries())
+        else:
+            self._size += size
+        if self._size > self.max_size:
+            self._evict()
+    
+    def clear(self):
+        """Delete all stored results."""
+        for t, size, fname in self._entries():
+            _remove(fname)
+        self._size = 0
+    
+    def _fname(self, key):
+        return os.path.join(self.path, key + '.pickle')
+    
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.pickle'):
+                continue
+            fname = os.path.join(self.path, name)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fname))
+        return entries
+    
+    def _evict(self):
+        entries = sorted(self._entries())
+        size = sum(e[1] for e in entries)
+        while entries and size > self.max_size:
+            t, fsize, fname = entries.pop(0)
+            _remove(fname)
+            size -= fsize
+            self.evictions += 1
+        self._size = size
+        logger.debug('feasibility cache size: ' + str(size) + ' bytes')
+
+def _fingerprint(h, x):
+    """Update hash C{h} with a canonical representation of C{x}."""
+    if isinstance(x, pc.Region):
+        h.update('Region' + str(len(x)))
+        for p in x:
+            _fingerprint(h, p)
+    elif isinstance(x, pc.Polytope):
+        h.update('Polytope')
+        _fingerprint(h, x.A)
+        _fingerprint(h, x.b)
+    elif isinstance(x, np.ndarray):
+        a = np.ascontiguousarray(x, dtype=float)
+        h.update('array' + str(a.shape))
+        h.update(a.tostring())
+    elif hasattr(x, 'Uset'):
+        # LtiSysDyn
+        h.update('LtiSysDyn')
+        for attr in ['A', 'B', 'E', 'K', 'Uset', 'Wset']:
+            y = getattr(x, attr)
+            if isinstance(y, list):
+                y = np.array(y)
+            _fingerprint(h, y)
+    else:
+        h.update(repr(x))
+
+def _remove(fname):
+    try:
+        os.remove(fname)
+    except OSError:
+        pass
 
 def solve_closed_loop(
     P1, P2, ssys, N,
@@ -35,10 +35,12 @@ Algorithms related to controller synthesis for discretized dynamics.
     
 Primary functions:
     - L{get_input}
+    - L{TransitionController}
     
 Helper functions:
     - L{get_input_helper}
     - L{is_seq_inside}
+    - L{are_seqs_inside}
 
 See Also
 ========
@@ -47,12 +49,16 @@ L{discretize}
 from __future__ import absolute_import
 
 import logging
+import collections
+import hashlib
+
 import numpy as np
 from cvxopt import matrix, solvers
 
 import polytope as pc
 
-from .feasible import solve_feasible, createLM, _block_diag2
+from .feasible import solve_feasible, createLM, _block_diag2, _fingerprint
+from .prop2partition import RegionIndex
 
 
 logger = logging.getLogger(__name__)
@@ -69,7 +75,7 @@ def get_input(
     x0, ssys, abstraction,
     start, end,
     R=[], r=[], Q=[], mid_weight=0.0,
-    test_result=False
+    test_result=False, cache=None
 ):
     """Compute continuous control input for discrete transition.
     
@@ -151,6 +157,10 @@ def get_input(
         the calculated input sequence is safe.
     @type test_result: bool
     
+    @param cache: precompiled controllers to reuse,
+        if C{None}, then the QPs are compiled for this call only.
+    @type cache: L{ControllerCache}
+    
     @return: array A where row k contains the
         control input: u(k)
         for k = 0,1 ... N-1
@@ -173,146 +183,304 @@ def get_input(
     #    if closed loop discretization has been used.
     #@type closed_loop: bool
     
-    part = abstraction.ppp
-    regions = part.regions
-    
-    ofts = abstraction.ts
-    original_regions = abstraction.orig_ppp
-    orig = abstraction._ppp2orig
-    
-    params = abstraction.disc_params
-    N = params['N']
-    conservative = params['conservative']
-    closed_loop = params['closed_loop']
-    
-    if (len(R) == 0) and (len(Q) == 0) and \
-    (len(r) == 0) and (mid_weight == 0):
-        # Default behavior
-        Q = np.eye(N*ssys.B.shape[1])
-        R = np.zeros([N*x0.size, N*x0.size])
-        r = np.zeros([N*x0.size,1])
-        mid_weight = 3
-    if len(R) == 0:
-        R = np.zeros([N*x0.size, N*x0.size])
-    if len(Q) == 0:
-        Q = np.eye(N*ssys.B.shape[1])    
-    if len(r) == 0:
-        r = np.zeros([N*x0.size,1])
-    
-    if (R.shape[0] != R.shape[1]) or (R.shape[0] != N*x0.size):
-        raise Exception("get_input: "
-            "R must be square and have side N * dim(state space)")
-    
-    if (Q.shape[0] != Q.shape[1]) or (Q.shape[0] != N*ssys.B.shape[1]):
-        raise Exception("get_input: "
-            "Q must be square and have side N * dim(input space)")
-    if ofts is not None:
-        start_state = start
-        end_state = end
-        
-        if end_state not in ofts.states.post(start_state):
-            raise Exception('get_input: '
-                'no transition from state s' +str(start) +
-                ' to state s' +str(end)
-            )
+    if cache is None:
+        controller = TransitionController(
+            ssys, abstraction, start, end, R, r, Q, mid_weight
+        )
     else:
-        print("get_input: "
-            "Warning, no transition matrix found, assuming feasible")
+        controller = cache.get(
+            ssys, abstraction, start, end, R, r, Q, mid_weight
+        )
+    return controller.get_input(x0, test_result)
+
+class TransitionController(object):
+    """Precompiled controller for a discrete transition.
     
-    if (not conservative) & (orig is None):
-        print("List of original proposition preserving "
-            "partitions not given, reverting to conservative mode")
-        conservative = True
-       
-    P_start = regions[start]
-    P_end = regions[end]
+    Computing the input of L{get_input} amounts to a QP
+    for each polytope of the end state.
+    Only the linear cost term and the constraint offsets
+    depend on the initial state C{x0}, affinely.
+    So all other matrices are computed once here,
+    and L{get_input} only updates those and calls the solver.
     
-    n = ssys.A.shape[1]
-    m = ssys.B.shape[1]
+    The arguments and returned input are
+    as in L{abstract.get_input}.
     
-    idx = range((N-1)*n, N*n)
-    
-    if conservative:
-        # Take convex hull or P_start as constraint
-        if len(P_start) > 0:
-            if len(P_start) > 1:
-                # Take convex hull
-                vert = pc.extreme(P_start[0])
-                for i in range(1, len(P_start)):
-                    vert = np.vstack([
-                        vert,
-                        pc.extreme(P_start[i])
-                    ])
-                P1 = pc.qhull(vert)
+    Example::
+        
+        c = TransitionController(ssys, abstraction, start, end)
+        u = c.get_input(x0)
+        u_all = c.get_inputs(x0_samples)
+    
+    See Also
+    ========
+    L{ControllerCache}
+    """
+    def __init__(
+        self, ssys, abstraction, start, end,
+        R=[], r=[], Q=[], mid_weight=0.0, warm_start=False
+    ):
+        """Compile the QPs of transition C{start} to C{end}.
+        
+        @param warm_start: start the solver from the
+            previous solution of the same QP.
+            Useful for successive nearby C{x0}.
+        @type warm_start: bool
+        """
+        part = abstraction.ppp
+        regions = part.regions
+        
+        ofts = abstraction.ts
+        original_regions = abstraction.orig_ppp
+        orig = abstraction._ppp2orig
+        
+        params = abstraction.disc_params
+        N = params['N']
+        conservative = params['conservative']
+        closed_loop = params['closed_loop']
+        
+        n = ssys.A.shape[1]
+        m = ssys.B.shape[1]
+        
+        if (len(R) == 0) and (len(Q) == 0) and \
+        (len(r) == 0) and (mid_weight == 0):
+            # Default behavior
+            mid_weight = 3
+        if len(R) == 0:
+            R = np.zeros([N*n, N*n])
+        if len(Q) == 0:
+            Q = np.eye(N*m)
+        if len(r) == 0:
+            r = np.zeros([N*n, 1])
+        
+        if (R.shape[0] != R.shape[1]) or (R.shape[0] != N*n):
+            raise Exception("get_input: "
+                "R must be square and have side N * dim(state space)")
+        
+        if (Q.shape[0] != Q.shape[1]) or (Q.shape[0] != N*m):
+            raise Exception("get_input: "
+                "Q must be square and have side N * dim(input space)")
+        if ofts is not None:
+            if end not in ofts.states.post(start):
+                raise Exception('get_input: '
+                    'no transition from state s' +str(start) +
+                    ' to state s' +str(end)
+                )
+        else:
+            print("get_input: "
+                "Warning, no transition matrix found, assuming feasible")
+        
+        if (not conservative) & (orig is None):
+            print("List of original proposition preserving "
+                "partitions not given, reverting to conservative mode")
+            conservative = True
+        
+        P_start = regions[start]
+        P_end = regions[end]
+        
+        if conservative:
+            # Take convex hull or P_start as constraint
+            if len(P_start) > 0:
+                if len(P_start) > 1:
+                    # Take convex hull
+                    vert = pc.extreme(P_start[0])
+                    for i in range(1, len(P_start)):
+                        vert = np.vstack([
+                            vert,
+                            pc.extreme(P_start[i])
+                        ])
+                    P1 = pc.qhull(vert)
+                else:
+                    P1 = P_start[0]
             else:
-                P1 = P_start[0]
+                P1 = P_start
         else:
-            P1 = P_start
-    else:
-        # Take original proposition preserving cell as constraint
-        P1 = original_regions[orig[start]]
-    
-    if len(P_end) > 0:
-        low_cost = np.inf
-        low_u = np.zeros([N,m])
+            # Take original proposition preserving cell as constraint
+            P1 = original_regions[orig[start]]
+            # QP constraints need a Polytope
+            if len(P1) == 1:
+                P1 = P1[0]
         
-        # for each polytope in target region
-        for P3 in P_end:
+        if len(P_end) > 0:
+            targets = list(P_end)
+        else:
+            targets = [P_end]
+        
+        # one QP for each polytope in target region
+        idx = range((N-1)*n, N*n)
+        self.qps = []
+        for P3 in targets:
+            R3 = R.copy()
+            r3 = np.array(r, dtype=float).reshape(N*n, 1)
             if mid_weight > 0:
                 rc, xc = pc.cheby_ball(P3)
-                R[
-                    np.ix_(
-                        range(n*(N-1), n*N),
-                        range(n*(N-1), n*N)
-                    )
-                ] += mid_weight*np.eye(n)
-                
-                r[idx, :] += -mid_weight*xc
-            
+                R3[np.ix_(idx, idx)] += mid_weight*np.eye(n)
+                r3[idx, :] += -mid_weight*np.reshape(xc, (n, 1))
             try:
-                u, cost = get_input_helper(
-                    x0, ssys, P1, P3, N, R, r, Q,
-                    closed_loop=closed_loop
+                qp = _compile_qp(ssys, P1, P3, N, R3, r3, Q,
+                                 closed_loop=closed_loop)
+            except:
+                if len(P_end) == 0:
+                    raise
+                continue
+            self.qps.append((P3, qp))
+        
+        self.ssys = ssys
+        self.P1 = P1
+        self.N = N
+        self.m = m
+        self.multiple_targets = len(P_end) > 0
+        self.warm_start = warm_start
+        self._initvals = [None] * len(self.qps)
+    
+    def get_input(self, x0, test_result=False):
+        """Return input sequence that drives C{x0} to the end state.
+        
+        See L{abstract.get_input}.
+        
+        @rtype: (N x m) numpy 2darray
+        """
+        x0 = np.asarray(x0, dtype=float).flatten()
+        low_cost = np.inf
+        low_u = np.zeros([self.N, self.m])
+        P3 = None
+        for k, (target, qp) in enumerate(self.qps):
+            try:
+                u, cost, sol = _solve_qp(
+                    qp, x0, self.N, self.m, self._initvals[k]
                 )
-                r[idx, :] += mid_weight*xc
             except:
-                r[idx, :] += mid_weight*xc
+                if not self.multiple_targets:
+                    raise
                 continue
-            
+            if self.warm_start:
+                # the slacks of a solution are not strictly positive,
+                # so only the primal point can start the solver
+                self._initvals[k] = {'x':sol['x']}
             if cost < low_cost:
                 low_u = u
                 low_cost = cost
+                P3 = target
         
         if low_cost == np.inf:
             raise Exception("get_input: Did not find any trajectory")
-    else:
-        P3 = P_end
-        if mid_weight > 0:
-            rc, xc = pc.cheby_ball(P3)
-            R[
-                np.ix_(
-                    range(n*(N-1), n*N),
-                    range(n*(N-1), n*N)
-                )
-            ] += mid_weight*np.eye(n)
-            r[idx, :] += -mid_weight*xc
-        low_u, cost = get_input_helper(
-            x0, ssys, P1, P3, N, R, r, Q,
-            closed_loop=closed_loop
-        )
         
-    if test_result:
-        good = is_seq_inside(x0, low_u, ssys, P1, P3)
-        if not good:
-            print("Calculated sequence not good")
-    return low_u
+        if test_result:
+            good = is_seq_inside(x0, low_u, self.ssys, self.P1, P3)
+            if not good:
+                print("Calculated sequence not good")
+        return low_u
+    
+    def get_inputs(self, x0):
+        """Return input sequences for many initial states.
+        
+        The terms that depend on the initial states are
+        computed for all of them at once.
+        If C{warm_start} is set, then each QP starts
+        from the solution for the previous state.
+        
+        @param x0: initial states, one per row
+        @type x0: numpy 2darray
+        
+        @return: C{u[i, k, :]} is the input at time k from C{x0[i]},
+            C{nan} if there is no trajectory from C{x0[i]}.
+        @rtype: (len(x0) x N x m) numpy 3darray
+        """
+        x0 = np.atleast_2d(np.asarray(x0, dtype=float))
+        n_states = x0.shape[0]
+        
+        low_cost = np.empty(n_states)
+        low_cost.fill(np.inf)
+        low_u = np.empty([n_states, self.N, self.m])
+        low_u.fill(np.nan)
+        for k, (target, qp) in enumerate(self.qps):
+            P, G, M, Lx, qx, q0 = qp
+            h_all = M - Lx.dot(x0.T)
+            q_all = qx.dot(x0.T) + q0
+            initvals = self._initvals[k]
+            for i in xrange(n_states):
+                sol = solvers.qp(P, matrix(q_all[:, i:i+1]), G,
+                                 matrix(h_all[:, i:i+1]),
+                                 initvals=initvals)
+                if sol['status'] != 'optimal':
+                    continue
+                if self.warm_start:
+                    initvals = {'x':sol['x']}
+                cost = sol['primal objective']
+                if cost < low_cost[i]:
+                    low_cost[i] = cost
+                    low_u[i] = np.array(sol['x']).reshape(self.N, self.m)
+            self._initvals[k] = initvals
+        return low_u
+
+class ControllerCache(object):
+    """Bounded cache of L{TransitionController}s.
+    
+    Controllers are keyed by the transition and cost parameters.
+    When more than C{max_size} are stored,
+    the least recently used one is dropped.
+    
+    Example::
+        
+        cache = ControllerCache()
+        u = get_input(x0, ssys, abstraction, start, end, cache=cache)
+    """
+    def __init__(self, max_size=128, warm_start=False):
+        """Store up to C{max_size} controllers.
+        
+        @param warm_start: passed to new L{TransitionController}s
+        """
+        self.max_size = max_size
+        self.warm_start = warm_start
+        self.hits = 0
+        self.misses = 0
+        self._controllers = collections.OrderedDict()
+    
+    def __len__(self):
+        return len(self._controllers)
+    
+    def __str__(self):
+        s = 'Controller cache with: ' + str(len(self)) + ' controllers\n'
+        s += '\t hits: ' + str(self.hits)
+        s += ', misses: ' + str(self.misses) + '\n'
+        return s
+    
+    def get(
+        self, ssys, abstraction, start, end,
+        R=[], r=[], Q=[], mid_weight=0.0
+    ):
+        """Return controller for transition, compiling it if needed.
+        
+        @rtype: L{TransitionController}
+        """
+        h = hashlib.sha1()
+        for x in (start, end, R, r, Q, mid_weight):
+            _fingerprint(h, x)
+        key = (id(ssys), id(abstraction), h.hexdigest())
+        
+        c = self._controllers.pop(key, None)
+        # ids of collected objects can be reused
+        if c is not None and c.ssys is ssys and c.abstraction is abstraction:
+            self.hits += 1
+        else:
+            self.misses += 1
+            c = TransitionController(
+                ssys, abstraction, start, end, R, r, Q, mid_weight,
+                warm_start=self.warm_start
+            )
+            c.abstraction = abstraction
+        self._controllers[key] = c
+        
+        while len(self._controllers) > self.max_size:
+            self._controllers.popitem(last=False)
+        return c
 
 def get_input_helper(
     x0, ssys, P1, P3, N, R, r, Q,
     closed_loop=True
 ):
     """Calculates the sequence u_seq such that:
-    
+      
       - x(t+1) = A x(t) + B u(t) + K
       - x(k) \in P1 for k = 0,...N
       - x(N) \in P3
@@ -320,14 +488,29 @@ def get_input_helper(
     
     and minimizes x'Rx + 2*r'x + u'Qu
     """
-    n = ssys.A.shape[1]
     m = ssys.B.shape[1]
+    qp = _compile_qp(ssys, P1, P3, N, R, r, Q, closed_loop)
+    u, cost, sol = _solve_qp(qp, x0, N, m)
+    return u, cost
+
+def _compile_qp(ssys, P1, P3, N, R, r, Q, closed_loop=True):
+    """Return the QP of L{get_input_helper} as affine in C{x0}.
+    
+    The QP is::
+        
+        min 1/2 u'Pu + (qx x0 + q0)'u
+        s.t. G u <= M - Lx x0
+    
+    @return: C{(P, G, M, Lx, qx, q0)},
+        with C{P, G} as C{cvxopt.matrix}
+    """
+    n = ssys.A.shape[1]
     
     list_P = []
     if closed_loop:
         temp_part = P3
         list_P.append(P3)
-        for i in xrange(N-1,0,-1): 
+        for i in xrange(N-1,0,-1):
             temp_part = solve_feasible(
                 P1, temp_part, ssys, N=1,
                 closed_loop=False, trans_set=P1
@@ -348,31 +531,28 @@ def get_input_helper(
     
     # Separate L matrix
     Lx = L[:,range(n)]
-    Lu = L[:,range(n,L.shape[1])] 
+    Lu = L[:,range(n,L.shape[1])]
     
-    M = M - Lx.dot(x0).reshape(Lx.shape[0],1)
-        
     # Constraints
     G = matrix(Lu)
-    h = matrix(M)
-
+    
     B_diag = ssys.B
     for i in xrange(N-1):
         B_diag = _block_diag2(B_diag,ssys.B)
     K_hat = np.tile(ssys.K, (N,1))
-
+    
     A_it = ssys.A.copy()
     A_row = np.zeros([n, n*N])
     A_K = np.zeros([n*N, n*N])
     A_N = np.zeros([n*N, n])
-
+    
     for i in xrange(N):
         A_row = ssys.A.dot(A_row)
         A_row[np.ix_(
             range(n),
             range(i*n, (i+1)*n)
         )] = np.eye(n)
-
+        
         A_N[np.ix_(
             range(i*n, (i+1)*n),
             range(n)
@@ -384,18 +564,29 @@ def get_input_helper(
         )] = A_row
         
         A_it = ssys.A.dot(A_it)
-        
+    
     Ct = A_K.dot(B_diag)
     P = matrix(Q + Ct.T.dot(R).dot(Ct) )
-    q = matrix(
-        np.dot(
-            np.dot(x0.reshape(1, x0.size), A_N.T) +
-            A_K.dot(K_hat).T, R.dot(Ct)
-        ) +
-        r.T.dot(Ct)
-    ).T 
+    RCt = R.dot(Ct)
+    qx = A_N.T.dot(RCt).T
+    q0 = (A_K.dot(K_hat).T.dot(RCt) + r.T.dot(Ct)).T
+    
+    return P, G, M, Lx, qx, q0
+
+def _solve_qp(qp, x0, N, m, initvals=None):
+    """Solve QP from L{_compile_qp} for initial state C{x0}.
+    
+    @param initvals: solution to start from
+    
+    @return: C{(u, cost, sol)}, where C{sol} is
+        the solution returned by C{cvxopt}
+    """
+    P, G, M, Lx, qx, q0 = qp
+    x0 = x0.reshape(x0.size, 1)
+    h = matrix(M - Lx.dot(x0))
+    q = matrix(qx.dot(x0) + q0)
     
-    sol = solvers.qp(P, q, G, h)
+    sol = solvers.qp(P, q, G, h, initvals=initvals)
     
     if sol['status'] != "optimal":
         raise Exception("getInputHelper: "
@@ -405,7 +596,7 @@ def get_input_helper(
     u = np.array(sol['x']).flatten()
     cost = sol['primal objective']
     
-    return u.reshape(N, m), cost
+    return u.reshape(N, m), cost, sol
 
 def is_seq_inside(x0, u_seq, ssys, P0, P1):
     """Checks if the plant remains inside P0 for time t = 1, ... N-1
@@ -424,31 +615,134 @@ def is_seq_inside(x0, u_seq, ssys, P0, P1):
     @return: C{True} if x(k) \in P0 for k = 1, .. N-1 and x(N) \in P1.
         C{False} otherwise  
     """
-    N = u_seq.shape[0]
-    x = x0.reshape(x0.size, 1)
+    x0 = np.asarray(x0).reshape(1, x0.size)
+    u_seq = u_seq.reshape((1,) + u_seq.shape)
+    inside, first = are_seqs_inside(x0, u_seq, ssys, P0, P1)
+    return bool(inside[0])
+
+def are_seqs_inside(x0, u_seq, ssys, P0, P1, w_seq=None):
+    """Vectorized L{is_seq_inside} for many trajectories.
+    
+    All trajectories are propagated together, one time step
+    at a time, and their states are checked against the
+    halfspaces of C{P0} or C{P1} at once.
+    
+    @param x0: initial states, one per row
+    @type x0: (n_traj x n) numpy 2darray
+    
+    @param u_seq: C{u_seq[i, k, :]} is the input at time k
+        of trajectory i. An (N x m) array applies to all.
+    @type u_seq: (n_traj x N x m) numpy 3darray
+    
+    @param ssys: dynamics
+    @type ssys: L{LtiSysDyn}
+    
+    @param P0: C{Polytope} or C{Region} where x(k)
+        should remain for k = 1, ... N-1
+    
+    @param P1: C{Polytope} or C{Region} where x(N) should be
+    
+    @param w_seq: disturbance, C{w_seq[i, k, :]} at time k
+        of trajectory i, e.g., from L{sample_disturbance}.
+        If C{None}, then no disturbance.
+    @type w_seq: (n_traj x N x p) numpy 3darray
+    
+    @return: C{(inside, first_violation)}, where
+        C{inside[i]} is C{True} if trajectory i
+        passes the test of L{is_seq_inside}, and
+        C{first_violation[i]} is the first time k >= 1
+        that it fails, or -1 if it passes.
+    @rtype: (bool array, int array) of length n_traj
+    """
+    x = np.atleast_2d(np.asarray(x0, dtype=float))
+    n_traj = x.shape[0]
+    if u_seq.ndim == 2:
+        u_seq = np.tile(u_seq, (n_traj, 1, 1))
+    N = u_seq.shape[1]
     
     A = ssys.A
     B = ssys.B
     if len(ssys.K) == 0:
-        K = np.zeros(x.shape)
+        K = np.zeros(x.shape[1])
     else:
-        K = ssys.K
-    
-    inside = True
-    for i in xrange(N-1):
-        u = u_seq[i,:].reshape(u_seq[i, :].size, 1)
-        x = A.dot(x) + B.dot(u) + K
+        K = ssys.K.flatten()
+    
+    first = np.empty(n_traj, dtype=int)
+    first.fill(-1)
+    for k in xrange(N):
+        x = x.dot(A.T) + u_seq[:, k, :].dot(B.T) + K
+        if w_seq is not None:
+            x += w_seq[:, k, :].dot(ssys.E.T)
         
-        if not pc.is_inside(P0, x):
-            inside = False
+        if k < N - 1:
+            inside = _contains(P0, x)
+        else:
+            inside = _contains(P1, x)
+        first[~inside & (first < 0)] = k + 1
+    return first < 0, first
+
+def _contains(P, x):
+    """Return C{pc.is_inside(P, x[i, :])} for each row i of C{x}.
     
-    un_1 = u_seq[N-1,:].reshape(u_seq[N-1, :].size, 1)
-    xn = A.dot(x) + B.dot(un_1) + K
+    @type P: C{Polytope} or C{Region}
+    @rtype: bool array
+    """
+    if isinstance(P, pc.Polytope):
+        polys = [P]
+    else:
+        polys = list(P)
+    inside = np.zeros(x.shape[0], dtype=bool)
+    for p in polys:
+        b = p.b.reshape(1, p.b.size)
+        inside |= (x.dot(p.A.T) - b < pc.polytope.ABS_TOL).all(axis=1)
+    return inside
+
+def sample_disturbance(ssys, n_traj, N, seed=None, max_rounds=100):
+    """Sample disturbances uniformly from C{ssys.Wset}.
     
-    if not pc.is_inside(P1, xn):
-        inside = False
+    Uses rejection sampling in the bounding box of C{Wset}.
+    If C{Wset} is not full-dimensional, e.g., a segment in
+    the plane, then almost no samples are accepted.
     
-    return inside
+    @param seed: for C{numpy.random.RandomState}
+    
+    @param max_rounds: number of batches of samples to try,
+        each twice as large as the number of samples missing
+    @type max_rounds: int
+    
+    @return: C{w_seq} for L{are_seqs_inside},
+        zero if C{ssys} has no disturbance.
+    @rtype: (n_traj x N x p) numpy 3darray
+    
+    @raise ValueError: if fewer samples than needed are
+        accepted after C{max_rounds} batches.
+    """
+    p = ssys.E.shape[1]
+    W = ssys.Wset
+    w = np.zeros([n_traj * N, p])
+    if W is None or len(W.A) == 0:
+        return w.reshape(n_traj, N, p)
+    
+    rs = np.random.RandomState(seed)
+    l, u = W.bounding_box
+    l = l.flatten()
+    u = u.flatten()
+    n_found = 0
+    n_tried = 0
+    for i in xrange(max_rounds):
+        if n_found == len(w):
+            break
+        c = rs.uniform(l, u, size=(2 * (len(w) - n_found), p))
+        n_tried += len(c)
+        c = c[_contains(W, c)][:len(w) - n_found]
+        w[n_found:n_found + len(c)] = c
+        n_found += len(c)
+    if n_found < len(w):
+        raise ValueError(
+            'sampled ' + str(n_found) + ' of ' + str(len(w)) +
+            ' disturbances: ' + str(n_tried) + ' points of the ' +
+            'bounding box of Wset tried, is Wset full-dimensional ?')
+    return w.reshape(n_traj, N, p)
     
 def find_discrete_state(x0, part):
     """Return index identifying the discrete state
@@ -463,7 +757,9 @@ def find_discrete_state(x0, part):
     @param x0: initial continuous state
     @type x0: numpy 1darray
     
-    @param part: state space partition
+    @param part: state space partition.
+        If it has an index, then that is used,
+        see L{PropPreservingPartition.build_index}.
     @type part: L{PropPreservingPartition}
     
     @return: if C{x0} belongs to some
@@ -474,7 +770,34 @@ def find_discrete_state(x0, part):
         C{x0} does not belong to any discrete state.
     @rtype: int
     """
+    index = getattr(part, 'index', None)
+    if index is not None:
+        return index.find(x0)
+    
     for (i, region) in enumerate(part):
         if pc.is_inside(region, x0):
              return i
     return None
+
+def find_discrete_states(x, part):
+    """Return indices of the discrete states of many continuous states.
+    
+    Batch version of L{find_discrete_state}.
+    Uses the index of C{part}, see
+    L{PropPreservingPartition.build_index}.
+    If C{part} has no index, then a temporary one is built.
+    
+    @param x: continuous states, one per row
+    @type x: numpy 2darray
+    
+    @param part: state space partition
+    @type part: L{PropPreservingPartition}
+    
+    @return: index of the discrete state of each row of C{x},
+        -1 for states that belong to no discrete state
+    @rtype: numpy 1darray of int
+    """
+    index = getattr(part, 'index', None)
+    if index is None:
+        index = RegionIndex(part.regions)
+    return index.find_many(x)
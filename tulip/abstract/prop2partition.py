@@ -40,6 +40,7 @@ logger = logging.getLogger(__name__)
 
 import warnings
 import copy
+import itertools
 
 import numpy as np
 from scipy import sparse as sp
@@ -80,6 +81,7 @@ def prop2part(state_space, cont_props_dict):
     
     for cur_prop in cont_props_dict:
         cur_prop_poly = cont_props_dict[cur_prop]
+        prop_lo, prop_hi = cur_prop_poly.bounding_box
         
         num_reg = len(regions)
         prop_holds_reg = []
@@ -91,6 +93,13 @@ def prop2part(state_space, cont_props_dict):
             
             prop_now = regions[i].props.copy()
             
+            # disjoint bounding boxes ?
+            # (keep same object, which caches its box)
+            reg_lo, reg_hi = regions[i].bounding_box
+            if _boxes_disjoint(reg_lo, reg_hi, prop_lo, prop_hi):
+                regions.append(regions[i])
+                continue
+            
             dummy = region_now.intersect(cur_prop_poly)
             
             # does cur_prop hold in dummy ?
@@ -141,7 +150,7 @@ def prop2part(state_space, cont_props_dict):
         prop_regions = copy.deepcopy(cont_props_dict)
     )
     
-    mypartition.adj = pc.find_adjacent_regions(mypartition).copy()
+    mypartition.adj = find_adjacent_regions(regions)
     
     return mypartition
 
@@ -174,7 +183,7 @@ def part2convex(ppp):
             cvxpart.regions.append(region_now)
             new2old += [i]
     
-    cvxpart.adj = pc.find_adjacent_regions(cvxpart).copy()
+    cvxpart.adj = find_adjacent_regions(cvxpart.regions)
     
     return (cvxpart, new2old)
     
@@ -222,8 +231,11 @@ def pwa_partition(pwa_sys, ppp, abs_tol=1e-5):
     new_list = []
     subsys_list = []
     parents = []
+    index = RegionIndex(ppp.regions)
     for i, subsys in enumerate(pwa_sys.list_subsys):
-        for j, region in enumerate(ppp.regions):
+        l, u = subsys.domain.bounding_box
+        for j in index.overlapping(l, u):
+            region = ppp.regions[j]
             isect = region.intersect(subsys.domain)
             
             if pc.is_fulldim(isect):
@@ -251,19 +263,8 @@ def pwa_partition(pwa_sys, ppp, abs_tol=1e-5):
                 subsys_list.append(i)
     
     # compute spatial adjacency matrix
-    n = len(new_list)
-    adj = sp.lil_matrix((n, n), dtype=np.int8)
-    for i, ri in enumerate(new_list):
-        pi = parents[i]
-        for j, rj in enumerate(new_list[0:i]):
-            pj = parents[j]
-            
-            if (ppp.adj[pi, pj] == 1) or (pi == pj):
-                if pc.is_adjacent(ri, rj):
-                    adj[i, j] = 1
-                    adj[j, i] = 1
-        adj[i, i] = 1
-            
+    adj = find_adjacent_regions(new_list, parents, ppp.adj)
+    
     new_ppp = PropPreservingPartition(
         domain = ppp.domain,
         regions = new_list,
@@ -292,6 +293,11 @@ def add_grid(ppp, grid_size=None, num_grid_pnts=None, abs_tol=1e-10):
     Note: There could be numerical instabilities when the continuous 
     propositions in ppp do not align well with the grid resulting in very small 
     regions. Performace significantly degrades without glpk.
+    
+    Grid boxes that lie inside a region are kept as they are,
+    and their adjacency follows from the grid,
+    so only boxes that straddle region boundaries
+    are intersected and tested for adjacency as polytopes.
     """
     if (grid_size!=None)&(num_grid_pnts!=None):
         raise Exception("add_grid: Only one of the grid size or number of \
@@ -342,37 +348,91 @@ def add_grid(ppp, grid_size=None, num_grid_pnts=None, abs_tol=1e-10):
             raise Exception("add_grid: "
                 "num_grid_pnts isn't given in a correct format.")
     
-    j=0
-    list_grid=dict()
-    
-    while j<dim:
-        list_grid[j] = compute_interval(
+    # grid cells, first dimension varying slowest
+    intervals = [
+        np.array(compute_interval(
             float(domain_bb[0][j]),
             float(domain_bb[1][j]),
             size_list[j],
             abs_tol
-        )
-        if j>0:
-            if j==1:
-                re_list=list_grid[j-1]
-                re_list=product_interval(re_list, list_grid[j])
-            else:
-                re_list=product_interval(re_list, list_grid[j])
-        j+=1
+        ))
+        for j in xrange(dim)
+    ]
+    shape = tuple(len(x) for x in intervals)
+    grid_idx = np.indices(shape).reshape(dim, -1).T
+    lo = np.column_stack([intervals[j][grid_idx[:, j], 0]
+                          for j in xrange(dim)])
+    hi = np.column_stack([intervals[j][grid_idx[:, j], 1]
+                          for j in xrange(dim)])
+    
+    new_list, parent, cell_box, whole = _grid_cells(ppp, lo, hi, abs_tol)
+    adj = _grid_adjacency(new_list, parent, cell_box, whole,
+                          shape, ppp.adj)
+    
+    # cells are subsets of the regions of ppp, so of its domain
+    new_ppp = PropPreservingPartition(
+        domain = ppp.domain,
+        regions = new_list,
+        adj = adj,
+        prop_regions = ppp.prop_regions,
+        check = False
+    )
+    new_ppp.is_symbolic()
+    return new_ppp
+
+def _grid_cells(ppp, lo, hi, abs_tol):
+    """Intersect the grid boxes C{[lo, hi]} with the regions of C{ppp}.
+    
+    A box inside a polytope of a region is a cell as it is,
+    found for all boxes at once by comparing the
+    support function of each box with the halfspaces.
+    Only the boxes that straddle region boundaries are
+    intersected with the regions that their box overlaps.
+    
+    @return: C{(new_list, parent, cell_box, whole)}, where
+        for each cell, in the order of boxes, then regions:
         
+          - C{parent}: index of its region in C{ppp}
+          - C{cell_box}: index of its grid box
+          - C{whole}: C{True} if the cell equals its box
+    """
+    center = (lo + hi) / 2.0
+    half = (hi - lo) / 2.0
+    n_boxes = lo.shape[0]
+    
+    owner = -np.ones(n_boxes, dtype=int)
+    for j, region in enumerate(ppp.regions):
+        if isinstance(region, pc.Polytope):
+            polys = [region]
+        else:
+            polys = list(region)
+        for poly in polys:
+            # max of A x over each box
+            support = center.dot(poly.A.T) + half.dot(np.abs(poly.A).T)
+            inside = (support <= poly.b.flatten() + abs_tol).all(axis=1)
+            owner[(owner < 0) & inside] = j
+    
+    index = RegionIndex(ppp.regions)
     new_list = []
     parent = []
-    for i in xrange(len(re_list)):
-        temp_list=list()
-        j=0
-        while j<dim*2:
-            temp_list.append([re_list[i][j],re_list[i][j+1]])
-            j=j+2
-        for j in xrange(len(ppp.regions)):
-            tmp = pc.box2poly(temp_list)
+    cell_box = []
+    whole = []
+    for i in xrange(n_boxes):
+        box = np.column_stack([lo[i], hi[i]])
+        j = owner[i]
+        if j >= 0:
+            cell = pc.Region([pc.box2poly(box)], [])
+            cell.props = ppp.regions[j].props.copy()
+            new_list.append(cell)
+            parent.append(int(j))
+            cell_box.append(i)
+            whole.append(True)
+            continue
+        
+        tmp = pc.box2poly(box)
+        for j in index.overlapping(lo[i], hi[i]):
             isect = tmp.intersect(ppp.regions[j], abs_tol)
             
-            #if pc.is_fulldim(isect):
             rc, xc = pc.cheby_ball(isect)
             if rc > abs_tol/2:
                 if rc < abs_tol:
@@ -383,24 +443,165 @@ def add_grid(ppp, grid_size=None, num_grid_pnts=None, abs_tol=1e-10):
                     isect = pc.Region([isect], [])
                 isect.props = ppp.regions[j].props.copy()
                 new_list.append(isect)
-                parent.append(j)   
-    
-    adj = sp.lil_matrix((len(new_list), len(new_list)), dtype=np.int8)
-    for i in xrange(len(new_list)):
-        adj[i,i] = 1
-        for j in xrange(i+1, len(new_list)):
-            if (ppp.adj[parent[i], parent[j]] == 1) or \
-                    (parent[i] == parent[j]):
-                if pc.is_adjacent(new_list[i], new_list[j]):
-                    adj[i,j] = 1
-                    adj[j,i] = 1
-            
-    return PropPreservingPartition(
-        domain = ppp.domain,
-        regions = new_list,
-        adj = adj,
-        prop_regions = ppp.prop_regions
-    )
+                parent.append(j)
+                cell_box.append(i)
+                whole.append(False)
+    return new_list, parent, cell_box, whole
+
+def _grid_adjacency(new_list, parent, cell_box, whole, shape, parent_adj):
+    """Return adjacency of the cells of a grid refinement.
+    
+    Cells are adjacent only if their parents are the same or
+    adjacent, and their grid boxes touch.
+    Two whole cells (see L{_grid_cells}) in touching boxes
+    are adjacent without calling C{polytope.is_adjacent}:
+    boxes that share a facet always are,
+    and boxes that touch at lower dimensional faces are,
+    if C{polytope.is_adjacent} says so for unit boxes
+    that touch at a vertex.
+    Cells that are parts of a box are tested with
+    C{polytope.is_adjacent}, against the cells of touching boxes.
+    
+    @param shape: number of grid intervals in each dimension
+    @type shape: tuple of int
+    
+    @rtype: C{scipy.sparse.lil_matrix}
+    """
+    n = len(new_list)
+    dim = len(shape)
+    if n == 0:
+        return sp.lil_matrix((0, 0), dtype=np.int8)
+    
+    parent = np.array(parent, dtype=int)
+    cell_box = np.array(cell_box, dtype=int)
+    whole = np.array(whole, dtype=bool)
+    parent_adj = sp.csr_matrix(parent_adj)
+    
+    # grid boxes that touch, as offsets of grid indices
+    offsets = [np.array(d) for d in itertools.product([-1, 0, 1], repeat=dim)
+               if any(d)]
+    unit = pc.box2poly([[0., 1.]] * dim)
+    corner = pc.box2poly([[1., 2.]] * dim)
+    if not pc.is_adjacent(unit, corner):
+        offsets = [d for d in offsets if np.abs(d).sum() == 1]
+    
+    n_boxes = int(np.prod(shape))
+    box_cell = -np.ones(n_boxes, dtype=int)
+    box_cell[cell_box[whole]] = np.flatnonzero(whole)
+    
+    # whole cells, each unordered pair once
+    rows = [np.arange(n)]
+    cols = [np.arange(n)]
+    cells = np.flatnonzero(whole)
+    idx = np.array(np.unravel_index(cell_box[cells], shape)).T
+    for d in offsets:
+        if tuple(d) < (0,) * dim:
+            continue
+        nb = idx + d
+        valid = ((nb >= 0) & (nb < shape)).all(axis=1)
+        nb_cell = box_cell[np.ravel_multi_index(nb[valid].T, shape)]
+        found = nb_cell >= 0
+        rows.append(cells[valid][found])
+        cols.append(nb_cell[found])
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    pi = parent[rows]
+    pj = parent[cols]
+    keep = (pi == pj) | (np.asarray(parent_adj[pi, pj]).flatten() == 1)
+    rows = rows[keep]
+    cols = cols[keep]
+    
+    # cells that are parts of their box
+    box_cells = dict()
+    for k in xrange(n):
+        box_cells.setdefault(cell_box[k], []).append(k)
+    more_rows = []
+    more_cols = []
+    for k in np.flatnonzero(~whole):
+        i = np.array(np.unravel_index(cell_box[k], shape))
+        for d in [np.zeros(dim, dtype=int)] + offsets:
+            nb = i + d
+            if (nb < 0).any() or (nb >= shape).any():
+                continue
+            for m in box_cells.get(np.ravel_multi_index(nb, shape), []):
+                if m == k or (not whole[m] and m > k):
+                    continue
+                pk = parent[k]
+                pm = parent[m]
+                if pk != pm and parent_adj[pk, pm] != 1:
+                    continue
+                if pc.is_adjacent(new_list[k], new_list[m]):
+                    more_rows.append(k)
+                    more_cols.append(m)
+    rows = np.concatenate([rows, np.array(more_rows, dtype=int)])
+    cols = np.concatenate([cols, np.array(more_cols, dtype=int)])
+    
+    off = rows != cols
+    rows, cols = (np.concatenate([rows, cols[off]]),
+                  np.concatenate([cols, rows[off]]))
+    data = np.ones(len(rows), dtype=np.int8)
+    adj = sp.coo_matrix((data, (rows, cols)), shape=(n, n))
+    return adj.tolil()
+
+def find_adjacent_regions(regions, parents=None, parent_adj=None):
+    """Return adjacency matrix of C{regions}.
+    
+    Same as C{polytope.find_adjacent_regions},
+    but C{polytope.is_adjacent} is called only for pairs
+    of regions whose bounding boxes touch,
+    found with a L{RegionIndex}.
+    
+    If C{regions} refine another partition,
+    then its adjacency can prune more pairs:
+    regions are adjacent only if their parents are
+    the same or adjacent.
+    
+    @type regions: list of C{Region}
+    
+    @param parents: index of the region in
+        the coarser partition that contains each region
+    @type parents: list of int
+    
+    @param parent_adj: adjacency of the coarser partition
+    @type parent_adj: scipy sparse matrix
+    
+    @rtype: C{scipy.sparse.lil_matrix}
+    """
+    n = len(regions)
+    adj = sp.lil_matrix((n, n), dtype=np.int8)
+    if n == 0:
+        return adj
+    
+    # is_adjacent enlarges polytopes by its abs_tol,
+    # which can move vertices further
+    tol = 1e3 * pc.polytope.ABS_TOL
+    index = RegionIndex(regions)
+    
+    if parent_adj is not None:
+        parent_adj = sp.csr_matrix(parent_adj)
+    
+    for i, ri in enumerate(regions):
+        adj[i, i] = 1
+        l, u = ri.bounding_box
+        for j in index.overlapping(l, u, tol):
+            if j >= i:
+                break
+            if parent_adj is not None:
+                pi = parents[i]
+                pj = parents[j]
+                if pi != pj and parent_adj[pi, pj] != 1:
+                    continue
+            if pc.is_adjacent(ri, regions[j]):
+                adj[i, j] = 1
+                adj[j, i] = 1
+    return adj
+
+def _boxes_disjoint(lo1, hi1, lo2, hi2, tol=None):
+    """Return C{True} if boxes C{[lo1, hi1]}, C{[lo2, hi2]} are
+    apart by more than C{tol} along some axis."""
+    if tol is None:
+        tol = pc.polytope.ABS_TOL
+    return bool((hi1 < lo2 - tol).any() or (hi2 < lo1 - tol).any())
 
 #### Helper functions ####
 def compute_interval(low_domain, high_domain, size, abs_tol=1e-7):
@@ -446,6 +647,11 @@ class PropPreservingPartition(pc.MetricPartition):
           to continuous subsets
 
           type: dict of C{Polytope} or C{Region}
+
+      - index: spatial index of C{regions}, or C{None},
+          see L{build_index}
+
+          type: L{RegionIndex}
     
     See Also
     ========
@@ -497,6 +703,21 @@ class PropPreservingPartition(pc.MetricPartition):
         self.domain = domain
         super(PropPreservingPartition, self).__init__(domain)
         self.adj = adj
+        self.index = None
+    
+    def build_index(self, leaf_size=8):
+        """Build spatial index of C{regions} for point location.
+        
+        Once built, it is used by L{find_discrete_state}
+        and saved when the partition is pickled.
+        Build it again after changing C{regions}.
+        
+        @param leaf_size: see L{RegionIndex}
+        
+        @rtype: L{RegionIndex}
+        """
+        self.index = RegionIndex(self.regions, leaf_size)
+        return self.index
     
     def reg2props(self, region_index):
         return self.regions[region_index].props.copy()
@@ -622,6 +843,226 @@ class PropPreservingPartition(pc.MetricPartition):
             isect_poly.text(prop, ax, color=text_color)
         return ax
 
+class RegionIndex(object):
+    """Bounding box tree for point location in a partition.
+    
+    The bounding boxes of the polytopes of all regions are
+    arranged in a binary tree, each node bounding its children.
+    A query descends only into nodes whose box contains the point,
+    then checks the polytopes of the leaves it reaches.
+    For partitions of cells with bounded overlap of their boxes,
+    this takes logarithmic time in the number of cells.
+    
+    The index consists of arrays, so it can be pickled
+    together with the partition.
+    It is not updated when the regions change.
+    
+    See Also
+    ========
+    L{PropPreservingPartition.build_index},
+    L{find_controller.find_discrete_state}
+    """
+    def __init__(self, regions, leaf_size=8, abs_tol=None):
+        """Build index of C{regions}.
+        
+        @type regions: list of C{Region} or C{Polytope}
+        
+        @param leaf_size: max number of polytopes in a leaf
+        @type leaf_size: int
+        
+        @param abs_tol: a point is inside a polytope
+            if C{A x - b < abs_tol}, as in C{polytope.is_inside}.
+            Default is C{polytope.polytope.ABS_TOL}.
+        """
+        if abs_tol is None:
+            abs_tol = pc.polytope.ABS_TOL
+        self.abs_tol = abs_tol
+        self.n_regions = len(regions)
+        
+        # polytopes and the region that each belongs to
+        self.A = []
+        self.b = []
+        owner = []
+        lo = []
+        hi = []
+        for i, region in enumerate(regions):
+            if isinstance(region, pc.Polytope):
+                polys = [region]
+            else:
+                polys = list(region)
+            for poly in polys:
+                l, u = poly.bounding_box
+                self.A.append(poly.A)
+                self.b.append(poly.b.flatten())
+                owner.append(i)
+                lo.append(l.flatten())
+                hi.append(u.flatten())
+        self.owner = np.array(owner, dtype=int)
+        self.box_lo = np.array(lo)
+        self.box_hi = np.array(hi)
+        
+        self._node_lo = []
+        self._node_hi = []
+        self._child = []
+        self._leaf = []
+        self._order = []
+        if owner:
+            self._build(self.box_lo, self.box_hi,
+                        np.arange(len(owner)), leaf_size)
+        self.node_lo = np.array(self._node_lo)
+        self.node_hi = np.array(self._node_hi)
+        self.child = np.array(self._child, dtype=int).reshape(-1, 2)
+        self.leaf = np.array(self._leaf, dtype=int).reshape(-1, 2)
+        self.order = np.array(self._order, dtype=int)
+        del (self._node_lo, self._node_hi, self._child,
+             self._leaf, self._order)
+    
+    def _build(self, lo, hi, idx, leaf_size):
+        """Add node bounding the boxes C{idx}, return its index."""
+        k = len(self._child)
+        node_lo = lo[idx].min(axis=0)
+        node_hi = hi[idx].max(axis=0)
+        self._node_lo.append(node_lo)
+        self._node_hi.append(node_hi)
+        self._child.append([-1, -1])
+        
+        if len(idx) <= leaf_size:
+            self._leaf.append([len(self._order),
+                               len(self._order) + len(idx)])
+            # leaf polytopes in region order
+            self._order.extend(idx[np.argsort(self.owner[idx],
+                                              kind='mergesort')])
+            return k
+        self._leaf.append([0, 0])
+        
+        # split at median center along widest side
+        centers = lo[idx] + hi[idx]
+        axis = np.argmax(node_hi - node_lo)
+        s = idx[np.argsort(centers[:, axis], kind='mergesort')]
+        m = len(s) // 2
+        left = self._build(lo, hi, s[:m], leaf_size)
+        right = self._build(lo, hi, s[m:], leaf_size)
+        self._child[k] = [left, right]
+        return k
+    
+    def __len__(self):
+        return self.n_regions
+    
+    def find(self, x):
+        """Return index of first region that contains C{x}.
+        
+        @param x: continuous state
+        @type x: numpy 1darray
+        
+        @return: region index, or C{None} if C{x} is in no region
+        @rtype: int
+        """
+        x = np.asarray(x, dtype=float).flatten()
+        tol = self.abs_tol
+        found = None
+        stack = [0] if len(self.child) else []
+        while stack:
+            k = stack.pop()
+            if (x < self.node_lo[k] - tol).any() or \
+            (x > self.node_hi[k] + tol).any():
+                continue
+            if self.child[k, 0] >= 0:
+                stack.extend(self.child[k])
+                continue
+            start, stop = self.leaf[k]
+            for p in self.order[start:stop]:
+                i = self.owner[p]
+                if found is not None and i >= found:
+                    break
+                if (self.A[p].dot(x) - self.b[p] < tol).all():
+                    found = i
+        if found is None:
+            return None
+        return int(found)
+    
+    def overlapping(self, lo, hi, tol=None):
+        """Return regions with a polytope whose box meets C{[lo, hi]}.
+        
+        Regions that do not overlap the box C{[lo, hi]}
+        cannot intersect any set within it.
+        
+        @param lo, hi: corners of box
+        @type lo, hi: numpy array
+        
+        @param tol: boxes are enlarged by this much,
+            default is C{abs_tol}
+        
+        @return: region indices, in increasing order
+        @rtype: list of int
+        """
+        lo = np.asarray(lo, dtype=float).flatten()
+        hi = np.asarray(hi, dtype=float).flatten()
+        if tol is None:
+            tol = self.abs_tol
+        found = set()
+        stack = [0] if len(self.child) else []
+        while stack:
+            k = stack.pop()
+            if (hi < self.node_lo[k] - tol).any() or \
+            (lo > self.node_hi[k] + tol).any():
+                continue
+            if self.child[k, 0] >= 0:
+                stack.extend(self.child[k])
+                continue
+            start, stop = self.leaf[k]
+            for p in self.order[start:stop]:
+                if (hi >= self.box_lo[p] - tol).all() and \
+                (lo <= self.box_hi[p] + tol).all():
+                    found.add(int(self.owner[p]))
+        return sorted(found)
+    
+    def find_many(self, x):
+        """Return index of first region that contains each state.
+        
+        The tree is descended by all states at once.
+        
+        @param x: continuous states, one per row
+        @type x: numpy 2darray
+        
+        @return: region indices, -1 for states in no region
+        @rtype: numpy 1darray of int
+        """
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+        n = x.shape[0]
+        tol = self.abs_tol
+        found = np.empty(n, dtype=int)
+        found.fill(self.n_regions)
+        
+        if len(self.child):
+            pts = np.arange(n)
+            nodes = np.zeros(n, dtype=int)
+        else:
+            pts = nodes = np.zeros(0, dtype=int)
+        while len(pts):
+            inside = (
+                (x[pts] >= self.node_lo[nodes] - tol) &
+                (x[pts] <= self.node_hi[nodes] + tol)
+            ).all(axis=1)
+            pts = pts[inside]
+            nodes = nodes[inside]
+            
+            is_leaf = self.child[nodes, 0] < 0
+            for k in np.unique(nodes[is_leaf]):
+                q = pts[nodes == k]
+                start, stop = self.leaf[k]
+                for p in self.order[start:stop]:
+                    c = (self.A[p].dot(x[q].T).T - self.b[p] < tol).all(axis=1)
+                    found[q[c]] = np.minimum(found[q[c]], self.owner[p])
+            
+            pts = pts[~is_leaf]
+            nodes = nodes[~is_leaf]
+            pts = np.concatenate([pts, pts])
+            nodes = np.concatenate([self.child[nodes, 0],
+                                    self.child[nodes, 1]])
+        
+        found[found == self.n_regions] = -1
+        return found
+
 class PPP(PropPreservingPartition):
     """Alias to L{PropPreservingPartition}.
     
@@ -36,8 +36,22 @@ concern multiple aspects of solutions created by TuLiP and accordingly
 should not be placed under a specific subpackage, like tulip.transys.
 """
 from itertools import chain, repeat
+import json
+import numbers
+import struct
 import time
 
+import numpy as np
+
+from tulip.transys import machines
+
+
+# binary format of Mealy machines
+BINARY_MAGIC = b'TLPMEALY'
+BINARY_VERSION = 1
+_BINARY_ALIGN = 64
+_BINARY_DTYPE = '<i8'
+
 
 def write_python_case(filename, *args, **kwargs):
     """Convenience wrapper for writing output of python_case to file.
@@ -50,6 +64,17 @@ def write_python_case(filename, *args, **kwargs):
         f.write(python_case(*args, **kwargs))
 
 
+def write_python_table(filename, *args, **kwargs):
+    """Convenience wrapper for writing output of python_table to file.
+
+    @type  filename: str
+    @param filename: Name of file in which to place the code generated
+        by L{python_table}.
+    """
+    with open(filename, 'w') as f:
+        f.write(python_table(*args, **kwargs))
+
+
 def python_case(M, classname="TulipStrategy", start='Sinit'):
     """Export MealyMachine as Python class based on flat if-else block.
 
@@ -175,3 +200,345 @@ def python_case(M, classname="TulipStrategy", start='Sinit'):
                 args=','.join('\n{t}{v}={v}'.format(v=v, t=4*tab)
                               for v in M.inputs))
     return code
+
+
+def python_table(M, classname="TulipStrategy", start='Sinit'):
+    """Export MealyMachine as Python class based on a lookup table.
+
+    Same interface as the class generated by L{python_case},
+    but the transitions are stored as a table of tuples,
+    read into a C{dict} keyed by the state and input values
+    when the class is created.
+    So each call to C{move} takes constant time,
+    and the generated code is smaller and faster to compile.
+
+    Each transition label must assign a value to every
+    input and output, and these values must be hashable.
+    If several transitions are enabled, then the first one
+    in C{M.edges_iter} is taken, as in L{python_case}.
+
+    @type M: L{MealyMachine}
+    @type classname: C{str}
+    @param start: initial node in C{M}
+
+    @rtype: str
+    @return: valid Python code, see L{python_case}
+    """
+    tab = 4 * ' '
+    node_to_int = dict([(s, i) for i, s in enumerate(M)])
+    input_vars = [input_var for input_var in M.inputs] if M.inputs else []
+    output_vars = [output_var for output_var in M.outputs]
+    input_args = ', '.join(input_vars)
+    # table rows: state, inputs, next state, outputs
+    rows = list()
+    dead_ends = list()
+    for u in M:
+        i = node_to_int[u]
+        has_edges = False
+        for _, w, d in M.edges_iter(u, data=True):
+            has_edges = True
+            missing = set(input_vars).union(output_vars).difference(d)
+            if missing:
+                raise ValueError(
+                    'transition from {u} to {w} misses ports: {p}, '
+                    'use python_case instead'.format(u=u, w=w, p=missing))
+            row = ([i] + [d[k] for k in input_vars] +
+                   [node_to_int[w]] + [d[k] for k in output_vars])
+            rows.append('{t2}({row}),\n'.format(
+                t2=2*tab, row=', '.join(repr(x) for x in row)))
+        if not has_edges:
+            dead_ends.append(i)
+    code = (
+        'class {classname}(object):\n'
+        '{t}"""Mealy transducer.\n'
+        '\n'
+        '{t}Internal states are integers, the current state\n'
+        '{t}is stored in the attribute "state".\n'
+        '{t}To take a transition, call method "move".\n'
+        '\n'
+        '{t}The names of input variables are stored in the\n'
+        '{t}attribute "input_vars".\n'
+        '\n'
+        '{t}Transitions are looked up in the table "_moves",\n'
+        '{t}keyed by the current state and input values.\n'
+        '\n'
+        '{t}Automatically generated by tulip.dumpsmach on {date}\n'
+        '{t}To learn more about TuLiP, visit http://tulip-control.org\n'
+        '{t}"""\n'
+        '{t}# (state, inputs, next state, outputs)\n'
+        '{t}_transitions = [\n'
+        '{rows}'
+        '{t}]\n'
+        '{t}_moves = dict(\n'
+        '{t2}(x[:{n_key}], (x[{n_key}], x[{n_out}:]))\n'
+        '{t2}for x in reversed(_transitions))\n'
+        '{t}del _transitions\n'
+        '{t}_dead_ends = frozenset({dead_ends})\n'
+        '{t}_output_vars = {output_vars}\n'
+        '\n'
+        '{t}def __init__(self):\n'
+        '{t2}self.state = {sinit}\n'
+        '{t2}self.input_vars = {input_vars}\n'
+        '\n'
+        '{t}def move(self{comma}{input_args}):\n'
+        '{t2}"""Given inputs, take move and return outputs.\n'
+        '\n'
+        '{t2}@rtype: dict\n'
+        '{t2}@return: dictionary with keys of the output variable names:\n'
+        '{t2}    {outputs}\n'
+        '{t2}"""\n'
+        '{t2}try:\n'
+        '{t3}self.state, values = self._moves[(self.state, {input_args})]\n'
+        '{t2}except KeyError:\n'
+        '{t3}self._error({input_args})\n'
+        '{t2}return dict(zip(self._output_vars, values))\n'
+        '\n'
+        '{t}def _error(self{comma}{input_args}):\n'
+        '{t2}if self.state not in range({n_states}):\n'
+        '{t3}raise Exception("Unrecognized internal state: " + '
+        'str(self.state))\n'
+        '{t2}if self.state in self._dead_ends:\n'
+        '{t3}raise Exception("Reached dead-end state !")\n'
+        '{t2}raise ValueError("Unrecognized input: " + ('
+        '{inputs}).format({args}))\n'
+        ).format(
+            classname=classname,
+            t=tab,
+            t2=2*tab,
+            t3=3*tab,
+            date=time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime()),
+            rows=''.join(rows),
+            n_key=1 + len(input_vars),
+            n_out=2 + len(input_vars),
+            dead_ends=dead_ends,
+            output_vars=repr(tuple(output_vars)),
+            sinit=node_to_int[start],
+            input_vars=repr(input_vars),
+            comma=', ' if input_vars else '',
+            input_args=input_args,
+            outputs=[str(v) for v in M.outputs],
+            n_states=len(node_to_int),
+            inputs=''.join(
+                '\n{t}"{v} = {{{v}}}; "'.format(v=v, t=3*tab)
+                for v in M.inputs) or '""',
+            args=','.join('\n{t}{v}={v}'.format(v=v, t=4*tab)
+                          for v in M.inputs))
+    return code
+
+
+def write_binary(filename, M):
+    """Save Mealy machine in binary format, see L{load_binary}.
+
+    The file has:
+
+      - the bytes C{BINARY_MAGIC}
+      - the format version and header length as 32 bit unsigned
+        little-endian integers
+      - a JSON header with the ports, their domains,
+        the names of states and initial states, and
+        the offset, shape and type of each array
+      - the arrays, each aligned to 64 bytes:
+        C{indptr}, C{indices}, C{labels}, C{values} as in
+        L{transys.machines.CompactMealy}, and C{names}
+        if all state names are integers.
+
+    Port values that are not integers are stored as indices
+    into their domain. Boolean values are stored as integers.
+
+    @param M: every transition label must assign
+        a hashable value to every input and output,
+        and states must be named by C{int} or C{str}
+    @type M: L{MealyMachine} or L{transys.machines.CompactMealy}
+    """
+    if isinstance(M, machines.CompactMealy):
+        ports = list(M.ports)
+        states = list(M.states)
+        initial = list(M.initial)
+        str_domains = dict(M.str_domains)
+        values = np.asarray(M.values)
+        indptr = np.asarray(M.indptr)
+        indices = np.asarray(M.indices)
+        labels = np.asarray(M._labels())
+    else:
+        ports = list(M.inputs) + list(M.outputs)
+        states, initial, str_domains, values, indptr, indices, labels = (
+            _mealy_to_arrays(M, ports))
+    header = dict(
+        ports=ports,
+        inputs=_domains_to_json(M.inputs),
+        outputs=_domains_to_json(M.outputs),
+        str_domains=str_domains)
+    arrays = [('indptr', indptr), ('indices', indices),
+              ('labels', labels), ('values', values)]
+    is_int = [isinstance(u, numbers.Integral) and not isinstance(u, bool)
+              for u in states]
+    if all(is_int):
+        arrays.append(('names', np.array(states, dtype=np.int_)))
+        header['states'] = None
+    elif all(i or isinstance(u, basestring)
+             for i, u in zip(is_int, states)):
+        header['states'] = [int(u) if i else u
+                            for i, u in zip(is_int, states)]
+    else:
+        raise ValueError('states must be named by int or str')
+    header['initial'] = [
+        int(u) if isinstance(u, numbers.Integral) else u for u in initial]
+    # offsets relative to the end of the header, which is aligned
+    offset = 0
+    header['arrays'] = dict()
+    for name, a in arrays:
+        header['arrays'][name] = dict(
+            offset=offset, shape=list(a.shape), dtype=_BINARY_DTYPE)
+        offset += _aligned(a.size * np.dtype(_BINARY_DTYPE).itemsize)
+    h = json.dumps(header).encode('utf-8')
+    start = len(BINARY_MAGIC) + 8
+    h += b' ' * (_aligned(start + len(h)) - start - len(h))
+    with open(filename, 'wb') as f:
+        f.write(BINARY_MAGIC)
+        f.write(struct.pack('<II', BINARY_VERSION, len(h)))
+        f.write(h)
+        for name, a in arrays:
+            b = np.ascontiguousarray(a, dtype=_BINARY_DTYPE).tostring()
+            f.write(b)
+            f.write(b'\0' * (_aligned(len(b)) - len(b)))
+
+
+def load_binary(filename, mmap=True):
+    """Load Mealy machine saved by L{write_binary}.
+
+    The arrays are mapped to memory read-only with C{numpy.memmap},
+    so loading takes time proportional only to the header,
+    and processes that load the same file share its pages.
+
+    @param mmap: if C{False}, then read the arrays into memory
+    @type mmap: bool
+
+    @rtype: L{transys.machines.CompactMealy}
+    """
+    with open(filename, 'rb') as f:
+        magic = f.read(len(BINARY_MAGIC))
+        if magic != BINARY_MAGIC:
+            raise ValueError(
+                'not a Mealy machine in binary format: ' + str(filename))
+        version, n = struct.unpack('<II', f.read(8))
+        if version != BINARY_VERSION:
+            raise ValueError(
+                'unsupported version {v} of binary format, '
+                'expected {e}'.format(v=version, e=BINARY_VERSION))
+        header = json.loads(f.read(n).decode('utf-8'))
+    start = len(BINARY_MAGIC) + 8 + n
+    arrays = dict()
+    for name, d in header['arrays'].iteritems():
+        shape = tuple(d['shape'])
+        if np.prod(shape) == 0:
+            a = np.zeros(shape, dtype=d['dtype'])
+        elif mmap:
+            a = np.memmap(filename, dtype=d['dtype'], mode='r',
+                          offset=start + d['offset'], shape=shape)
+        else:
+            with open(filename, 'rb') as f:
+                f.seek(start + d['offset'])
+                a = np.fromfile(f, dtype=d['dtype'],
+                                count=int(np.prod(shape))).reshape(shape)
+        arrays[name] = a
+    states = header['states']
+    if states is None:
+        states = arrays['names'].tolist()
+    initial = [_from_json(u) for u in header['initial']]
+    str_domains = dict(
+        (str(k), [_from_json(x) for x in v])
+        for k, v in header['str_domains'].iteritems())
+    return machines.CompactMealy(
+        [_from_json(u) for u in states], initial,
+        [str(p) for p in header['ports']], arrays['values'],
+        arrays['indptr'], arrays['indices'],
+        _domains_from_json(header['inputs']),
+        _domains_from_json(header['outputs']),
+        str_domains, arrays['labels'])
+
+
+def _mealy_to_arrays(M, ports):
+    """Return arrays of L{write_binary} for L{MealyMachine} C{M}."""
+    states = list(M)
+    state_to_int = dict((u, i) for i, u in enumerate(states))
+    indptr = [0]
+    indices = list()
+    labels = list()
+    rows = dict()
+    for u in states:
+        for _, v, d in M.edges_iter(u, data=True):
+            missing = set(ports).difference(d)
+            if missing:
+                raise ValueError(
+                    'transition from {u} to {v} misses ports: '
+                    '{p}'.format(u=u, v=v, p=missing))
+            row = tuple(d[p] for p in ports)
+            labels.append(rows.setdefault(row, len(rows)))
+            indices.append(state_to_int[v])
+        indptr.append(len(indices))
+    table = sorted(rows, key=rows.get)
+    # encode values that are not integers
+    str_domains = dict()
+    columns = list()
+    for j, p in enumerate(ports):
+        col = [row[j] for row in table]
+        if all(isinstance(x, numbers.Integral) for x in col):
+            columns.append([int(x) for x in col])
+            continue
+        domain = M.inputs.get(p, M.outputs.get(p))
+        used = set(col)
+        if isinstance(domain, list) and used.issubset(domain):
+            domain = list(domain)
+        else:
+            domain = sorted(used)
+        code = dict((x, i) for i, x in enumerate(domain))
+        columns.append([code[x] for x in col])
+        str_domains[p] = domain
+    values = np.array(columns, dtype=np.int_).T.reshape(len(table),
+                                                         len(ports))
+    initial = list(M.states.initial)
+    return (states, initial, str_domains, values,
+            np.array(indptr, dtype=np.int_),
+            np.array(indices, dtype=np.int_),
+            np.array(labels, dtype=np.int_))
+
+
+def _aligned(n):
+    """Return C{n} rounded up to a multiple of C{_BINARY_ALIGN}."""
+    return -(-n // _BINARY_ALIGN) * _BINARY_ALIGN
+
+
+def _domains_to_json(ports):
+    """Return port domains as JSON, C{None} if not finite."""
+    d = dict()
+    for p, dom in ports.iteritems():
+        if isinstance(dom, (set, frozenset)):
+            d[p] = dict(type='set', values=sorted(dom))
+        elif isinstance(dom, (list, tuple)):
+            d[p] = dict(type='list', values=list(dom))
+        else:
+            d[p] = None
+    return d
+
+
+def _domains_from_json(d):
+    """Inverse of L{_domains_to_json}."""
+    ports = dict()
+    for p, dom in d.iteritems():
+        if dom is None:
+            ports[str(p)] = None
+        elif dom['type'] == 'set':
+            ports[str(p)] = set(_from_json(x) for x in dom['values'])
+        else:
+            ports[str(p)] = [_from_json(x) for x in dom['values']]
+    return ports
+
+
+def _from_json(x):
+    """Return C{str} for ASCII C{unicode} read from JSON."""
+    if isinstance(x, unicode):
+        try:
+            return str(x)
+        except UnicodeEncodeError:
+            pass
+    return x
@@ -43,13 +43,19 @@ Use the logging module to throttle verbosity.
 """
 from distutils.version import StrictVersion
 import logging
-import copy
+import array
 import os
+import re
 import subprocess
 import tempfile
+import threading
+import time
 import json
+from multiprocessing.pool import ThreadPool
 import xml.etree.ElementTree as ET
+from StringIO import StringIO
 import networkx as nx
+import numpy as np
 from tulip.spec import GRSpec, translate
 
 
@@ -199,9 +205,12 @@ def _untagdict(x, cast_f_keys=None, cast_f_values=None,
     else:
         return (elem.tag, di)
 
-def load_aut_xml(x, namespace=DEFAULT_NAMESPACE):
+def load_aut_xml(x, namespace=DEFAULT_NAMESPACE, compact=False):
     """Return strategy constructed from output of gr1c.
 
+    A string is parsed incrementally, and each node is
+    discarded from the XML tree once added to the strategy.
+
     @param x: a string or an instance of
         xml.etree.ElementTree._ElementInterface
 
@@ -213,6 +222,10 @@ def load_aut_xml(x, namespace=DEFAULT_NAMESPACE):
         string x.  If you are unsure what to do, try setting spec0 to
         whatever L{gr1cint.synthesize} was invoked with.
 
+    @param compact: if C{True}, then return L{CompactStrategy},
+        instead of C{networkx.DiGraph}
+    @type compact: bool
+
     @return: if a strategy is given in the XML string, return it as
         C{networkx.DiGraph}. Else, return (L{GRSpec}, C{None}), where
         the first element is the specification as read from the XML string.
@@ -222,33 +235,88 @@ def load_aut_xml(x, namespace=DEFAULT_NAMESPACE):
             "as a string or ElementTree._ElementInterface.")
 
     if isinstance(x, str):
-        elem = ET.fromstring(x)
+        events = ET.iterparse(StringIO(x), events=('start', 'end'))
     else:
-        elem = x
+        events = _xml_events(x)
+    # do not modify a tree given by the caller
+    clear = isinstance(x, str)
 
     if (namespace is None) or (len(namespace) == 0):
         ns_prefix = ""
     else:
         ns_prefix = "{"+namespace+"}"
 
-    if elem.tag != ns_prefix+"tulipcon":
-        raise TypeError("root tag should be tulipcon.")
-    if ("version" not in elem.attrib.keys()):
-        raise ValueError("unversioned tulipcon XML string.")
-    if int(elem.attrib["version"]) != 1:
-        raise ValueError("unsupported tulipcon XML version: "+
-            str(elem.attrib["version"]))
-
-    # Extract discrete variables and LTL specification
-    (tag_name, env_vardict, env_vars) = _untagdict(elem.find(
-        ns_prefix+"env_vars"), get_order=True)
-    (tag_name, sys_vardict, sys_vars) = _untagdict(elem.find(
-        ns_prefix+"sys_vars"), get_order=True)
+    root = None
+    env_vars = None
+    sys_vars = None
+    spec = None
+    aut_type = None
+    n_nodes = 0
+    builder = StrategyBuilder()
+    for event, elem in events:
+        if root is None:
+            root = elem
+            if elem.tag != ns_prefix+"tulipcon":
+                raise TypeError("root tag should be tulipcon.")
+            if ("version" not in elem.attrib.keys()):
+                raise ValueError("unversioned tulipcon XML string.")
+            if int(elem.attrib["version"]) != 1:
+                raise ValueError("unsupported tulipcon XML version: "+
+                    str(elem.attrib["version"]))
+            continue
+        if event == 'start':
+            if elem.tag == ns_prefix+"aut":
+                aut_type = elem.attrib.get("type")
+            continue
 
-    env_vars = _parse_vars(env_vars, env_vardict)
-    sys_vars = _parse_vars(sys_vars, sys_vardict)
+        # Extract discrete variables and LTL specification
+        if elem.tag == ns_prefix+"env_vars":
+            (tag_name, env_vardict, env_order) = _untagdict(
+                elem, get_order=True)
+            env_vars = _parse_vars(env_order, env_vardict)
+        elif elem.tag == ns_prefix+"sys_vars":
+            (tag_name, sys_vardict, sys_order) = _untagdict(
+                elem, get_order=True)
+            sys_vars = _parse_vars(sys_order, sys_vardict)
+        elif elem.tag == ns_prefix+"spec":
+            spec = _xml_spec(elem, env_vars, sys_vars, ns_prefix, namespace)
+        elif elem.tag == ns_prefix+"node":
+            # Assume version 1 of tulipcon XML
+            if aut_type != "basic":
+                raise ValueError(
+                    "Automaton class only recognizes type \"basic\".")
+            n_nodes += 1
+            _xml_node(elem, builder, env_order + sys_order,
+                      ns_prefix, namespace)
+            if clear:
+                elem.clear()
+        elif elem.tag == ns_prefix+"aut":
+            if n_nodes == 0 and elem.text is None:
+                aut_type = None
+            elif aut_type != "basic":
+                raise ValueError(
+                    "Automaton class only recognizes type \"basic\".")
+    if spec is None:
+        raise ValueError("invalid specification in tulipcon XML string.")
+    if aut_type is None:
+        mach = None
+        return (spec, mach)
 
-    s_elem = elem.find(ns_prefix+"spec")
+    A = builder.build(env_order + sys_order, env_vars, sys_vars)
+    if compact:
+        return A
+    return A.to_networkx()
+
+def _xml_events(elem):
+    """Yield C{iterparse} events for existing tree C{elem}."""
+    yield ('start', elem)
+    for child in elem:
+        for e in _xml_events(child):
+            yield e
+    yield ('end', elem)
+
+def _xml_spec(s_elem, env_vars, sys_vars, ns_prefix, namespace):
+    """Return L{GRSpec} from tulipcon XML element C{spec}."""
     spec = GRSpec(env_vars=env_vars, sys_vars=sys_vars)
     for spec_tag in ["env_init", "env_safety", "env_prog",
                      "sys_init", "sys_safety", "sys_prog"]:
@@ -260,58 +328,42 @@ def load_aut_xml(x, namespace=DEFAULT_NAMESPACE):
         li = [v.replace("&gt;", ">") for v in li]
         li = [v.replace("&amp;", "&") for v in li]
         setattr(spec, spec_tag, li)
+    return spec
+
+def _xml_node(node, builder, variables, ns_prefix, namespace):
+    """Add tulipcon XML element C{node} to C{builder}."""
+    this_id = int(node.find(ns_prefix+"id").text)
+    #this_name = node.find(ns_prefix+"anno").text  # Assume version 1
+    (tag_name, this_name_list) = _untaglist(node.find(ns_prefix+"anno"),
+                                            cast_f=int)
+    if len(this_name_list) == 2:
+        (mode, rgrad) = this_name_list
+    else:
+        (mode, rgrad) = (-1, -1)
+    (tag_name, this_child_list) = _untaglist(
+        node.find(ns_prefix+"child_list"),
+        cast_f=int
+    )
+    if tag_name != ns_prefix+"child_list":
+        # This really should never happen and may not even be
+        # worth checking.
+        raise ValueError("failure of consistency check " +
+            "while processing aut XML string.")
+    (tag_name, this_state) = _untagdict(node.find(ns_prefix+"state"),
+                                        cast_f_values=int,
+                                        namespace=namespace)
+
+    if tag_name != ns_prefix+"state":
+        raise ValueError("failure of consistency check " +
+            "while processing aut XML string.")
+    if builder.has_node(this_id):
+        logger.warn("duplicate nodes found: "+str(this_id)+"; ignoring...")
+        return
 
-    aut_elem = elem.find(ns_prefix+"aut")
-    if aut_elem is None or (
-        (aut_elem.text is None) and len(aut_elem.getchildren()) == 0):
-        mach = None
-        return (spec, mach)
-
-    # Assume version 1 of tulipcon XML
-    if aut_elem.attrib["type"] != "basic":
-        raise ValueError("Automaton class only recognizes type \"basic\".")
-    node_list = aut_elem.findall(ns_prefix+"node")
-    id_list = []  # For more convenient searching, and to catch redundancy
-    A = nx.DiGraph()
-    A.env_vars = env_vars
-    A.sys_vars = sys_vars
-    for node in node_list:
-        this_id = int(node.find(ns_prefix+"id").text)
-        #this_name = node.find(ns_prefix+"anno").text  # Assume version 1
-        (tag_name, this_name_list) = _untaglist(node.find(ns_prefix+"anno"),
-                                                cast_f=int)
-        if len(this_name_list) == 2:
-            (mode, rgrad) = this_name_list
-        else:
-            (mode, rgrad) = (-1, -1)
-        (tag_name, this_child_list) = _untaglist(
-            node.find(ns_prefix+"child_list"),
-            cast_f=int
-        )
-        if tag_name != ns_prefix+"child_list":
-            # This really should never happen and may not even be
-            # worth checking.
-            raise ValueError("failure of consistency check " +
-                "while processing aut XML string.")
-        (tag_name, this_state) = _untagdict(node.find(ns_prefix+"state"),
-                                            cast_f_values=int,
-                                            namespace=namespace)
-
-        if tag_name != ns_prefix+"state":
-            raise ValueError("failure of consistency check " +
-                "while processing aut XML string.")
-        if this_id in id_list:
-            logger.warn("duplicate nodes found: "+str(this_id)+"; ignoring...")
-            continue
-        id_list.append(this_id)
-
-        logger.info('loaded from gr1c result:\n\t' +str(this_state) )
+    logger.info('loaded from gr1c result:\n\t' +str(this_state) )
 
-        A.add_node(this_id, state=copy.copy(this_state),
-                   mode=mode, rgrad=rgrad)
-        for next_node in this_child_list:
-            A.add_edge(this_id, next_node)
-    return A
+    builder.add_node(this_id, [this_state[v] for v in variables],
+                     this_child_list, mode=mode, rgrad=rgrad)
 
 def _parse_vars(variables, vardict):
     """Helper for parsing env, sys variables.
@@ -340,36 +392,319 @@ def _parse_vars(variables, vardict):
     ])
     return variables
 
-def load_aut_json(x):
+def load_aut_json(x, compact=False):
     """Return strategy constructed from output of gr1c
 
+    The JSON document is read incrementally, node by node,
+    so the whole document is not held in memory as
+    Python objects.
+
     @param x: string or file-like object
 
+    @param compact: if C{True}, then return L{CompactStrategy},
+        instead of C{networkx.DiGraph}
+    @type compact: bool
+
     @return: strategy as C{networkx.DiGraph}, like the return value of
         L{load_aut_xml}
+
+    @raise ValueError: if a node appears more than once in C{nodes},
+        or the C{trans} of a node names a node missing from C{nodes}.
+        gr1c does not output such documents. Before strategies were
+        read incrementally, the last entry of a repeated node was
+        kept, and missing nodes were added without C{state}.
     """
-    try:
-        autjs = json.loads(x)
-    except TypeError:
-        autjs = json.load(x)
-    if autjs['version'] != 1:
-        raise ValueError('Only gr1c JSON format version 1 is supported.')
-    # convert to nx
-    A = nx.DiGraph()
-    symtab = autjs['ENV'] + autjs['SYS']
-    A.env_vars = dict([v.items()[0] for v in autjs['ENV']])
-    A.sys_vars = dict([v.items()[0] for v in autjs['SYS']])
+    stream = JSONStream(x)
+    builder = StrategyBuilder()
+    header = dict()
     omit = {'state', 'trans'}
-    for node_ID, d in autjs['nodes'].iteritems():
-        node_label = {k: d[k] for k in d if k not in omit}
-        node_label['state'] = dict([(symtab[i].keys()[0],
-                                     autjs['nodes'][node_ID]['state'][i])
-                                    for i in range(len(symtab))])
-        A.add_node(node_ID, node_label)
-    for node_ID, d in autjs['nodes'].iteritems():
-        for to_node in d['trans']:
-            A.add_edge(node_ID, to_node)
-    return A
+    for key in stream.members():
+        if key != 'nodes':
+            header[key] = stream.value()
+            continue
+        for node_ID in stream.members():
+            d = stream.value()
+            attr = {k: d[k] for k in d if k not in omit}
+            builder.add_node(node_ID, d['state'], d['trans'], **attr)
+    if header['version'] != 1:
+        raise ValueError('Only gr1c JSON format version 1 is supported.')
+    symtab = header['ENV'] + header['SYS']
+    env_vars = dict([v.items()[0] for v in header['ENV']])
+    sys_vars = dict([v.items()[0] for v in header['SYS']])
+    variables = [v.keys()[0] for v in symtab]
+    A = builder.build(variables, env_vars, sys_vars)
+    if compact:
+        return A
+    return A.to_networkx()
+
+class CompactStrategy(object):
+    """Strategy graph stored in arrays.
+
+    Nodes are integers C{0, ..., n - 1}.
+    The state of node C{i} is the row C{states[i]},
+    with one column per variable, in the order C{variables}.
+    Successors of node C{i} are
+    C{indices[indptr[i]:indptr[i + 1]]},
+    as in C{scipy.sparse.csr_matrix}.
+    Node C{i} is named C{ids[i]} by the solver.
+
+    Other node attributes, e.g., C{mode}, C{rgrad},
+    are arrays in the C{dict} C{attr}.
+
+    Call L{to_networkx} to obtain the graph that
+    L{load_aut_json} returns by default.
+    """
+    def __init__(self, ids, variables, states, indptr, indices,
+                 env_vars, sys_vars, attr=None):
+        self.ids = ids
+        self.variables = variables
+        self.states = states
+        self.indptr = indptr
+        self.indices = indices
+        self.env_vars = env_vars
+        self.sys_vars = sys_vars
+        if attr is None:
+            attr = dict()
+        self.attr = attr
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __str__(self):
+        return ('CompactStrategy with {n} nodes, {m} edges, '
+                'over variables: {v}').format(
+                    n=len(self), m=len(self.indices), v=self.variables)
+
+    def successors(self, i):
+        """Return successors of node C{i}."""
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def state(self, i):
+        """Return state of node C{i} as C{dict}."""
+        return dict(zip(self.variables, self.states[i].tolist()))
+
+    @classmethod
+    def from_networkx(cls, A):
+        """Return strategy C{A} given as C{networkx.DiGraph}.
+
+        Nodes of C{A} are labeled with C{state}, as
+        returned by L{load_aut_json}.
+        Other node attributes are ignored.
+        """
+        variables = None
+        b = StrategyBuilder()
+        # keep the order of nodes in A
+        for u in A:
+            b._number(u)
+        for u, d in A.nodes_iter(data=True):
+            if variables is None:
+                variables = list(d['state'])
+            b.add_node(u, [d['state'][k] for k in variables],
+                       A.successors_iter(u))
+        if variables is None:
+            variables = []
+        env_vars = getattr(A, 'env_vars', None)
+        sys_vars = getattr(A, 'sys_vars', None)
+        return b.build(variables, env_vars, sys_vars)
+
+    def to_networkx(self):
+        """Return strategy as C{networkx.DiGraph}.
+
+        Nodes are named by C{ids}, and labeled with
+        C{state} and the other attributes.
+        """
+        A = nx.DiGraph()
+        A.env_vars = self.env_vars
+        A.sys_vars = self.sys_vars
+        attr = dict((k, v.tolist()) for k, v in self.attr.iteritems())
+        for i, u in enumerate(self.ids):
+            label = dict((k, v[i]) for k, v in attr.iteritems())
+            label['state'] = self.state(i)
+            A.add_node(u, label)
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        for i, u in enumerate(self.ids):
+            for j in indices[indptr[i]:indptr[i + 1]]:
+                A.add_edge(u, self.ids[j])
+        return A
+
+class StrategyBuilder(object):
+    """Collect nodes of a strategy into arrays.
+
+    Nodes are numbered in the order that their names
+    are first seen, as nodes or as successors.
+    Add each node with L{add_node}, then call L{build}.
+    Used by the strategy loaders of gr1c and slugs.
+    """
+    def __init__(self):
+        self._index = dict()
+        self._ids = []
+        self._is_defined = bytearray()
+        self._defined = array.array('l')
+        self._states = array.array('l')
+        self._src = array.array('l')
+        self._dst = array.array('l')
+        self._attr = dict()
+        self._n_vars = None
+
+    def _number(self, u):
+        i = self._index.get(u)
+        if i is None:
+            i = len(self._ids)
+            self._index[u] = i
+            self._ids.append(u)
+            self._is_defined.append(0)
+        return i
+
+    def has_node(self, u):
+        """Return C{True} if node C{u} has been added."""
+        i = self._index.get(u)
+        return i is not None and self._is_defined[i] == 1
+
+    def add_node(self, u, state, trans, **attr):
+        """Add node C{u} with C{state} as list, and successors C{trans}."""
+        if self.has_node(u):
+            raise ValueError('duplicate node: ' + str(u))
+        if self._n_vars is None:
+            self._n_vars = len(state)
+        elif len(state) != self._n_vars:
+            raise ValueError('node ' + str(u) + ' has ' + str(len(state)) +
+                             ' values, expected ' + str(self._n_vars))
+        i = self._number(u)
+        self._is_defined[i] = 1
+        n = len(self._defined)
+        self._defined.append(i)
+        self._states.extend(state)
+        for v in trans:
+            self._src.append(i)
+            self._dst.append(self._number(v))
+        for k, v in attr.iteritems():
+            values = self._attr.setdefault(k, [])
+            values.extend([None] * (n - len(values)))
+            values.append(v)
+
+    def build(self, variables, env_vars, sys_vars):
+        """Return L{CompactStrategy}."""
+        n = len(self._ids)
+        if n != len(self._defined):
+            raise ValueError(
+                'transitions to undefined nodes: ' +
+                str([u for u, d in zip(self._ids, self._is_defined)
+                     if not d]))
+        if self._n_vars is not None and self._n_vars != len(variables):
+            raise ValueError('nodes have ' + str(self._n_vars) +
+                             ' values, but there are ' +
+                             str(len(variables)) + ' variables')
+        defined = _as_array(self._defined)
+        order = np.empty(n, dtype=np.int_)
+        order[defined] = np.arange(n)
+        states = _as_array(self._states).reshape(n, len(variables))
+        states = states[order]
+        # CSR, keeping the order of successors
+        src = _as_array(self._src)
+        dst = _as_array(self._dst)
+        perm = np.argsort(src, kind='mergesort')
+        indices = dst[perm]
+        indptr = np.zeros(n + 1, dtype=np.int_)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        attr = dict()
+        for k, values in self._attr.iteritems():
+            values.extend([None] * (n - len(values)))
+            attr[k] = np.array(values)[order]
+        return CompactStrategy(list(self._ids), list(variables), states,
+                               indptr, indices, env_vars, sys_vars, attr)
+
+def _as_array(a):
+    """Return C{array.array} of C{long} as numpy array."""
+    if len(a) == 0:
+        return np.zeros(0, dtype=np.int_)
+    return np.frombuffer(a, dtype=np.int_)
+
+class JSONStream(object):
+    """Read JSON document incrementally from string or file.
+
+    Objects are read member by member with L{members},
+    and any value at once with L{value}.
+    Used by the strategy loaders of gr1c and slugs.
+    """
+    _ws = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, x, chunk_size=2**16):
+        if isinstance(x, basestring):
+            self.f = None
+            self.buf = x
+        else:
+            self.f = x
+            self.buf = ''
+        self.pos = 0
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+
+    def _more(self):
+        """Read next chunk, return C{False} at end of file."""
+        if self.f is None:
+            return False
+        s = self.f.read(self.chunk_size)
+        if not s:
+            return False
+        self.buf = self.buf[self.pos:] + s
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace, return next character."""
+        while True:
+            self.pos = self._ws.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                raise ValueError('unexpected end of JSON document')
+
+    def _expect(self, c):
+        if self._peek() != c:
+            raise ValueError('expected "{c}" in JSON document, got: '
+                             '{s}'.format(c=c, s=self.buf[self.pos:][:20]))
+        self.pos += 1
+
+    def value(self):
+        """Read next JSON value."""
+        self._peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # incomplete value ?
+                if self._more():
+                    continue
+                raise
+            # a number can continue in the next chunk
+            if end == len(self.buf) and self._more():
+                continue
+            self.pos = end
+            return obj
+
+    def members(self):
+        """Yield keys of next JSON object.
+
+        The value of each key must be read,
+        with L{value} or L{members}, before the next key.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(':')
+            yield key
+            c = self._peek()
+            self.pos += 1
+            if c == '}':
+                return
+            if c != ',':
+                raise ValueError('expected "," or "}" in JSON document, '
+                                 'got: ' + c)
+
 
 def check_syntax(spec_str):
     """Check whether given string has correct gr1c specification syntax.
@@ -427,7 +762,7 @@ def check_realizable(spec, init_option="ALL_ENV_EXIST_SYS_INIT"):
         logger.info(p.stdout.read() )
         return False
 
-def synthesize(spec, init_option="ALL_ENV_EXIST_SYS_INIT"):
+def synthesize(spec, init_option="ALL_ENV_EXIST_SYS_INIT", compact=False):
     """Synthesize strategy realizing the given specification.
 
     @type spec: L{GRSpec}
@@ -464,6 +799,10 @@ def synthesize(spec, init_option="ALL_ENV_EXIST_SYS_INIT"):
         <https://tulip-control.github.io/gr1c/md_spc_format.html#initconditions>}
         for detailed descriptions.
 
+    @param compact: return L{CompactStrategy},
+        see L{load_aut_json}
+    @type compact: bool
+
     @return: strategy as C{networkx.DiGraph},
         or None if unrealizable or error occurs.
     """
@@ -510,7 +849,7 @@ def synthesize(spec, init_option="ALL_ENV_EXIST_SYS_INIT"):
 
     if p.returncode == 0:
         logger.debug(msg)
-        strategy = load_aut_json(stdoutdata)
+        strategy = load_aut_json(stdoutdata, compact=compact)
         return strategy
     else:
         print(msg)
@@ -772,3 +1111,219 @@ class GR1CSession:
             return False
         else:
             return True
+
+class GR1CPool(object):
+    """Check or synthesize many specifications with warm gr1c processes.
+
+    gr1c reads one specification per process, so
+    the pool keeps spare processes started ahead of time,
+    blocked reading their standard input.
+    Each call takes a spare process, streams the specification
+    to it, and starts a replacement, so process startup overlaps
+    with solving instead of preceding it.
+
+    Calls are thread-safe, and L{map_realizable} runs
+    up to C{n_procs} of them at once.
+
+    After each call, a dict is appended to C{stats}, with keys:
+
+      - C{'time'}: wall time in seconds, from sending the
+        specification until gr1c exits
+      - C{'maxrss'}: peak resident memory of the gr1c process,
+        as reported by C{getrusage} (kilobytes on Linux)
+      - C{'returncode'}: of gr1c, negative if killed by a signal
+      - C{'timed_out'}: C{True} if killed after C{timeout}
+
+    Example::
+
+        pool = GR1CPool(n_procs=4, timeout=10)
+        r = pool.map_realizable(specs)
+        pool.close()
+
+    See Also
+    ========
+    L{check_realizable}, L{synthesize}
+    """
+    def __init__(self, n_procs=1, timeout=None,
+                 init_option="ALL_ENV_EXIST_SYS_INIT"):
+        """Start pool, without starting any gr1c process.
+
+        @param n_procs: max number of spare processes
+            per gr1c command line, and of concurrent calls
+            in L{map_realizable}
+        @type n_procs: int >= 1
+
+        @param timeout: seconds after which a call is killed,
+            if C{None}, then no limit
+        @type timeout: float
+
+        @param init_option: see L{synthesize}
+        """
+        if init_option not in ("ALL_ENV_EXIST_SYS_INIT",
+                               "ALL_INIT", "ONE_SIDE_INIT"):
+            raise ValueError("Unrecognized initial condition" +
+                             "interpretation (init_option)")
+        if n_procs < 1:
+            raise ValueError('n_procs must be >= 1, got: ' + str(n_procs))
+        check_gr1c()
+        self.n_procs = n_procs
+        self.timeout = timeout
+        self.init_option = init_option
+        self.stats = []
+        self._spare = dict()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def check_realizable(self, spec):
+        """Decide realizability of specification.
+
+        Same as the function L{check_realizable}.
+
+        @type spec: L{GRSpec}
+
+        @return: True if realizable, False if not,
+            or an error occurs, or the call times out.
+        """
+        s = translate(spec, 'gr1c')
+        returncode, out = self._call(("-n", self.init_option, "-r"), s)
+        if returncode == 0:
+            return True
+        else:
+            logger.info(out)
+            return False
+
+    def synthesize(self, spec):
+        """Synthesize strategy realizing the given specification.
+
+        Same as the function L{synthesize}.
+
+        @type spec: L{GRSpec}
+
+        @return: strategy as C{networkx.DiGraph},
+            or None if unrealizable, or an error occurs,
+            or the call times out.
+        """
+        s = translate(spec, 'gr1c')
+        returncode, out = self._call(
+            ("-n", self.init_option, "-t", "json"), s)
+        if returncode == 0:
+            return load_aut_json(out)
+        else:
+            logger.info(out)
+            return None
+
+    def map_realizable(self, specs):
+        """Decide realizability of each specification.
+
+        Up to C{n_procs} specifications are checked at once.
+
+        @type specs: iterable of L{GRSpec}
+
+        @return: result of L{check_realizable} for each spec
+        @rtype: list of bool
+        """
+        pool = ThreadPool(self.n_procs)
+        try:
+            return pool.map(self.check_realizable, specs)
+        finally:
+            pool.close()
+            pool.join()
+
+    def close(self):
+        """Kill spare gr1c processes.
+
+        Calls already running finish.
+        """
+        with self._lock:
+            self._closed = True
+            spare = self._spare
+            self._spare = dict()
+        for procs in spare.itervalues():
+            for p in procs:
+                p.stdin.close()
+                p.kill()
+                p.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _spawn(self, args):
+        """Start gr1c with command line arguments C{args}."""
+        try:
+            return subprocess.Popen(
+                [GR1C_BIN_PREFIX + "gr1c"] + list(args),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+            )
+        except OSError as e:
+            if e.errno == os.errno.ENOENT:
+                raise Exception('gr1c not found in path.')
+            else:
+                raise
+
+    def _take(self, args):
+        """Return spare process for C{args}, and replace it."""
+        with self._lock:
+            if self._closed:
+                raise Exception('GR1CPool is closed.')
+            procs = self._spare.setdefault(args, [])
+            p = procs.pop() if procs else None
+        # a spare that exited, e.g., killed from outside, is useless
+        if p is None or p.poll() is not None:
+            p = self._spawn(args)
+        q = self._spawn(args)
+        with self._lock:
+            procs = self._spare.get(args)
+            if self._closed or procs is None or len(procs) >= self.n_procs:
+                q.stdin.close()
+                q.kill()
+                q.wait()
+            else:
+                procs.append(q)
+        return p
+
+    def _call(self, args, s):
+        """Pass C{s} to gr1c, return its return code and output."""
+        p = self._take(args)
+        killed = []
+        def kill():
+            killed.append(True)
+            p.kill()
+        if self.timeout is not None:
+            timer = threading.Timer(self.timeout, kill)
+            timer.start()
+        start = time.time()
+        try:
+            try:
+                p.stdin.write(s)
+                p.stdin.close()
+            except IOError:
+                # gr1c exited before reading all input
+                pass
+            out = p.stdout.read()
+        finally:
+            # before reaping, so that the pid is not reused when killed
+            if self.timeout is not None:
+                timer.cancel()
+        # rusage of this child only
+        pid, status, rusage = os.wait4(p.pid, 0)
+        t = time.time() - start
+        if os.WIFSIGNALED(status):
+            p.returncode = -os.WTERMSIG(status)
+        else:
+            p.returncode = os.WEXITSTATUS(status)
+        stats = {
+            'time': t,
+            'maxrss': rusage.ru_maxrss,
+            'returncode': p.returncode,
+            'timed_out': bool(killed)
+        }
+        with self._lock:
+            self.stats.append(stats)
+        logger.debug('gr1c call: ' + str(stats))
+        if killed:
+            logger.warning('gr1c killed after ' + str(self.timeout) + ' s')
+        return p.returncode, out
@@ -36,12 +36,13 @@ Relevant links:
 """
 from __future__ import absolute_import
 import logging
-import json
 import os
 import subprocess
 import tempfile
-import networkx as nx
+import numpy as np
 from tulip.spec import GRSpec, translate
+from tulip.interfaces.gr1c import (
+    CompactStrategy, JSONStream, StrategyBuilder)
 import slugs
 
 
@@ -69,10 +70,15 @@ def check_realizable(spec):
     return realizable
 
 
-def synthesize(spec, symbolic=False):
+def synthesize(spec, symbolic=False, compact=False):
     """Return strategy satisfying the specification C{spec}.
 
     @type spec: L{GRSpec} or C{str} in structured slugs syntax.
+
+    @param compact: if C{True}, then return L{CompactStrategy},
+        instead of C{networkx.DiGraph}
+    @type compact: bool
+
     @return: If realizable return synthesized strategy, otherwise C{None}.
     @rtype: C{networkx.DiGraph}
     """
@@ -90,25 +96,10 @@ def synthesize(spec, symbolic=False):
     if not realizable:
         return None
     os.unlink(fin.name)
-    # collect int vars
-    vrs = dict(spec.sys_vars)
-    vrs.update(spec.env_vars)
-    dout = json.loads(out)
-    g = nx.DiGraph()
-    dvars = dout['variables']
-    for stru, d in dout['nodes'].iteritems():
-        u = int(stru)
-        state = dict(zip(dvars, d['state']))
-        g.add_node(u, state=state)
-        for v in d['trans']:
-            g.add_edge(u, v)
-    h = nx.DiGraph()
-    for u, d in g.nodes_iter(data=True):
-        bit_state = d['state']
-        int_state = _bitfields_to_ints(bit_state, vrs)
-        h.add_node(u, state=int_state)
-    for u, v in g.edges_iter():
-        h.add_edge(u, v)
+    strategy = _load_strategy(out, spec.env_vars, spec.sys_vars)
+    if compact:
+        return strategy
+    h = strategy.to_networkx()
     logger.debug(
         ('loaded strategy with vertices:\n  {v}\n'
          'and edges:\n {e}\n').format(
@@ -117,6 +108,66 @@ def synthesize(spec, symbolic=False):
     return h
 
 
+def _load_strategy(out, env_vars, sys_vars):
+    """Return L{CompactStrategy} from JSON output of slugs.
+
+    The JSON document is read node by node,
+    and the bits of integer variables are
+    combined for all nodes at once.
+    """
+    stream = JSONStream(out)
+    builder = StrategyBuilder()
+    dvars = None
+    for key in stream.members():
+        if key == 'variables':
+            dvars = stream.value()
+        elif key == 'nodes':
+            for stru in stream.members():
+                d = stream.value()
+                builder.add_node(int(stru), d['state'], d['trans'])
+        else:
+            stream.value()
+    bits = builder.build(dvars, env_vars, sys_vars)
+    variables = list(env_vars) + list(sys_vars)
+    vrs = dict(sys_vars)
+    vrs.update(env_vars)
+    states = _bitfields_to_int_array(bits.states, bits.variables,
+                                     variables, vrs)
+    return CompactStrategy(bits.ids, variables, states,
+                           bits.indptr, bits.indices,
+                           env_vars, sys_vars)
+
+
+def _bitfields_to_int_array(bit_states, bitvars, variables, vrs):
+    """Convert bitfield representation to integers, for many states.
+
+    Same as L{_bitfields_to_ints}, for each row of C{bit_states}.
+
+    @param bit_states: one row per state, one column per bit
+    @type bit_states: 2d array
+    @param bitvars: bit names of columns
+    @param variables: variables, in the order of returned columns
+    @type vrs: C{dict}
+
+    @rtype: 2d array
+    """
+    col = dict((b, i) for i, b in enumerate(bitvars))
+    states = np.zeros((bit_states.shape[0], len(variables)), dtype=np.int_)
+    for j, var in enumerate(variables):
+        dom = vrs[var]
+        if dom == 'boolean':
+            states[:, j] = bit_states[:, col[var]]
+            continue
+        bitnames = ['{var}@{i}'.format(var=var, i=i)
+                    for i in xrange(dom[1].bit_length())]
+        bitnames[0] = '{var}@0.{min}.{max}'.format(
+            var=var, min=dom[0], max=dom[1])
+        # little-endian
+        for i, b in enumerate(bitnames):
+            states[:, j] += bit_states[:, col[b]] << i
+    return states
+
+
 def _bitfields_to_ints(bit_state, vrs):
     """Convert bitfield representation to integers.
 
@@ -611,7 +611,7 @@ class GRSpec(LTL):
         logger.info('done with substitutions.\n')
         return a
 
-    def compile_init(self, no_str):
+    def compile_init(self, no_str, lang='python'):
         """Compile python expression for initial conditions.
 
         The returned bytecode can be used with C{eval}
@@ -629,6 +629,13 @@ class GRSpec(LTL):
             where all string variables have been replaced by integers.
             Otherwise compile the original formula containing strings.
 
+        @param lang: if C{'numpy'}, then the values are
+            C{numpy} arrays, one entry per state,
+            and the expression evaluates elementwise.
+            The function C{numpy.logical_not} must be
+            given as C{logical_not} to C{eval}.
+        @type lang: C{'python'} or C{'numpy'}
+
         @return: python expression compiled for C{eval}
         @rtype: C{code}
         """
@@ -639,16 +646,21 @@ class GRSpec(LTL):
             if no_str:
                 clauses = [self._bool_int[x] for x in clauses]
             logger.info('clauses to compile: ' + str(clauses))
-            c = [ts.translate_ast(self.ast(x), 'python').flatten()
+            c = [ts.translate_ast(self.ast(x), lang).flatten()
                  for x in clauses]
             logger.info('after translation to python: ' + str(c))
-            s = _conj(c, op='and')
+            if lang == 'numpy':
+                s = _conj(c, op='&')
+            else:
+                s = _conj(c, op='and')
             if not s:
                 s = 'True'
             pyinit[side] = s
-        s = 'not ({assumption}) or ({assertion})'.format(
-            assumption=pyinit['env'],
-            assertion=pyinit['sys'])
+        if lang == 'numpy':
+            s = 'logical_not({assumption}) | ({assertion})'
+        else:
+            s = 'not ({assumption}) or ({assertion})'
+        s = s.format(assumption=pyinit['env'], assertion=pyinit['sys'])
         return compile(s, '<string>', 'eval')
 
     def str_to_int(self):
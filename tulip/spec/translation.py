@@ -188,6 +188,40 @@ def make_python_nodes():
     return nodes
 
 
+def make_numpy_nodes():
+    """Nodes of Python expressions that evaluate elementwise
+    on C{numpy} arrays of variable values."""
+    opmap = {'True': 'True', 'False': 'False',
+             '!': 'logical_not', '&': '&', '|': '|',
+             '^': '^', '=': '==', '!=': '!=',
+             '<': '<', '<=': '<=', '>=': '>=', '>': '>',
+             '+': '+', '-': '-'}
+    nodes = ast.make_fol_nodes(opmap)
+
+    class Unary(nodes.Unary):
+        def flatten(self, *arg, **kw):
+            return '{op}({x})'.format(
+                op=self.opmap[self.operator],
+                x=self.operands[0].flatten())
+
+    class Imp(nodes.Binary):
+        def flatten(self, *arg, **kw):
+            return '(logical_not({l}) | {r})'.format(
+                l=self.operands[0].flatten(),
+                r=self.operands[1].flatten())
+
+    class BiImp(nodes.Binary):
+        def flatten(self, *arg, **kw):
+            return '({l} == {r})'.format(
+                l=self.operands[0].flatten(),
+                r=self.operands[1].flatten())
+
+    nodes.Unary = Unary
+    nodes.Imp = Imp
+    nodes.BiImp = BiImp
+    return nodes
+
+
 lang2nodes = {
     'jtlv': make_jtlv_nodes(),
     'gr1c': make_gr1c_nodes(),
@@ -195,6 +229,7 @@ lang2nodes = {
     'promela': make_promela_nodes(),
     'smv': make_smv_nodes(),
     'python': make_python_nodes(),
+    'numpy': make_numpy_nodes(),
     'wring': make_wring_nodes()}
 
 
@@ -412,12 +447,12 @@ def translate_ast(tree, lang):
 
     @type tree: L{Nodes.Node}
     @type lang: 'gr1c' or 'slugs' or 'jtlv' or
-      'promela' or 'smv' or 'python' or 'wring'
+      'promela' or 'smv' or 'python' or 'numpy' or 'wring'
 
     @return: tree using AST nodes of C{lang}
     @rtype: L{FOL.Node}
     """
-    if lang == 'python':
+    if lang in ('python', 'numpy'):
         return _ast_to_python(tree, lang2nodes[lang])
     else:
         return _ast_to_lang(tree, lang2nodes[lang])
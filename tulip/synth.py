@@ -33,7 +33,14 @@
 from __future__ import absolute_import
 import logging
 import copy
+import multiprocessing as mp
+import os
+import select
+import signal
+import time
+import traceback
 import warnings
+import numpy as np
 from tulip import transys
 from tulip.spec import GRSpec
 from tulip.interfaces import jtlv, gr1c, gr1py
@@ -1016,7 +1023,8 @@ def synthesize_many(specs, ts=None, ignore_init=None,
 def synthesize(
     option, specs, env=None, sys=None,
     ignore_env_init=False, ignore_sys_init=False,
-    bool_states=False, bool_actions=False, rm_deadends=True
+    bool_states=False, bool_actions=False, rm_deadends=True,
+    compact=False
 ):
     """Function to call the appropriate synthesis tool on the specification.
 
@@ -1100,10 +1108,16 @@ def synthesize(
     @param rm_deadends: return a strategy that contains no terminal states.
     @type rm_deadends: bool
 
+    @param compact: return the strategy as a
+        L{transys.machines.CompactMealy}, stored in arrays.
+        With C{"gr1c"} and C{"slugs"}, the strategy is also
+        loaded into arrays, see L{gr1c.load_aut_json}.
+    @type compact: bool
+
     @return: If spec is realizable,
         then return a Mealy machine implementing the strategy.
         Otherwise return None.
-    @rtype: L{MealyMachine} or None
+    @rtype: L{MealyMachine} or L{transys.machines.CompactMealy} or None
     """
     specs = _spec_plus_sys(
         specs, env, sys,
@@ -1112,12 +1126,12 @@ def synthesize(
         bool_states,
         bool_actions)
     if option == 'gr1c':
-        strategy = gr1c.synthesize(specs)
+        strategy = gr1c.synthesize(specs, compact=compact)
     elif option == 'slugs':
         if slugs is None:
             raise ValueError('Import of slugs interface failed. ' +
                              'Please verify installation of "slugs".')
-        strategy = slugs.synthesize(specs)
+        strategy = slugs.synthesize(specs, compact=compact)
     elif option == 'gr1py':
         strategy = gr1py.synthesize(specs)
     elif option == 'omega':
@@ -1139,7 +1153,7 @@ def synthesize(
     if strategy is None:
         return None
 
-    ctrl = strategy2mealy(strategy, specs)
+    ctrl = strategy2mealy(strategy, specs, compact=compact)
     logger.debug('Mealy machine has: n = ' +
                  str(len(ctrl.states)) + ' states.')
 
@@ -1184,11 +1198,202 @@ def is_realizable(
     return r
 
 
+def synthesize_batch(option, jobs, n_jobs=None, timeout=None):
+    """Call L{synthesize} for many specifications in parallel.
+
+    Each job runs in its own process, with at most C{n_jobs}
+    running at once. Results are yielded as jobs finish,
+    so not in the order of C{jobs}.
+
+    Jobs that share clauses share their translation:
+    the logic formulas of the same C{env} and C{sys} are
+    computed once, and the clauses of all specifications
+    are parsed once, in this process, before each job starts.
+    So specifications that differ in a few clauses are
+    parsed only in those clauses.
+
+    Uses C{fork} and process groups, so POSIX only.
+
+    @param option: solver, see L{synthesize}
+
+    @param jobs: tuples C{(specs, env, sys, options)},
+        where C{options} is a C{dict} of the other keyword
+        arguments of L{synthesize}, for example
+        C{{'ignore_env_init': True}}.
+    @type jobs: iterable
+
+    @param n_jobs: max number of jobs running at once,
+        if C{None}, then one per CPU
+    @type n_jobs: int >= 1
+
+    @param timeout: seconds after which a job and
+        any solver it runs are killed,
+        if C{None}, then no limit
+    @type timeout: float
+
+    @return: generator of C{(i, ctrl, error)}, where:
+
+          - C{i}: index of the job in C{jobs}
+          - C{ctrl}: as returned by L{synthesize},
+            C{None} if C{error}
+          - C{error}: C{None}, or C{'timeout'},
+            or the traceback of an exception raised by the job
+    """
+    return _run_batch(synthesize, option, jobs, n_jobs, timeout)
+
+
+def is_realizable_batch(option, jobs, n_jobs=None, timeout=None):
+    """Call L{is_realizable} for many specifications in parallel.
+
+    For details see L{synthesize_batch}.
+
+    @return: generator of C{(i, r, error)},
+        with C{r} as returned by L{is_realizable}
+    """
+    return _run_batch(is_realizable, option, jobs, n_jobs, timeout)
+
+
+def _run_batch(f, option, jobs, n_jobs, timeout):
+    """Yield results of C{f} for C{jobs}, see L{synthesize_batch}."""
+    if n_jobs is None:
+        n_jobs = mp.cpu_count()
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be >= 1, got: ' + str(n_jobs))
+    ts_formulas = dict()
+    asts = dict()
+    jobs = enumerate(jobs)
+    running = dict()
+    done = False
+    try:
+        while True:
+            while not done and len(running) < n_jobs:
+                try:
+                    i, (specs, env, sys, options) = next(jobs)
+                except StopIteration:
+                    done = True
+                    break
+                options = dict(options)
+                ts_options = dict(
+                    (k, options.pop(k, False))
+                    for k in ('ignore_env_init', 'ignore_sys_init',
+                              'bool_states', 'bool_actions'))
+                try:
+                    specs = _spec_plus_sys(
+                        specs, env, sys,
+                        ts_options['ignore_env_init'],
+                        ts_options['ignore_sys_init'],
+                        ts_options['bool_states'],
+                        ts_options['bool_actions'],
+                        cache=ts_formulas)
+                    _share_asts(specs, asts)
+                except Exception:
+                    yield (i, None, traceback.format_exc())
+                    continue
+                recv, send = mp.Pipe(duplex=False)
+                p = mp.Process(target=_batch_task,
+                               args=(f, option, specs, options, send))
+                p.start()
+                send.close()
+                running[recv.fileno()] = (i, p, recv, time.time())
+            if not running:
+                return
+            if timeout is None:
+                wait = None
+            else:
+                t = min(start for (i, p, recv, start) in
+                        running.itervalues())
+                wait = max(0, t + timeout - time.time())
+            ready, _, _ = select.select(list(running), [], [], wait)
+            for fd in ready:
+                i, p, recv, start = running.pop(fd)
+                try:
+                    result, error = recv.recv()
+                except EOFError:
+                    result = None
+                    error = 'job exited with code: ' + str(p.exitcode)
+                recv.close()
+                p.join()
+                yield (i, result, error)
+            now = time.time()
+            for fd, (i, p, recv, start) in running.items():
+                if timeout is None or now - start < timeout:
+                    continue
+                logger.warning('job ' + str(i) + ' timed out')
+                del running[fd]
+                _kill_batch_task(p)
+                recv.close()
+                yield (i, None, 'timeout')
+    finally:
+        # generator closed early, or exception
+        for (i, p, recv, start) in running.itervalues():
+            _kill_batch_task(p)
+            recv.close()
+
+
+def _batch_task(f, option, specs, options, conn):
+    """Run job of L{_run_batch} in worker process."""
+    # own process group, to kill any solver that f starts
+    os.setpgrp()
+    try:
+        r = (f(option, specs, **options), None)
+    except Exception:
+        r = (None, traceback.format_exc())
+    conn.send(r)
+    conn.close()
+
+
+def _kill_batch_task(p):
+    """Kill worker process C{p} and its children."""
+    try:
+        os.killpg(p.pid, signal.SIGKILL)
+    except OSError:
+        # already exited
+        pass
+    p.join()
+
+
+def _share_asts(specs, asts):
+    """Parse clauses of C{specs}, reusing ASTs from C{asts}.
+
+    ASTs are shared among specifications that
+    declare the same variables, so that each clause is
+    still checked for undefined variables.
+    Parsed clauses are added to C{asts}.
+
+    @type specs: L{GRSpec}
+
+    @param asts: maps variable declarations to
+        C{(ast, bool_int)}, as the attributes of L{GRSpec}
+    @type asts: dict
+    """
+    key = (repr(sorted(specs.env_vars.items())),
+           repr(sorted(specs.sys_vars.items())))
+    ast, bool_int = asts.setdefault(key, (dict(), dict()))
+    for p in specs._parts:
+        for x in getattr(specs, p):
+            if x in ast:
+                specs._ast[x] = ast[x]
+            if x in bool_int:
+                specs._bool_int[x] = bool_int[x]
+                specs._ast[bool_int[x]] = ast[bool_int[x]]
+    specs.parse()
+    specs.str_to_int()
+    ast.update(specs._ast)
+    bool_int.update(specs._bool_int)
+
+
 def _spec_plus_sys(
     specs, env, sys,
     ignore_env_init, ignore_sys_init,
-    bool_states, bool_actions
+    bool_states, bool_actions, cache=None
 ):
+    """Return conjunction of C{specs} with formulas of C{env}, C{sys}.
+
+    @param cache: if given, then formulas of C{env} and C{sys}
+        are stored in it, and reused for the same objects
+        with the same options.
+    @type cache: dict
+    """
     if sys is not None:
         if hasattr(sys, 'state_varname'):
             statevar = sys.state_varname
@@ -1196,11 +1401,9 @@ def _spec_plus_sys(
             logger.info('sys.state_varname undefined. '
                         'Will use the default variable name: "loc".')
             statevar = 'loc'
-        sys_formula = sys_to_spec(
-            sys, ignore_sys_init,
-            bool_states=bool_states,
-            bool_actions=bool_actions,
-            statevar=statevar)
+        sys_formula = _ts_formula(
+            sys_to_spec, sys, ignore_sys_init,
+            bool_states, bool_actions, statevar, cache)
         specs = specs | sys_formula
         logger.debug('sys TS:\n' + str(sys_formula.pretty()) + _hl)
     if env is not None:
@@ -1210,18 +1413,31 @@ def _spec_plus_sys(
             logger.info('env.state_varname undefined. '
                         'Will use the default variable name: "eloc".')
             statevar = 'eloc'
-        env_formula = env_to_spec(
-            env, ignore_env_init,
-            bool_states=bool_states,
-            bool_actions=bool_actions,
-            statevar=statevar)
+        env_formula = _ts_formula(
+            env_to_spec, env, ignore_env_init,
+            bool_states, bool_actions, statevar, cache)
         specs = specs | env_formula
         logger.debug('env TS:\n' + str(env_formula.pretty()) + _hl)
     logger.info('Overall Spec:\n' + str(specs.pretty()) + _hl)
     return specs
 
 
-def strategy2mealy(A, spec):
+def _ts_formula(f, ts, ignore_init, bool_states, bool_actions,
+                statevar, cache):
+    """Return C{f(ts, ...)}, from C{cache} if computed before."""
+    args = (ignore_init, bool_states, bool_actions, statevar)
+    key = (f.__name__, id(ts)) + args
+    if cache is not None and key in cache:
+        return cache[key][1]
+    formula = f(ts, ignore_init, bool_states=bool_states,
+                bool_actions=bool_actions, statevar=statevar)
+    if cache is not None:
+        # keep ts, so that its id is not reused
+        cache[key] = (ts, formula)
+    return formula
+
+
+def strategy2mealy(A, spec, compact=False):
     """Convert strategy to Mealy transducer.
 
     Note that the strategy is a deterministic game graph,
@@ -1229,12 +1445,21 @@ def strategy2mealy(A, spec):
     this game graph.
 
     @param A: strategy
-    @type A: C{networkx.DiGraph}
+    @type A: C{networkx.DiGraph} or L{gr1c.CompactStrategy}
 
     @type spec: L{GRSpec}
 
+    @param compact: if C{True}, then return a
+        L{transys.machines.CompactMealy}
+    @type compact: bool
+
     @rtype: L{MealyMachine}
     """
+    if compact or isinstance(A, gr1c.CompactStrategy):
+        mach = _strategy2compact_mealy(A, spec)
+        if compact:
+            return mach
+        return mach.to_mealy()
     logger.info('converting strategy (compact) to Mealy machine')
     env_vars = spec.env_vars
     sys_vars = spec.sys_vars
@@ -1313,6 +1538,66 @@ def strategy2mealy(A, spec):
     return mach
 
 
+def _strategy2compact_mealy(A, spec):
+    """Return L{transys.machines.CompactMealy} for strategy C{A}.
+
+    Same machine as L{strategy2mealy}, with the
+    initial condition evaluated on all nodes at once.
+
+    @type A: C{networkx.DiGraph} or L{gr1c.CompactStrategy}
+    @type spec: L{GRSpec}
+    """
+    logger.info('converting strategy to compact Mealy machine')
+    if not isinstance(A, gr1c.CompactStrategy):
+        A = gr1c.CompactStrategy.from_networkx(A)
+    env_vars = spec.env_vars
+    sys_vars = spec.sys_vars
+    inputs = transys.machines.create_machine_ports(env_vars)
+    outputs = transys.machines.create_machine_ports(sys_vars)
+    str_vars = {
+        k: v for k, v in env_vars.iteritems()
+        if isinstance(v, list)}
+    str_vars.update({
+        k: v for k, v in sys_vars.iteritems()
+        if isinstance(v, list)})
+    n = len(A)
+    # Mealy reaction to initial env input
+    isinit = spec.compile_init(no_str=True, lang='numpy')
+    values = dict(
+        (k, A.states[:, j]) for j, k in enumerate(A.variables))
+    mask = eval(isinit, {'logical_not': np.logical_not}, values)
+    mask = np.zeros(n, dtype=bool) | mask
+    init = np.flatnonzero(mask)
+    # one initial node per valuation, the first one,
+    # to avoid spurious non-determinism wrt the machine's memory
+    # (see strategy2mealy)
+    if len(init) > 1 and not A.variables:
+        init = init[:1]
+    elif len(init) > 1:
+        rows = np.ascontiguousarray(A.states[init])
+        rows = rows.view(np.dtype(
+            (np.void, rows.dtype.itemsize * rows.shape[1])))
+        _, first = np.unique(rows.ravel(), return_index=True)
+        init = init[np.sort(first)]
+    if len(init) == 0:
+        raise Exception(
+            'The machine obtained from the strategy '
+            'does not have any initial states !\n'
+            'The strategy is:\n' + str(A) + 2 * '\n' +
+            'and the specification is:\n' + str(spec.pretty()) + 2 * '\n')
+    logger.debug('found initial states: {u}'.format(
+        u=[A.ids[i] for i in init]))
+    # special initial state, for first reaction
+    initial_state = 'Sinit'
+    states = list(A.ids) + [initial_state]
+    indptr = np.append(A.indptr, A.indptr[-1] + len(init))
+    indices = np.concatenate([A.indices, init]).astype(A.indices.dtype)
+    values = np.vstack([
+        A.states, np.zeros((1, len(A.variables)), dtype=A.states.dtype)])
+    return transys.machines.CompactMealy(
+        states, [initial_state], list(A.variables), values,
+        indptr, indices, inputs, outputs, str_vars)
+
 def _int2str(label, str_vars):
     """Replace integers with string values for string variables.
 
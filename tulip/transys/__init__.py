@@ -51,6 +51,6 @@ from .automata import (
 )
 
 
-from .machines import MooreMachine, MealyMachine
+from .machines import MooreMachine, MealyMachine, CompactMealy
 
-from .products import OnTheFlyProductAutomaton
+from .products import OnTheFlyProductAutomaton, ImplicitProduct
@@ -34,10 +34,14 @@ from __future__ import absolute_import
 import logging
 import os
 import copy
+import gc
+import numbers
 from pprint import pformat
 from collections import Iterable
 import warnings
 import networkx as nx
+import numpy as np
+import scipy.sparse as sp
 from tulip.transys.mathset import SubSet, TypedDict
 # inline imports:
 #
@@ -99,6 +103,124 @@ def test_common_bug(value, desired_value):
         raise Exception(msg)
 
 
+_unhashable = object()
+
+
+def _hashable_label_value(value):
+    """Return C{value} as dict key, or C{_unhashable}.
+
+    Sets are converted to C{frozenset}, which compare equal to them.
+    """
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    try:
+        hash(value)
+    except TypeError:
+        return _unhashable
+    return value
+
+
+class _LabelIndex(object):
+    """Items of a L{LabeledDiGraph}, indexed by label key and value.
+
+    Maps each label key and value to the set of items
+    (nodes or edge 3-tuples C{(u, v, key)}) with that label value.
+    Keys whose label type is callable have symbolic semantics
+    (see L{label_is_desired}), so they are not indexed.
+    Items with an unhashable value are kept separately,
+    and returned by L{candidates} for any value of that key.
+
+    @param label_types: as C{LabeledDiGraph._node_label_types}
+    """
+
+    def __init__(self, label_types):
+        self.label_types = label_types
+        # key -> value -> set of items
+        self._items = dict()
+        # key -> set of items with unhashable value
+        self._unhashable_items = dict()
+        # items with empty label
+        self.unlabeled = set()
+        # item -> (key, value) pairs under which it is indexed
+        self._entries = dict()
+
+    def _is_symbolic(self, key):
+        return hasattr(self.label_types.get(key), '__call__')
+
+    def add(self, item, label):
+        """Index C{item} by C{label}, replacing any previous entry."""
+        self.remove(item)
+        if not label:
+            self.unlabeled.add(item)
+            self._entries[item] = None
+            return
+        entries = list()
+        for key, value in label.iteritems():
+            if self._is_symbolic(key):
+                continue
+            value = _hashable_label_value(value)
+            if value is _unhashable:
+                self._unhashable_items.setdefault(key, set()).add(item)
+            else:
+                self._items.setdefault(key, dict()).setdefault(
+                    value, set()).add(item)
+            entries.append((key, value))
+        self._entries[item] = entries
+
+    def remove(self, item):
+        """Remove C{item} from the index, if present."""
+        entries = self._entries.pop(item, False)
+        if entries is False:
+            return
+        if entries is None:
+            self.unlabeled.discard(item)
+            return
+        for key, value in entries:
+            if value is _unhashable:
+                self._unhashable_items[key].discard(item)
+                continue
+            values = self._items[key]
+            items = values[value]
+            items.discard(item)
+            if not items:
+                del values[value]
+
+    def candidates(self, desired):
+        """Return items that may have the C{desired} label.
+
+        The result includes all items with label C{desired},
+        and possibly others, so each item must be checked with
+        L{label_is_desired}. Unlabeled items are not included.
+
+        @param desired: {label_key: label_value, ...}
+        @type desired: dict
+
+        @return: the smallest set of candidates that the index
+            yields for a key of C{desired}, or C{None} if no key
+            of C{desired} can be looked up in the index,
+            because all are symbolic or have unhashable values.
+        @rtype: set or C{None}
+        """
+        best = None
+        for key, value in desired.iteritems():
+            if self._is_symbolic(key):
+                continue
+            value = _hashable_label_value(value)
+            if value is _unhashable:
+                continue
+            items = self._items.get(key, dict()).get(value, ())
+            unhashable = self._unhashable_items.get(key, ())
+            n = len(items) + len(unhashable)
+            if best is None or n < best[0]:
+                best = (n, items, unhashable)
+        if best is None:
+            return None
+        n, items, unhashable = best
+        c = set(items)
+        c.update(unhashable)
+        return c
+
+
 class States(object):
     """Methods to manage states and initial states."""
 
@@ -350,7 +472,16 @@ class States(object):
                 msg += ' with states = ' + str(states)
                 logger.debug(msg)
         found_state_label_pairs = []
-        for state, attr_dict in self.graph.nodes_iter(data=True):
+        state_label_pairs = self.graph.nodes_iter(data=True)
+        index = self.graph._node_label_index
+        if with_attr_dict and index is not None:
+            candidates = index.candidates(with_attr_dict)
+            if candidates is not None:
+                if states is not None:
+                    candidates.intersection_update(states)
+                node = self.graph.node
+                state_label_pairs = [(u, node[u]) for u in candidates]
+        for state, attr_dict in state_label_pairs:
             logger.debug('Checking state_id = ' + str(state) +
                          ', with attr_dict = ' + str(attr_dict))
             if states is not None:
@@ -525,14 +656,24 @@ class Transitions(object):
                 raise Exception(
                     'State: ' + str(state) + ' not found.'
                     ' Consider adding it with sys.states.add')
-        # convert to format friendly for edge iteration
-        nx_adj = nx.from_scipy_sparse_matrix(
-            adj, create_using=nx.DiGraph())
-        # add each edge using existing checks
-        for i, j in nx_adj.edges_iter():
-            si = adj2states[i]
-            sj = adj2states[j]
-            self.add(si, sj, attr_dict, check, **attr)
+        # one entry per edge
+        adj = sp.csr_matrix(adj, copy=True)
+        adj.sum_duplicates()
+        rows = np.flatnonzero(np.diff(adj.indptr))
+        states = [adj2states[i] for i in np.union1d(rows, adj.indices)]
+        # without existing edges from these states,
+        # the new edges need not be compared to them
+        unique = (
+            len(set(states)) == len(states) and
+            not any(self.graph.succ[adj2states[i]] for i in rows))
+        indptr = adj.indptr.tolist()
+        indices = adj.indices.tolist()
+        edges = (
+            (adj2states[i], adj2states[j])
+            for i in xrange(adj.shape[0])
+            for j in indices[indptr[i]:indptr[i + 1]])
+        self.graph.add_edges_from(edges, attr_dict, check,
+                                  unique=unique, **attr)
 
     def find(self, from_states=None, to_states=None,
              with_attr_dict=None, typed_only=False, **with_attr):
@@ -596,7 +737,9 @@ class Transitions(object):
         except:
             raise TypeError('with_attr_dict must be a dict')
         found_transitions = []
-        u_v_edges = self.graph.edges_iter(nbunch=from_states, data=True)
+        u_v_edges = self._indexed_edges(from_states, with_attr_dict)
+        if u_v_edges is None:
+            u_v_edges = self.graph.edges_iter(nbunch=from_states, data=True)
         if to_states is not None:
             u_v_edges = [(u, v, d)
                          for u, v, d in u_v_edges
@@ -617,6 +760,33 @@ class Transitions(object):
         return found_transitions
 
 
+    def _indexed_edges(self, from_states, with_attr_dict):
+        """Return labeled edges that may match, using the label index.
+
+        Unlabeled edges are included, because L{find} matches them.
+        Return C{None} if the graph should be scanned instead,
+        because the index is disabled or cannot be used for
+        C{with_attr_dict}, or C{from_states} have fewer
+        successors than there are candidate edges.
+        """
+        index = self.graph._edge_label_index
+        if not with_attr_dict or index is None:
+            return None
+        candidates = index.candidates(with_attr_dict)
+        if candidates is None:
+            return None
+        candidates.update(index.unlabeled)
+        succ = self.graph.succ
+        if from_states is not None:
+            from_states = set(self.graph.nbunch_iter(from_states))
+            n = sum(len(succ[u]) for u in from_states)
+            if n < len(candidates):
+                return None
+            candidates = [(u, v, key) for u, v, key in candidates
+                          if u in from_states]
+        return [(u, v, succ[u][v][key]) for u, v, key in candidates]
+
+
 class LabeledDiGraph(nx.MultiDiGraph):
     """Directed multi-graph with constrained labeling.
 
@@ -745,6 +915,22 @@ class LabeledDiGraph(nx.MultiDiGraph):
     @param deterministic: if True, then edge-label-deterministic
 
 
+    Compact labels
+    ==============
+
+    Label values that are strings, or frozensets of strings,
+    are shared among all nodes and edges with equal values.
+    If the attribute C{compact_labels} is C{True},
+    then set values are stored as frozensets,
+    so that, e.g., a set of atomic propositions that labels
+    many nodes is stored once.
+    This prevents changing labels in place,
+    e.g., C{g.node[1]['ap'].add('p')}, so assign a new set instead:
+
+      >>> g.compact_labels = True
+      >>> g.node[1]['ap'] = g.node[1]['ap'].union({'p'})
+
+
     Deprecated dot export
     =====================
 
@@ -790,6 +976,13 @@ class LabeledDiGraph(nx.MultiDiGraph):
         self._node_label_types = self._state_label_def
         self._edge_label_types = self._transition_label_def
 
+        # see index_labels
+        self._node_label_index = None
+        self._edge_label_index = None
+        # shared label values, see _intern_label
+        self._label_values = dict()
+        self.compact_labels = False
+
         nx.MultiDiGraph.__init__(self)
 
         self.states = States(self)
@@ -801,6 +994,16 @@ class LabeledDiGraph(nx.MultiDiGraph):
         self.dot_node_shape = {'normal': 'circle'}
         self.default_layout = 'dot'
 
+    def __setstate__(self, state):
+        """Restore from pickle, including pickles of older versions."""
+        self.__dict__.update(state)
+        # pickled before index_labels
+        self.__dict__.setdefault('_node_label_index', None)
+        self.__dict__.setdefault('_edge_label_index', None)
+        # pickled before _intern_label
+        self.__dict__.setdefault('_label_values', dict())
+        self.__dict__.setdefault('compact_labels', False)
+
     def _init_labeling(self, label_types):
         """Initialize labeling.
 
@@ -872,6 +1075,73 @@ class LabeledDiGraph(nx.MultiDiGraph):
                 return False
         return True
 
+    def index_labels(self, enable=True):
+        """Index nodes and edges by label, to speed up searches.
+
+        While enabled, the index maps each label key and value
+        to the nodes and edges with that label value,
+        so that L{States.find} and L{Transitions.find}
+        with a desired label check only the matching nodes or
+        edges, instead of all of them.
+        Labels with callable type (symbolic semantics)
+        are not indexed, so searching by them scans the graph.
+
+        The index is updated by the methods that add or
+        remove nodes and edges, but not when a label is changed
+        in place, e.g., C{G.node[n]['ap'] = value}.
+        After such changes call C{index_labels} to rebuild it.
+
+        @param enable: if C{False}, then discard the index.
+        @type enable: bool
+        """
+        if not enable:
+            self._node_label_index = None
+            self._edge_label_index = None
+            return
+        node_index = _LabelIndex(self._node_label_types)
+        for n, d in self.nodes_iter(data=True):
+            node_index.add(n, d)
+        edge_index = _LabelIndex(self._edge_label_types)
+        for u, v, key, d in self.edges_iter(data=True, keys=True):
+            edge_index.add((u, v, key), d)
+        self._node_label_index = node_index
+        self._edge_label_index = edge_index
+
+    def _unindex_node(self, n):
+        """Remove node C{n} and its edges from the label index."""
+        if self._node_label_index is not None:
+            self._node_label_index.remove(n)
+        edge_index = self._edge_label_index
+        if edge_index is None:
+            return
+        for v, keydict in self.succ[n].iteritems():
+            for key in keydict:
+                edge_index.remove((n, v, key))
+        for u, keydict in self.pred[n].iteritems():
+            for key in keydict:
+                edge_index.remove((u, n, key))
+
+    def _intern_label(self, label):
+        """Replace values in C{label} by shared equal values.
+
+        Applies to strings and frozensets of strings,
+        and if C{compact_labels}, then sets are replaced
+        by frozensets. See also "Compact labels" above.
+
+        @type label: L{TypedDict}
+        """
+        values = self._label_values
+        for k, x in label.items():
+            if self.compact_labels and isinstance(x, set):
+                x = frozenset(x)
+            elif not isinstance(x, (basestring, frozenset)):
+                continue
+            if isinstance(x, basestring) or all(
+                    type(y) is str for y in x):
+                x = values.setdefault((type(x), x), x)
+            if x is not label[k]:
+                dict.__setitem__(label, k, x)
+
     def _update_attr_dict_with_attr(self, attr_dict, attr):
         if attr_dict is None:
             attr_dict = attr
@@ -910,6 +1180,9 @@ class LabeledDiGraph(nx.MultiDiGraph):
                                      self._node_label_types,
                                      check)
         nx.MultiDiGraph.add_node(self, n, attr_dict=typed_attr)
+        self._intern_label(self.node[n])
+        if self._node_label_index is not None:
+            self._node_label_index.add(n, self.node[n])
 
     def add_nodes_from(self, nodes, check=True, **attr):
         """Create or label multiple nodes.
@@ -978,10 +1251,27 @@ class LabeledDiGraph(nx.MultiDiGraph):
         typed_attr.update(copy.deepcopy(self._edge_label_defaults))
         # type checking happens here
         typed_attr.update(attr_dict)
+        self._intern_label(typed_attr)
         logger.debug('Given: attr_dict = ' + str(attr_dict))
         logger.debug('Stored in: typed_attr = ' + str(typed_attr))
-        # may be possible to speedup using .succ
-        existing_u_v = self.get_edge_data(u, v, default={})
+        if self._is_existing_edge(u, v, attr_dict, typed_attr):
+            return
+        # self._breaks_determinism(from_state, labels)
+        self._check_for_untyped_keys(typed_attr,
+                                     self._edge_label_types,
+                                     check)
+        # the only change from nx in this clause is using TypedDict
+        logger.debug('adding edge: ' + str(u) + ' ---> ' + str(v))
+        self._store_edge(u, v, key, typed_attr)
+
+    def _is_existing_edge(self, u, v, attr_dict, typed_attr):
+        """Return C{True} and warn if edge with C{attr_dict} exists.
+
+        Raise C{Exception} if an unlabeled edge C{(u, v)} exists.
+        """
+        existing_u_v = self.succ[u].get(v)
+        if not existing_u_v:
+            return False
         if dict() in existing_u_v.values():
             msg = (
                 'Unlabeled transition: '
@@ -1000,17 +1290,12 @@ class LabeledDiGraph(nx.MultiDiGraph):
                 '\t label = ' + str(typed_attr) + '\n')
             warnings.warn(msg)
             logger.warning(msg)
-            return
-        # self._breaks_determinism(from_state, labels)
-        self._check_for_untyped_keys(typed_attr,
-                                     self._edge_label_types,
-                                     check)
-        # the only change from nx in this clause is using TypedDict
-        logger.debug('adding edge: ' + str(u) + ' ---> ' + str(v))
+            return True
+        return False
+
+    def _store_edge(self, u, v, key, typed_attr):
+        """Store edge in the adjacency dicts of C{networkx}."""
         if v in self.succ[u]:
-            msg = 'there already exist directed edges with ' +\
-                  'same end-points'
-            logger.debug(msg)
             keydict = self.adj[u][v]
             # find a unique integer key
             if key is None:
@@ -1021,15 +1306,17 @@ class LabeledDiGraph(nx.MultiDiGraph):
             datadict.update(typed_attr)
             keydict[key] = datadict
         else:
-            logger.debug('first directed edge between these nodes')
             # selfloops work this way without special treatment
             key = 0
-            keydict = {key: typed_attr}
+            datadict = typed_attr
+            keydict = {key: datadict}
             self.succ[u][v] = keydict
             self.pred[v][u] = keydict
+        if self._edge_label_index is not None:
+            self._edge_label_index.add((u, v, key), datadict)
 
     def add_edges_from(self, labeled_ebunch, attr_dict=None,
-                       check=True, **attr):
+                       check=True, unique=False, **attr):
         """Add multiple labeled edges.
 
         Overrides C{networkx.MultiDiGraph.add_edges_from},
@@ -1038,14 +1325,36 @@ class LabeledDiGraph(nx.MultiDiGraph):
         Only difference is that only 2 and 3-tuple edges allowed.
         Keys cannot be specified, because a bijection is maintained.
 
+        Same checks as L{add_edge}, but each distinct label is
+        type checked once, and edges are stored directly.
+
         @param labeled_ebunch: iterable container of:
 
             - 2-tuples: (u, v), or
             - 3-tuples: (u, v, label)
 
           See also L{remove_labeled_edges_from}.
+
+        @param unique: if C{True}, then the edges in C{labeled_ebunch}
+            are distinct and not in the graph,
+            so existing edges are not searched for duplicates.
+        @type unique: bool
         """
         attr_dict = self._update_attr_dict_with_attr(attr_dict, attr)
+        # the new labels form no reference cycles, so collecting
+        # garbage while adding them would only take time
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._add_edges_from(labeled_ebunch, attr_dict, check, unique)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _add_edges_from(self, labeled_ebunch, attr_dict, check, unique):
+        """Add labeled edges, see L{add_edges_from}."""
+        # typed labels and keys to deep copy, by label
+        typed_labels = dict()
         # process ebunch
         for e in labeled_ebunch:
             datadict = dict(attr_dict)
@@ -1064,7 +1373,110 @@ class LabeledDiGraph(nx.MultiDiGraph):
                 raise ValueError(
                     'Edge tuple %s must be a 2-, 3-, or 4-tuple .' % (e,))
             datadict.update(dd)
-            self.add_edge(u, v, key=key, attr_dict=datadict, check=check)
+            if key is not None:
+                self.add_edge(u, v, key=key, attr_dict=datadict, check=check)
+                continue
+            if u not in self.succ:
+                raise ValueError('Graph does not have node u: ' + str(u))
+            if v not in self.succ:
+                raise ValueError('Graph does not have node v: ' + str(v))
+            typed_attr = self._typed_edge_label(datadict, check, typed_labels)
+            if not unique and self._is_existing_edge(
+                    u, v, datadict, typed_attr):
+                continue
+            self._store_edge(u, v, None, typed_attr)
+
+    def _typed_edge_label(self, attr_dict, check, cache):
+        """Return new L{TypedDict} edge label, as L{add_edge}.
+
+        Labels are type checked once, and stored in C{cache},
+        then copied for each edge.
+        """
+        try:
+            # with types, because True == 1 and 0 == False
+            label = frozenset((k, type(v), v)
+                              for k, v in attr_dict.iteritems())
+            typed_attr, deep_keys = cache[label]
+        except TypeError:
+            label = None
+        except KeyError:
+            typed_attr = None
+        if label is None or typed_attr is None:
+            typed_attr = TypedDict()
+            typed_attr.set_types(self._edge_label_types)
+            typed_attr.update(copy.deepcopy(self._edge_label_defaults))
+            typed_attr.update(attr_dict)
+            self._check_for_untyped_keys(typed_attr,
+                                         self._edge_label_types,
+                                         check)
+            self._intern_label(typed_attr)
+            # mutable default values are copied for each edge
+            deep_keys = [
+                k for k in self._edge_label_defaults
+                if k not in attr_dict and not isinstance(
+                    typed_attr[k],
+                    (basestring, numbers.Number, type(None), frozenset))]
+            if label is None:
+                return typed_attr
+            cache[label] = (typed_attr, deep_keys)
+        d = TypedDict.__new__(TypedDict)
+        dict.update(d, typed_attr)
+        d.allowed_values = typed_attr.allowed_values
+        for k in deep_keys:
+            dict.__setitem__(d, k, copy.deepcopy(typed_attr[k]))
+        return d
+
+    def remove_edge(self, u, v, key=None):
+        """Remove edge, updating the label index.
+
+        Overrides C{networkx.MultiDiGraph.remove_edge},
+        see that for details.
+        """
+        edge_index = self._edge_label_index
+        if edge_index is None:
+            nx.MultiDiGraph.remove_edge(self, u, v, key=key)
+            return
+        if key is None:
+            keys = list(self.succ.get(u, dict()).get(v, ()))
+        else:
+            keys = [key]
+        nx.MultiDiGraph.remove_edge(self, u, v, key=key)
+        remaining = self.succ[u].get(v, ())
+        for key in keys:
+            if key not in remaining:
+                edge_index.remove((u, v, key))
+
+    def remove_node(self, n):
+        """Remove node and its edges, updating the label index.
+
+        Overrides C{networkx.MultiDiGraph.remove_node},
+        see that for details.
+        """
+        if n in self.succ:
+            self._unindex_node(n)
+        nx.MultiDiGraph.remove_node(self, n)
+
+    def remove_nodes_from(self, nbunch):
+        """Remove nodes and their edges, updating the label index.
+
+        Overrides C{networkx.MultiDiGraph.remove_nodes_from},
+        see that for details.
+        """
+        nbunch = list(nbunch)
+        for n in nbunch:
+            if n in self.succ:
+                self._unindex_node(n)
+        nx.MultiDiGraph.remove_nodes_from(self, nbunch)
+
+    def clear(self):
+        """Remove all nodes and edges, and empty the label index.
+
+        Overrides C{networkx.MultiDiGraph.clear}.
+        """
+        nx.MultiDiGraph.clear(self)
+        self._label_values = dict()
+        if self._node_label_index is not None:
+            self.index_labels()
 
     def remove_labeled_edge(self, u, v, attr_dict=None, **attr):
         """Remove single labeled edge.
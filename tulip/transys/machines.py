@@ -34,6 +34,7 @@ from __future__ import absolute_import
 import copy
 from pprint import pformat
 from random import choice
+import numpy as np
 from tulip.transys.labeled_graphs import LabeledDiGraph
 # inline imports:
 #
@@ -41,6 +42,8 @@ from tulip.transys.labeled_graphs import LabeledDiGraph
 
 
 _hl = 40 * '-'
+# absent port in transition label
+_missing = object()
 # port type
 pure = {'present', 'absent'}
 
@@ -420,6 +423,15 @@ class MealyMachine(Transducer):
         # will point to selected values of self._transition_label_def
         self.dot_node_shape = {'normal': 'ellipse'}
         self.default_export_fname = 'mealy'
+        # transitions by input valuation, see _reactions
+        self._reaction_index = dict()
+        self._reaction_ports = tuple()
+
+    def __setstate__(self, state):
+        Transducer.__setstate__(self, state)
+        # pickled before _reactions
+        self.__dict__.setdefault('_reaction_index', dict())
+        self.__dict__.setdefault('_reaction_ports', tuple())
 
     def __str__(self):
         """Get informal string representation."""
@@ -523,13 +535,18 @@ class MealyMachine(Transducer):
         """
         if lazy:
             restricted_inputs = set(self.inputs).intersection(inputs.keys())
+            index = None
         else:
             restricted_inputs = self.inputs
-        # match only inputs (explicit valuations, not symbolic)
-        enabled_trans = [
-            (i, j, d)
-            for i, j, d in self.edges_iter([from_state], data=True)
-            if project_dict(d, restricted_inputs) == inputs]
+            index = self._reactions(from_state)
+        if index is None:
+            # match only inputs (explicit valuations, not symbolic)
+            enabled_trans = [
+                (i, j, d)
+                for i, j, d in self.edges_iter([from_state], data=True)
+                if project_dict(d, restricted_inputs) == inputs]
+        else:
+            enabled_trans = index.get(self._reaction_key(inputs), [])
 
         if len(enabled_trans) == 0:
             some_possibilities = []
@@ -565,6 +582,80 @@ class MealyMachine(Transducer):
         outputs = project_dict(attr_dict, self.outputs)
         return (next_state, outputs)
 
+    def _reaction_key(self, inputs):
+        """Return key of C{inputs} in the index of L{_reactions}.
+
+        Return C{None} if C{inputs} has keys that are not inputs.
+        """
+        key = tuple(inputs.get(p, _missing) for p in self._reaction_ports)
+        if len(inputs) != len(key) - key.count(_missing):
+            return None
+        return key
+
+    def _reactions(self, from_state):
+        """Return transitions from C{from_state} indexed by inputs.
+
+        The index maps the tuple of input values of each transition
+        to the list of transitions C{(from_state, to_state, attr_dict)}
+        that have those inputs. It is created on first use,
+        and removed when transitions from C{from_state} change.
+        Labels changed in place, as C{G[i][j][key]['x'] = value},
+        are not noticed, so remove and add the transition instead.
+
+        @return: index, or C{None} if some input value is not hashable
+        @rtype: C{dict} or C{None}
+        """
+        ports = tuple(self.inputs)
+        if ports != self._reaction_ports:
+            self._reaction_index = dict()
+            self._reaction_ports = ports
+        try:
+            return self._reaction_index[from_state]
+        except KeyError:
+            pass
+        index = dict()
+        try:
+            for i, j, d in self.edges_iter([from_state], data=True):
+                key = tuple(d.get(p, _missing) for p in ports)
+                index.setdefault(key, list()).append((i, j, d))
+        except TypeError:
+            index = None
+        self._reaction_index[from_state] = index
+        return index
+
+    def add_edge(self, u, v, key=None, attr_dict=None, check=True, **attr):
+        """Add transition, see L{LabeledDiGraph.add_edge}."""
+        self._reaction_index.pop(u, None)
+        Transducer.add_edge(self, u, v, key=key, attr_dict=attr_dict,
+                            check=check, **attr)
+
+    def add_edges_from(self, labeled_ebunch, attr_dict=None,
+                       check=True, unique=False, **attr):
+        """Add transitions, see L{LabeledDiGraph.add_edges_from}."""
+        self._reaction_index.clear()
+        Transducer.add_edges_from(self, labeled_ebunch, attr_dict=attr_dict,
+                                  check=check, unique=unique, **attr)
+
+    def remove_edge(self, u, v, key=None):
+        """Remove transition, see C{networkx.MultiDiGraph.remove_edge}."""
+        self._reaction_index.pop(u, None)
+        Transducer.remove_edge(self, u, v, key=key)
+
+    def remove_node(self, n):
+        """Remove state, see C{networkx.MultiDiGraph.remove_node}."""
+        self._reaction_index.clear()
+        Transducer.remove_node(self, n)
+
+    def remove_nodes_from(self, nbunch):
+        """Remove states, see C{networkx.MultiDiGraph.remove_nodes_from}."""
+        self._reaction_index.clear()
+        Transducer.remove_nodes_from(self, nbunch)
+
+    def clear(self):
+        """Remove all states and transitions."""
+        self._reaction_index.clear()
+        Transducer.clear(self)
+
     def reactionpart(self, from_state, inputs):
         """Wraps reaction() with lazy=True
         """
@@ -585,6 +676,218 @@ class MealyMachine(Transducer):
                               input_sequences=input_sequences)
 
 
+class CompactMealy(object):
+    """Mealy machine stored in arrays, as obtained from a strategy.
+
+    State C{k} is named C{states[k]}.
+    The successors of state C{k} are
+    C{indices[indptr[k]:indptr[k + 1]]},
+    as in C{scipy.sparse.csr_matrix}.
+
+    Transition C{e} (an index into C{indices}) is labeled with the
+    valuation C{values[labels[e]]}, with one column per port in
+    C{ports}. If C{labels} is C{None}, as for machines obtained
+    from a strategy, then each transition is labeled with the
+    valuation of its target state, i.e., C{labels = indices}.
+    Values of ports with string values are stored as
+    indices into their domain, given as a list in C{str_domains}.
+
+    Methods L{reaction}, L{transitions} and L{successors} use
+    the state names and port valuations of L{MealyMachine}.
+    Call L{to_mealy} to obtain a L{MealyMachine}.
+
+    See Also
+    ========
+    L{synth.strategy2mealy}, L{dumpsmach.load_binary}
+    """
+    def __init__(self, states, initial, ports, values, indptr, indices,
+                 inputs, outputs, str_domains=None, labels=None):
+        """Create machine from arrays.
+
+        @param states: name of each state
+        @type states: list
+        @param initial: initial states
+        @type initial: list
+        @param ports: port of each column of C{values}
+        @type ports: list of str
+        @type values: 2d array of int
+        @type indptr, indices: 1d arrays of int
+        @param inputs, outputs: port domains,
+            as in L{MealyMachine}
+        @type inputs, outputs: dict
+        @param str_domains: domain of each port with string values
+        @type str_domains: dict of lists
+        @param labels: row of C{values} for each transition
+        @type labels: 1d array of int, or C{None}
+        """
+        self.states = states
+        self.initial = initial
+        self.ports = ports
+        self.values = values
+        self.indptr = indptr
+        self.indices = indices
+        self.inputs = inputs
+        self.outputs = outputs
+        if str_domains is None:
+            str_domains = dict()
+        self.str_domains = str_domains
+        self.labels = labels
+        self._index = None
+
+    def __len__(self):
+        return len(self.states)
+
+    def __str__(self):
+        return ('CompactMealy with {n} states, {m} transitions\n'
+                'Input Ports:\n\t(name : type)\n{i}'
+                'Output Ports:\n\t(name : type)\n{o}').format(
+                    n=len(self), m=len(self.indices),
+                    i=_print_ports(self.inputs),
+                    o=_print_ports(self.outputs))
+
+    def index(self, state):
+        """Return index of C{state} in C{states}."""
+        if self._index is None:
+            self._index = dict((u, k) for k, u in enumerate(self.states))
+        try:
+            return self._index[state]
+        except KeyError:
+            raise Exception('state {s} not in machine'.format(s=state))
+
+    def successors(self, state):
+        """Return successors of C{state}."""
+        k = self.index(state)
+        return [self.states[j] for j in
+                self.indices[self.indptr[k]:self.indptr[k + 1]]]
+
+    def _labels(self):
+        """Return row of C{values} for each transition."""
+        if self.labels is None:
+            return self.indices
+        return self.labels
+
+    def label(self, k):
+        """Return valuation of ports in row C{k} of C{values}."""
+        label = dict()
+        for port, v in zip(self.ports, self.values[k].tolist()):
+            if port in self.str_domains:
+                v = self.str_domains[port][v]
+            label[port] = v
+        return label
+
+    def transitions(self, data=False):
+        """Iterate over transitions, as C{(from, to)}, or
+        C{(from, to, label)} if C{data}."""
+        labels = self._labels()
+        for k, u in enumerate(self.states):
+            for e in xrange(self.indptr[k], self.indptr[k + 1]):
+                j = self.indices[e]
+                if data:
+                    yield (u, self.states[j], self.label(labels[e]))
+                else:
+                    yield (u, self.states[j])
+
+    def _encode(self, port, value):
+        """Return integer code of C{value} of C{port}."""
+        if port in self.str_domains:
+            return self.str_domains[port].index(value)
+        return value
+
+    def reaction(self, from_state, inputs):
+        """Return next state and output, when reacting to given inputs.
+
+        Same as L{MealyMachine.reaction}, without C{lazy}.
+
+        @return: (next_state, outputs)
+        """
+        k = self.index(from_state)
+        edges = np.arange(self.indptr[k], self.indptr[k + 1])
+        rows = self._labels()[edges]
+        cols = [self.ports.index(p) for p in self.inputs]
+        try:
+            codes = [self._encode(p, inputs[p]) for p in self.inputs]
+        except (KeyError, ValueError):
+            codes = None
+        if codes is None or len(inputs) != len(self.inputs):
+            enabled = edges[:0]
+        else:
+            enabled = edges[
+                (self.values[rows][:, cols] == codes).all(axis=1)]
+        if len(enabled) == 0:
+            if len(edges) == 0:
+                raise Exception(
+                    'state {from_state} is a dead-end. '
+                    'There are no possible inputs from '
+                    'it.'.format(from_state=from_state))
+            some_possibilities = []
+            for r in rows:
+                if len(some_possibilities) >= 5:
+                    break
+                possible_inputs = project_dict(self.label(r), self.inputs)
+                if possible_inputs not in some_possibilities:
+                    some_possibilities.append(possible_inputs)
+            raise Exception(
+                'not a valid input, '
+                'some possible inputs include: '
+                '{t}'.format(t=some_possibilities))
+        labels = self._labels()
+        if len(enabled) > 1:
+            raise Exception(
+                'must be input-deterministic, '
+                'found enabled transitions: '
+                '{t}'.format(t=[(from_state, self.states[self.indices[e]],
+                                 self.label(labels[e]))
+                                for e in enabled]))
+        e = enabled[0]
+        outputs = project_dict(self.label(labels[e]), self.outputs)
+        return (self.states[self.indices[e]], outputs)
+
+    def remove_deadends(self):
+        """Recursively delete states with no outgoing transitions.
+
+        Same as L{LabeledDiGraph.remove_deadends}.
+        """
+        n = len(self.states)
+        src = np.repeat(np.arange(n), np.diff(self.indptr))
+        live = np.ones(n, dtype=bool)
+        while True:
+            e = live[self.indices]
+            degree = np.bincount(src[e], minlength=n)
+            dead = live & (degree == 0)
+            if not dead.any():
+                break
+            live &= ~dead
+        if live.all():
+            return
+        # before the states change, because self.index uses them
+        self.initial = [u for u in self.initial if live[self.index(u)]]
+        keep = np.flatnonzero(live)
+        new = -np.ones(n, dtype=self.indices.dtype)
+        new[keep] = np.arange(len(keep))
+        e = live[src] & live[self.indices]
+        if self.labels is None:
+            self.values = self.values[keep]
+        else:
+            self.labels = self.labels[e]
+        self.indices = new[self.indices[e]]
+        self.indptr = np.zeros(len(keep) + 1, dtype=self.indptr.dtype)
+        np.cumsum(np.bincount(new[src[e]], minlength=len(keep)),
+                  out=self.indptr[1:])
+        self.states = [self.states[k] for k in keep]
+        self._index = None
+
+    def to_mealy(self):
+        """Return machine as L{MealyMachine}."""
+        mach = MealyMachine()
+        mach.add_inputs(self.inputs)
+        mach.add_outputs(self.outputs)
+        mach.states.add_from(self.states)
+        mach.states.initial.add_from(self.initial)
+        for u, v, d in self.transitions(data=True):
+            mach.transitions.add(u, v, **d)
+        return mach
+
+
 def guided_run(mealy, from_state=None, input_sequences=None):
     """Run deterministic machine reacting to given inputs.
 
@@ -659,7 +962,12 @@ def random_run(mealy, from_state=None, N=10):
     states_seq = []
     output_seqs = {k: list() for k in mealy.outputs}
     for i in xrange(N):
-        trans = mealy.transitions.find([state])
+        index = mealy._reactions(state)
+        if index is None:
+            trans = mealy.transitions.find([state])
+        else:
+            # choose input, then transition
+            trans = choice(index.values())
         # choose next transition
         selected_trans = choice(list(trans))
         _, new_state, attr_dict = selected_trans
@@ -746,6 +746,9 @@ class TypedDict(dict):
     # credits for debugging this go here:
     #   http://stackoverflow.com/questions/2060972/
 
+    # no instance __dict__, because every graph label is a TypedDict
+    __slots__ = ('allowed_values',)
+
     def __init__(self, *args, **kwargs):
         self.update(*args, **kwargs)
         self.allowed_values = dict()
@@ -775,6 +778,12 @@ class TypedDict(dict):
     def __str__(self):
         return 'TypedDict(' + dict.__str__(self) + ')'
 
+    def __getstate__(self):
+        return {'allowed_values': self.allowed_values}
+
+    def __setstate__(self, state):
+        self.allowed_values = state['allowed_values']
+
     def update(self, *args, **kwargs):
         if args:
             if len(args) > 1:
@@ -31,7 +31,9 @@
 # SUCH DAMAGE.
 """Products between automata and transition systems"""
 from __future__ import absolute_import
+from collections import deque
 import logging
+import time
 import warnings
 from tulip.transys import transys
 from tulip.transys import automata
@@ -142,20 +144,364 @@ class OnTheFlyProductAutomaton(automata.BuchiAutomaton):
 
         return new_sqs
 
-    def add_all_states(self):
-        """Iterate L{add_successors} until all states are added.
+    def add_all_states(self, order='bfs', max_states=None):
+        """Add all reachable states, and the transitions among them.
 
-        In other words until the state space
-        reaches a fixed point.
+        Starting from the current states, explores the product
+        with L{ImplicitProduct.search}, which looks up the
+        successors of each product state in tables,
+        instead of searching the transitions of C{ba} and C{ts}
+        as L{add_successors} does.
+
+        @param order: see L{ImplicitProduct.search}
+
+        @param max_states: stop when the product would exceed
+            this many states, see L{ImplicitProduct.search}.
+        @type max_states: int or C{None} (no limit)
+
+        @return: C{False} if stopped because of C{max_states},
+            otherwise C{True}.
+        @rtype: bool
+        """
+        ts = self.ts
+        product = ImplicitProduct(ts, self.ba)
+        states = self.states
+
+        def visit(sq, next_sqs):
+            for next_sq in next_sqs:
+                if next_sq not in states:
+                    states.add(next_sq)
+                    if product.is_accepting(next_sq):
+                        states.accepting.add(next_sq)
+                letter = ts.node[next_sq[0]]['ap']
+                self.transitions.add(sq, next_sq, letter=letter)
+
+        reached, complete = product.search(
+            order=order, max_states=max_states,
+            visit=visit, start=list(states))
+        return complete
+
+
+class ImplicitProduct(object):
+    """Synchronous product TS * BA, with successors found on demand.
+
+    Product states are pairs C{(s, q)} of TS and BA states,
+    as in L{OnTheFlyProductAutomaton}, but the product is
+    not stored as a graph.
+    Instead, a table maps each letter to the successors of
+    each BA state, and the AP label of each TS state
+    is converted to a letter once, so the successors of
+    a product state are found in time proportional
+    to their number.
+
+    Use L{search} to explore the reachable product states.
+
+    @param ts: with an AP label C{'ap'} for each state
+    @type ts: L{transys.FiniteTransitionSystem}
+
+    @param ba: atomic proposition-based
+    @type ba: L{automata.BuchiAutomaton}
+    """
+
+    def __init__(self, ts, ba):
+        if not ba.atomic_proposition_based:
+            raise Exception(
+                'Buchi Automaton must be Atomic Proposition-based,'
+                ' otherwise the synchronous product is not well-defined.')
+        self.ts = ts
+        self.ba = ba
+        self._accepting = set(ba.states.accepting)
+        # BA state -> (letter -> BA successors, successors by True)
+        self._ba_succ = _letter_successors(ba)
+        # TS state -> letter
+        self._letters = dict()
+
+    def _letter(self, s):
+        """Return the AP label of TS state C{s} as C{frozenset}."""
+        try:
+            return self._letters[s]
+        except KeyError:
+            pass
+        try:
+            ap = self.ts.node[s]['ap']
+        except KeyError:
+            raise Exception(
+                'No AP label for FTS state: ' + str(s) +
+                '\n Did you forget labeing it ?')
+        letter = frozenset(ap)
+        self._letters[s] = letter
+        return letter
+
+    def _enabled(self, q, s):
+        """Return successors of BA state C{q} when reading C{s}."""
+        table, true_succ = self._ba_succ[q]
+        return table.get(self._letter(s), true_succ)
+
+    def initial(self):
+        """Return list of initial product states."""
+        r = list()
+        for s0 in self.ts.states.initial:
+            for q0 in self.ba.states.initial:
+                r.extend((s0, q) for q in self._enabled(q0, s0))
+        return _unique(r)
+
+    def successors(self, sq):
+        """Return list of successors of product state C{sq}."""
+        s, q = sq
+        return [(next_s, next_q)
+                for next_s in self.ts.succ[s]
+                for next_q in self._enabled(q, next_s)]
+
+    def is_accepting(self, sq):
+        """Return C{True} if C{sq} projects on an accepting BA state."""
+        return sq[1] in self._accepting
+
+    def search(self, order='dfs', max_states=None, visit=None,
+               start=None):
+        """Find the product states reachable from C{start}.
+
+        States are added to a worklist when first reached,
+        and expanded when removed from it.
+
+        @param order: remove from the worklist
+            the state added last (C{'dfs'}) or first (C{'bfs'})
+        @type order: C{'dfs'} or C{'bfs'}
+
+        @param max_states: stop before reaching more states
+        @type max_states: int or C{None} (no limit)
+
+        @param visit: called as C{visit(sq, next_sqs)}
+            after each state C{sq} is expanded,
+            with the list C{next_sqs} of its successors.
+            If it returns C{True}, then the search stops.
+        @type visit: callable or C{None}
+
+        @param start: states to search from
+        @type start: iterable of product states, or
+            C{None} for the initial states
+
+        @return: C{(reached, complete)}, where C{reached} is the set
+            of states reached, and C{complete} is C{False} if the
+            search was stopped by C{visit} or C{max_states}.
+        @rtype: C{(set, bool)}
         """
-        Q = set(self.states)
-        while Q:
-            Qnew = set()
-            for sq in Q:
-                (s, q) = sq
-                new = self.add_successors(s, q)
-                Qnew.update(new)
-            Q = Qnew
+        if order == 'dfs':
+            pop = deque.pop
+        elif order == 'bfs':
+            pop = deque.popleft
+        else:
+            raise ValueError(
+                'order must be "dfs" or "bfs", got: ' + str(order))
+        if start is None:
+            start = self.initial()
+        reached = set()
+        worklist = deque()
+
+        def reach(sqs):
+            """Add new states to worklist, return False if over budget."""
+            for sq in sqs:
+                if sq in reached:
+                    continue
+                if max_states is not None and len(reached) >= max_states:
+                    logger.warning('product search stopped at ' +
+                                   str(max_states) + ' states')
+                    return False
+                reached.add(sq)
+                worklist.append(sq)
+            return True
+
+        if not reach(start):
+            return reached, False
+        while worklist:
+            sq = pop(worklist)
+            next_sqs = self.successors(sq)
+            if not reach(next_sqs):
+                return reached, False
+            if visit is not None and visit(sq, next_sqs):
+                return reached, False
+        return reached, True
+
+
+def _letter_successors(ba):
+    """Return tables of BA successors by letter.
+
+    @return: C{dict} that maps each BA state C{q} to a pair
+        C{(table, true_succ)}, where C{true_succ} lists the
+        successors of C{q} enabled by any letter, i.e., with
+        the letter C{{True}}, and C{table} maps each other letter
+        of a transition from C{q} to the successors of C{q}
+        enabled by it, including C{true_succ}.
+    @rtype: C{dict} of C{(dict, list)}
+    """
+    true_letter = frozenset([True])
+    tables = dict()
+    for q in ba:
+        table = dict()
+        true_succ = list()
+        for _, next_q, d in ba.edges_iter(q, data=True):
+            # unlabeled transitions are enabled by any letter,
+            # as in Transitions.find
+            if not d or frozenset(d['letter']) == true_letter:
+                true_succ.append(next_q)
+            else:
+                letter = frozenset(d['letter'])
+                table.setdefault(letter, list()).append(next_q)
+        true_succ = _unique(true_succ)
+        for letter, succ in table.iteritems():
+            table[letter] = _unique(succ + true_succ)
+        tables[q] = (table, true_succ)
+    return tables
+
+
+def _unique(x):
+    """Return list of the items of C{x} in order, without repetitions."""
+    seen = set()
+    r = list()
+    for y in x:
+        if y not in seen:
+            seen.add(y)
+            r.append(y)
+    return r
+
+
+def find_accepting_lasso(ts, ba, max_states=None):
+    """Search for an accepting run of the product TS * BA.
+
+    Uses nested depth-first search over the L{ImplicitProduct},
+    so product states are generated as needed, and the search
+    stops at the first accepting cycle found.
+    The outer search visits the reachable product states.
+    When it backtracks from an accepting state,
+    the inner search looks for a path from that state back to
+    a state on the stack of the outer search.
+    States visited by inner searches are not revisited.
+
+    An accepting run exists if and only if some behavior of C{ts}
+    is accepted by C{ba}. So if C{ba} accepts the
+    violations of a property, then the run is a counterexample.
+
+    Reference
+    =========
+    Courcoubetis, Vardi, Wolper, Yannakakis
+        "Memory-efficient algorithms for the verification of
+        temporal properties"
+        Formal Methods in System Design, 1(2-3), pp. 275--288, 1992
+
+    Schwoon, Esparza
+        "A note on on-the-fly verification algorithms"
+        TACAS, pp. 174--190, 2005
+
+    @param max_states: stop when the outer search would visit
+        more product states. Then no lasso is returned,
+        and C{stats['complete']} is C{False}.
+    @type max_states: int or C{None} (no limit)
+
+    @return: C{(lasso, stats)}, where:
+        - C{lasso} is C{None} if no accepting run was found,
+          otherwise C{(prefix, cycle)}, lists of C{ts} states,
+          such that the run visits C{prefix}, then C{cycle}
+          repeatedly. C{prefix} may be empty.
+          The first state is initial, and each state is
+          followed by a successor in C{ts}, including the last
+          state of C{cycle} by the first one.
+        - C{stats} is a C{dict} with keys:
+            - C{'states'}: product states visited
+            - C{'cycle_states'}: of those, visited by inner searches
+            - C{'transitions'}: product transitions traversed
+            - C{'time'}: wall time in seconds
+            - C{'complete'}: C{False} if stopped by C{max_states}
+    @rtype: C{(tuple or None, dict)}
+    """
+    start_time = time.time()
+    product = ImplicitProduct(ts, ba)
+    stats = dict(states=0, cycle_states=0, transitions=0, complete=True)
+    visited = set()
+    flagged = set()
+    on_stack = set()
+    # outer stack of (state, iterator of successors)
+    stack = list()
+    lasso = None
+
+    def push(sq):
+        """Add C{sq} to the outer stack, return False if over budget."""
+        if max_states is not None and len(visited) >= max_states:
+            logger.warning('emptiness check stopped at ' +
+                           str(max_states) + ' states')
+            stats['complete'] = False
+            return False
+        visited.add(sq)
+        on_stack.add(sq)
+        stack.append((sq, iter(product.successors(sq))))
+        return True
+
+    for sq0 in product.initial():
+        if sq0 in visited:
+            continue
+        if not push(sq0):
+            break
+        while stack:
+            sq, succ = stack[-1]
+            next_sq = next(succ, None)
+            if next_sq is not None:
+                stats['transitions'] += 1
+                if next_sq not in visited and not push(next_sq):
+                    break
+                continue
+            # backtrack
+            if product.is_accepting(sq):
+                r = _find_cycle(product, sq, on_stack, flagged, stats)
+                if r is not None:
+                    lasso = _lasso(stack, *r)
+                    break
+            stack.pop()
+            on_stack.remove(sq)
+        if lasso is not None or not stats['complete']:
+            break
+    stats['states'] = len(visited)
+    stats['cycle_states'] = len(flagged)
+    stats['time'] = time.time() - start_time
+    logger.info('emptiness check: ' + str(stats))
+    return lasso, stats
+
+
+def _find_cycle(product, seed, on_stack, flagged, stats):
+    """Return path from C{seed} to a state on the outer stack.
+
+    Inner search of L{find_accepting_lasso}.
+
+    @return: C{(path, target)}, where C{path} starts at C{seed},
+        and C{target} is a successor of the last state in C{path},
+        and is on the outer stack. If no state on the outer stack
+        is reachable, then C{None}.
+    """
+    flagged.add(seed)
+    path = [(seed, iter(product.successors(seed)))]
+    while path:
+        sq, succ = path[-1]
+        for next_sq in succ:
+            stats['transitions'] += 1
+            if next_sq in on_stack:
+                return [x for x, _ in path], next_sq
+            if next_sq not in flagged:
+                flagged.add(next_sq)
+                path.append((next_sq, iter(product.successors(next_sq))))
+                break
+        else:
+            path.pop()
+    return None
+
+
+def _lasso(stack, path, target):
+    """Return TS states of the lasso closed by C{path} at C{target}.
+
+    See L{find_accepting_lasso}.
+    """
+    outer = [sq for sq, _ in stack]
+    i = outer.index(target)
+    prefix = outer[:i]
+    # path starts at the top of the outer stack
+    cycle = outer[i:] + path[1:]
+    return ([s for s, q in prefix], [s for s, q in cycle])
 
 
 def ts_ba_sync_prod(transition_system, buchi_automaton):